@@ -0,0 +1,52 @@
+from datetime import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Min
+from django.utils import timezone
+
+from analytics.services import rollup_daily_stats
+from subscribers.models import Subscriber
+
+
+class Command(BaseCommand):
+    """
+    Counts statistics of bots for old days, run it once before
+    ANALYTICS_USE_ROLLUP is turned on. By default counts all days
+    since the first subscriber.
+
+    python manage.py backfill_daily_stats --date-from 2020-09-01
+    """
+    help = "Fills DailyBotStats for days in range"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--date-from", type=self.parse_date,
+                            help=f"format {settings.DATE_FORMAT}")
+        parser.add_argument("--date-to", type=self.parse_date,
+                            help="today by default")
+        parser.add_argument("--days-per-step", type=int, default=31)
+
+    @staticmethod
+    def parse_date(value: str):
+        try:
+            return datetime.strptime(value, settings.DATE_FORMAT).date()
+        except ValueError:
+            raise CommandError(f"Wrong date {value}")
+
+    def handle(self, *args, **options):
+        date_to = options["date_to"] or timezone.localdate()
+        date_from = options["date_from"]
+        if not date_from:
+            first = Subscriber.objects.aggregate(Min("created"))
+            if not first["created__min"]:
+                self.stdout.write("There are no subscribers")
+                return
+            date_from = timezone.localtime(first["created__min"]).date()
+
+        step = timezone.timedelta(days=options["days_per_step"])
+        while date_from <= date_to:
+            step_to = min(date_from + step - timezone.timedelta(days=1),
+                          date_to)
+            number = rollup_daily_stats(date_from, step_to)
+            self.stdout.write(f"{date_from} - {step_to}: {number} saved")
+            date_from = step_to + timezone.timedelta(days=1)
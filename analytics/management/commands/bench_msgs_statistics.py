@@ -0,0 +1,91 @@
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from analytics.services import get_msgs_statistics
+from bots_management.benchmarks import measure, summarize
+from bots_management.services import get_bot_to_channel
+from keyboards.models import Button
+from subscribers.models import Message, Subscriber
+
+
+class Command(BaseCommand):
+    """
+    Measures statistics of messages by button texts, while the bot has
+    more and more messages. Messages are created for fake subscribers
+    and deleted after the benchmark (unless --keep). All of them are
+    created now, so every query counts all of them (the worst case).
+    Creating 50M rows takes long, run it on a separate database.
+
+    python manage.py bench_msgs_statistics <slug> --rows 1000000 10000000
+    """
+    help = "Measures get_msgs_statistics on millions of messages"
+    user_id_prefix = "bench_stats_"
+    message_token = "bench_stats"
+    batch_size = 10000
+
+    def add_arguments(self, parser):
+        parser.add_argument("slug")
+        parser.add_argument("--messenger", default="viber",
+                            choices=["telegram", "viber"])
+        parser.add_argument("--rows", type=int, nargs="+",
+                            default=[1000000, 10000000, 50000000])
+        parser.add_argument("--subscribers", type=int, default=1000)
+        parser.add_argument("-n", "--iterations", type=int, default=10)
+        parser.add_argument("--keep", action="store_true",
+                            help="don't delete created messages")
+
+    def handle(self, *args, **options):
+        bot = get_bot_to_channel(options["slug"], options["messenger"])
+        if not bot:
+            raise CommandError(f"Channel {options['slug']} doesn't have "
+                               f"{options['messenger']} bot")
+        texts = list(Button.objects.filter(
+            keyboard__channel=bot.channel, action__is_menu_action=False
+        ).values_list("text", flat=True).distinct())
+        # most of messages aren't texts of buttons
+        texts += [f"other text {i}" for i in range(len(texts) * 3 + 1)]
+
+        Subscriber.objects.bulk_create([
+            Subscriber(user_id=f"{self.user_id_prefix}{i}",
+                       messengers_bot=bot)
+            for i in range(options["subscribers"])
+        ], ignore_conflicts=True)
+        senders = list(Subscriber.objects.filter(
+            messengers_bot=bot, user_id__startswith=self.user_id_prefix
+        ).values_list("id", flat=True))
+
+        date_to = timezone.now() + timezone.timedelta(days=1)
+        date_from = date_to - timezone.timedelta(days=30)
+        created = 0
+        try:
+            for rows in sorted(options["rows"]):
+                self.create_messages(created, rows, senders, texts)
+                created = rows
+                durations = measure(
+                    lambda i: get_msgs_statistics(date_from, date_to,
+                                                  "desc", bot),
+                    options["iterations"]
+                )
+                self.stdout.write(summarize(f"{rows} messages", durations))
+        finally:
+            if not options["keep"]:
+                Message.objects.filter(
+                    sender_id__in=senders, message_token=self.message_token
+                ).delete()
+                Subscriber.objects.filter(pk__in=senders).delete()
+
+    def create_messages(self, start: int, end: int,
+                        senders: list, texts: list) -> None:
+        messages = (
+            Message(sender_id=senders[i % len(senders)],
+                    text=texts[i % len(texts)],
+                    message_token=self.message_token)
+            for i in range(start, end)
+        )
+        while True:
+            batch = list(islice(messages, self.batch_size))
+            if not batch:
+                break
+            Message.objects.bulk_create(batch)
@@ -0,0 +1,101 @@
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.db import models
+from django.urls import reverse
+
+from bots_management.models import Bot, Channel
+
+
+class DailyBotStats(models.Model):
+    """
+    Statistics of a bot for one day.
+    Counted by celery beat task update_daily_stats, old days are filled
+    by backfill_daily_stats command.
+    """
+    bot = models.ForeignKey(
+        to=Bot, on_delete=models.CASCADE,
+        verbose_name="Бот", related_name="daily_stats"
+    )
+    date = models.DateField("Дата")
+    messages = models.PositiveIntegerField("Повідомлення", default=0)
+    new_subscribers = models.PositiveIntegerField("Нові підписники",
+                                                  default=0)
+    unsubscribed = models.PositiveIntegerField("Відписалися", default=0)
+    subscribers = models.PositiveIntegerField("Всього підписників",
+                                              default=0)
+    updated = models.DateTimeField("Оновлено", auto_now=True)
+
+    class Meta:
+        verbose_name = "Статистика бота за день"
+        verbose_name_plural = "Статистика ботів за дні"
+        # also index for range of dates of bot
+        unique_together = [["bot", "date"]]
+
+    def __str__(self) -> str:
+        return f"{self.bot} {self.date}"
+
+
+class PrivateMediaStorage(FileSystemStorage):
+    """
+    Storage of files in PRIVATE_MEDIA_ROOT, they don't have urls
+    and are given only by views, that check permissions.
+    """
+
+    def url(self, name):
+        raise ValueError(f"{name} is private, it doesn't have url")
+
+
+def get_private_storage() -> PrivateMediaStorage:
+    return PrivateMediaStorage(location=settings.PRIVATE_MEDIA_ROOT,
+                               base_url=None)
+
+
+def get_export_path(instance, filename: str) -> str:
+    return f"analytics/exports/{instance.channel_id}/{filename}"
+
+
+class AnalyticsExport(models.Model):
+    """
+    File with analytics of a channel, built by celery task.
+    """
+    GENERAL = "general"
+    MESSAGES = "messages"
+    KINDS = (
+        (GENERAL, "Загальна аналітика (xlsx)"),
+        (MESSAGES, "Повідомлення (csv)"),
+    )
+    PENDING = "pending"
+    DONE = "done"
+    FAILED = "failed"
+    STATUSES = (
+        (PENDING, "Створюється"),
+        (DONE, "Готовий"),
+        (FAILED, "Помилка"),
+    )
+    channel = models.ForeignKey(
+        to=Channel, on_delete=models.CASCADE,
+        verbose_name="Канал", related_name="analytics_exports"
+    )
+    kind = models.CharField("Тип", max_length=10, choices=KINDS)
+    # date_from, date_to (DATE_FORMAT), analytics_type
+    params = models.JSONField("Параметри", default=dict)
+    status = models.CharField("Статус", max_length=10,
+                              choices=STATUSES, default=PENDING)
+    file = models.FileField("Файл", upload_to=get_export_path,
+                            storage=get_private_storage, blank=True)
+    created = models.DateTimeField("Створений", auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Експорт аналітики"
+        verbose_name_plural = "Експорти аналітики"
+
+    def __str__(self) -> str:
+        return f"{self.get_kind_display()} {self.channel} {self.created}"
+
+    def get_absolute_url(self) -> str:
+        return reverse("bots-management:analytics:export-detail",
+                       kwargs={"slug": self.channel.slug, "pk": self.pk})
+
+    def get_download_url(self) -> str:
+        return reverse("bots-management:analytics:export-download",
+                       kwargs={"slug": self.channel.slug, "pk": self.pk})
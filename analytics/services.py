@@ -1,88 +1,296 @@
+import csv
+import io
 import logging
-from datetime import datetime
+import tempfile
+from datetime import date, datetime, time, timedelta
 from typing import Generator
 import xlsxwriter
 
 from django.conf import settings
-from django.db.models import Count, QuerySet
+from django.core.files import File
+from django.db import connection, transaction
+from django.db.models import Count, F, Q, Window
+from django.db.models.functions import TruncDate
 from django.utils import timezone
 
-from bots_management.models import Bot
-from keyboards.models import Button
+from bots_management.models import Bot, Channel
+from keyboards.models import Action, Button, Keyboard
 from subscribers.models import Message, Subscriber
+from .models import DailyBotStats, AnalyticsExport
 
 logger = logging.getLogger(__name__)
 
 
-def count_msgs_in_bot(date: datetime, bot: Bot) -> int:
+def get_day_range(date: datetime) -> tuple:
     """
-    Returns number of messages for a certain date in certain bot.
+    Returns start of the day of date and start of the next day.
+    Filter by range instead of __date, so indexes on the field are used.
     """
-    result = Message.objects.filter(
-        sender__messengers_bot=bot, created__date=date.date()
-    ).aggregate(Count("id"))
-    return result["id__count"]
+    day = date.date()
+    return (
+        timezone.make_aware(datetime.combine(day, time.min)),
+        timezone.make_aware(datetime.combine(day + timedelta(days=1),
+                                             time.min)),
+    )
 
 
-def count_subs_in_bot_in_date(date: datetime, bot: Bot) -> int:
-    """
-    Returns number of subscribers for a certain date in certain bot.
-    """
-    result = Subscriber.objects.filter(
-        messengers_bot=bot, created__date=date.date(), is_active=True
-    ).aggregate(Count("id"))
-    return result["id__count"]
+# statistics of a bot for a day, fields of DailyBotStats
+DAILY_FIELDS = ("messages", "new_subscribers", "unsubscribed", "subscribers")
 
 
-def count_inactive_subs_in_bot_in_date(date: datetime, bot: Bot) -> int:
+def get_daily_series(bots: list, date_from: date, date_to: date,
+                     start_totals: dict = None) -> dict:
     """
-    Returns number of inactive subscribers for a certain date in certain bot.
+    Counts statistics of bots for each day in [date_from; date_to].
+    Each statistic is counted for all bots and days by one query,
+    so number of queries doesn't depend on the period.
+    start_totals - {bot id: (subscribers at the end of day before
+    date_from, when they were counted)}, total subscribers of these bots
+    are continued from it, instead of counting all subscribers.
+    Returns {(bot id, date): {field of DAILY_FIELDS: number}},
+    days without data have zeros.
     """
-    result = Subscriber.objects.filter(
-        messengers_bot=bot, updated__date=date.date(), is_active=False
-    ).aggregate(Count("id"))
-    return result["id__count"]
+    start_totals = start_totals or {}
+    start = timezone.make_aware(datetime.combine(date_from, time.min))
+    end = timezone.make_aware(datetime.combine(date_to + timedelta(days=1),
+                                               time.min))
+    days = list(create_list_of_dates(date_from, date_to))
+    series = {
+        (bot.id, day): dict.fromkeys(DAILY_FIELDS, 0)
+        for bot in bots for day in days
+    }
+
+    per_day = [
+        ("messages", Message.objects.filter(
+            sender__messengers_bot__in=bots,
+            created__gte=start, created__lt=end
+        ).values(bot_id=F("sender__messengers_bot"),
+                 day=TruncDate("created"))),
+        ("new_subscribers", Subscriber.objects.filter(
+            messengers_bot__in=bots, is_active=True,
+            created__gte=start, created__lt=end
+        ).values(bot_id=F("messengers_bot"), day=TruncDate("created"))),
+        ("unsubscribed", Subscriber.objects.filter(
+            messengers_bot__in=bots, is_active=False,
+            updated__gte=start, updated__lt=end
+        ).values(bot_id=F("messengers_bot"), day=TruncDate("updated"))),
+    ]
+    for field, queryset in per_day:
+        for row in queryset.annotate(number=Count("id")).order_by():
+            series[(row["bot_id"], row["day"])][field] = row["number"]
+
+    # subscribers of start totals, that unsubscribed after they were counted
+    left = {}
+    if start_totals:
+        counted_after = Q()
+        for bot_id, (_, counted_at) in start_totals.items():
+            counted_after |= Q(messengers_bot=bot_id, updated__gte=counted_at)
+        left = dict(Subscriber.objects.filter(
+            counted_after, is_active=False, created__lt=start
+        ).values("messengers_bot").annotate(
+            number=Count("id")
+        ).order_by().values_list("messengers_bot", "number"))
+    for bot_id, (total, _) in start_totals.items():
+        total -= left.get(bot_id, 0)
+        for day in days:
+            total += series[(bot_id, day)]["new_subscribers"]
+            series[(bot_id, day)]["subscribers"] = total
+
+    # number of subscribers, that were created till the end of each day
+    # when somebody subscribed, it doesn't change in other days
+    bots = [bot for bot in bots if bot.id not in start_totals]
+    if not bots:
+        return series
+    totals = Subscriber.objects.filter(
+        messengers_bot__in=bots, is_active=True, created__lt=end
+    ).values(
+        bot_id=F("messengers_bot"), day=TruncDate("created")
+    ).annotate(total=Window(
+        Count("id"), partition_by=[F("messengers_bot")],
+        order_by=TruncDate("created").asc()
+    )).distinct().order_by("bot_id", "day")
+    last_totals = {}
+    for row in totals:
+        last_totals.setdefault(row["bot_id"], []).append(
+            (row["day"], row["total"])
+        )
+    for bot in bots:
+        rows, total = last_totals.get(bot.id, []), 0
+        for day in days:
+            while rows and rows[0][0] <= day:
+                total = rows.pop(0)[1]
+            series[(bot.id, day)]["subscribers"] = total
+    return series
 
 
-def count_all_subs_in_bot_lte_date(date: datetime, bot: Bot) -> int:
+def rollup_daily_stats(date_from: date, date_to: date,
+                       bots: list = None) -> int:
+    """
+    Counts statistics of bots (all by default) for each day
+    in [date_from; date_to] and saves them to DailyBotStats.
+    Returns number of saved days of bots.
     """
-    Returns number of subscribers in certain bot that was created before.
+    if bots is None:
+        bots = list(Bot.objects.all())
+    # totals are continued from saved day before, so only new
+    # subscribers are read, not all of them
+    start_totals = {
+        bot_id: (subscribers, updated)
+        for bot_id, subscribers, updated in DailyBotStats.objects.filter(
+            bot__in=bots, date=date_from - timedelta(days=1)
+        ).values_list("bot_id", "subscribers", "updated")
+    }
+    series = get_daily_series(bots, date_from, date_to, start_totals)
+    stats = [
+        DailyBotStats(bot_id=bot_id, date=day, **fields)
+        for (bot_id, day), fields in series.items()
+    ]
+    with transaction.atomic():
+        DailyBotStats.objects.filter(
+            bot__in=bots, date__range=[date_from, date_to]
+        ).delete()
+        DailyBotStats.objects.bulk_create(stats)
+    return len(stats)
+
+
+def get_rollup_stats(bots: list, date_from: date, date_to: date) -> dict:
     """
-    result = Subscriber.objects.filter(
-        messengers_bot=bot, created__date__lte=date.date(), is_active=True
-    ).aggregate(Count("id"))
-    return result["id__count"]
+    Returns statistics of bots for days in [date_from; date_to]
+    from DailyBotStats, in format of get_daily_series.
+    """
+    stats = DailyBotStats.objects.filter(
+        bot__in=bots, date__range=[date_from, date_to]
+    ).values("bot_id", "date", *DAILY_FIELDS)
+    result = {}
+    for row in stats:
+        result[(row["bot_id"], row["date"])] = {
+            field: row[field] for field in DAILY_FIELDS
+        }
+    return result
+
+
+def get_general_statistics(date_from: datetime, date_to: datetime,
+                           channel: Channel, analytics_type: str) -> list:
+    """
+    Creates list(generator) of each date in
+    period [`date_from`; `date_to`]. Counts messages/subs in this date,
+    counts messages/subs in the same date of previous period or day before,
+    counts efficiency.
+    Returns list of dicts. Dict:
+    {"date": certain datetime,
+    "num": Number of ALL messages/subs this date(mb in future only
+    non-menu messages for bot),
+    "efficiency": Counted efficiency,
+    "analytics_type": analytics' type
+    "bot_stats": [{"num": Number of msgs/subs for current bot,
+                  "efficiency": eff,
+                  "bot": messenger name}]}
+    """
+    bots = list(channel.bots.all())
+    # statistics of all days (and day before) with a few queries
+    get_stats = (get_rollup_stats if settings.ANALYTICS_USE_ROLLUP
+                 else get_daily_series)
+    stats = get_stats(
+        bots, (date_from - timezone.timedelta(days=1)).date(),
+        date_to.date()
+    )
+
+    def count(field: str, day: datetime, bot: Bot) -> int:
+        return stats.get((bot.id, day.date()), {}).get(field, 0)
+
+    now_period_dates = create_list_of_dates(date_from, date_to)
+    result = []
+    for day in now_period_dates:
+        prev_date = day - timezone.timedelta(days=1)
+        result.append({"date": day.timestamp() + day.utcoffset().seconds,
+                       "analytics_type": analytics_type,
+                       "bots_stats": []})
+        has_efficiency = True
+        for bot in bots:
+            if analytics_type == "bot":
+                num: int = count("messages", day, bot)
+                prev_num: int = count("messages", prev_date, bot)
+                subs_num: int = count("subscribers", day, bot)
+                efficiency: float = calculate_bot_efficiency(num,
+                                                             prev_num,
+                                                             subs_num)
+            elif analytics_type == "subs_increase":
+                # если нужно будет эффективность за весь период
+                # то prev_date = date -
+                # timedelta(days=(date_to-date_from).days)
+                num: int = count("new_subscribers", day, bot)
+                prev_num: int = count("new_subscribers", prev_date, bot)
+                efficiency: float = calculate_subs_efficiency(num,
+                                                              prev_num)
+            elif analytics_type == "subs_decrease":
+                num: int = count("unsubscribed", day, bot)
+                prev_num: int = count("unsubscribed", prev_date, bot)
+                efficiency: float = calculate_subs_efficiency(num,
+                                                              prev_num)
+            else:  # elif analytics_type == "subs"
+                num: int = count("subscribers", day, bot)
+                efficiency = None
+                has_efficiency = False
+            bot_data = dict(
+                num=num,
+                efficiency=efficiency,
+                bot=bot.messenger
+            )
+            result[-1]["bots_stats"].append(bot_data)
+        result[-1].update(
+            num=sum([bot["num"] for bot in result[-1]["bots_stats"]])
+        )
+        if has_efficiency:
+            result[-1].update(
+                efficiency=sum(
+                    [bot["efficiency"] for bot in result[-1]["bots_stats"]]
+                )
+            )
+        else:
+            result[-1].update(efficiency=None)
+    return result
 
 
 def get_msgs_statistics(date_from: datetime, date_to: datetime,
-                        order: str, bot: Bot) -> QuerySet:
+                        order: str, bot: Bot) -> list:
     """
     date_from & date_to is our range(included)
 
     Returns table with columns ['text', 'num_msgs']
     'text' is our tag, that user writes to get non-menu data.
+    Texts of non-menu buttons of the bot's channel are joined with
+    messages of the bot, so texts without messages have 0.
     """
-    msg_texts = Button.objects.filter(
-        action__is_menu_action=False
-    ).values("text")
-    # need to return qs with all available non-menu messages
-    # no idea how to improve
-    msgs = Message.objects.filter(
-        text__in=msg_texts,
-        created__range=[date_from, date_to],
-        sender__messengers_bot=bot
-    ).values('text')
-    zero_num_msgs = Button.objects.filter(
-        text__in=msg_texts, keyboard__channel=bot.channel
-    ).exclude(text__in=msgs).values("text").annotate(
-        num_msgs=Count('id')-Count('id')
-    )
-    msgs = msgs.annotate(num_msgs=Count('id'))
-
-    result_qs = zero_num_msgs.union(msgs).order_by(
-        "num_msgs" if order == "asc" else "-num_msgs"
-    )
-    return result_qs
+    if bot is None:
+        return []
+    sql = f"""
+        SELECT texts.text, COUNT(msgs.id) AS num_msgs
+        FROM (
+            SELECT DISTINCT button.text
+            FROM {Button._meta.db_table} button
+            JOIN {Keyboard._meta.db_table} keyboard
+                ON keyboard.id = button.keyboard_id
+            JOIN {Action._meta.db_table} action
+                ON action.id = button.action_id
+            WHERE keyboard.channel_id = %s AND action.is_menu_action = %s
+        ) texts
+        LEFT JOIN (
+            SELECT message.id, message.text
+            FROM {Message._meta.db_table} message
+            JOIN {Subscriber._meta.db_table} subscriber
+                ON subscriber.id = message.sender_id
+            WHERE subscriber.messengers_bot_id = %s
+                AND message.created >= %s AND message.created <= %s
+        ) msgs ON msgs.text = texts.text
+        GROUP BY texts.text
+        ORDER BY num_msgs {"ASC" if order == "asc" else "DESC"}, texts.text
+    """
+    adapt = connection.ops.adapt_datetimefield_value
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [bot.channel_id, False, bot.pk,
+                             adapt(date_from), adapt(date_to)])
+        return [dict(text=text, num_msgs=num_msgs)
+                for text, num_msgs in cursor.fetchall()]
 
 
 def create_list_of_dates(date_from: datetime,
@@ -163,32 +371,40 @@ def validate_dates(date_from: str, date_to: str) -> tuple:
     return date_from, date_to
 
 
-def create_efficiency_list_for_messenger(now_period_result: QuerySet,
-                                         prev_period_result: QuerySet,
+def create_efficiency_list_for_messenger(now_period_result: list,
+                                         prev_period_result: list,
                                          subs_num: int) -> list:
-    efficiency_statistics = []
-    prev_period_result = list(prev_period_result)
+    """
+    Joins statistics of messages of both periods by text.
+    Text, that isn't in one of periods, had 0 messages in it.
+    Returns list of {"efficiency": .., "text": ..} in order of
+    the current period, texts only from previous period are at the end.
+    """
+    prev_numbers = {
+        message["text"]: message["num_msgs"]
+        for message in prev_period_result
+    }
+    now_numbers = {}
     for message in now_period_result:
-        prev_period_msg = list(filter(
-            lambda msgs: msgs["text"] == message["text"],
-            prev_period_result
-        ))
-        efficiency = calculate_bot_efficiency(
-            num_msg_now=message["num_msgs"],
-            num_msg_prev=prev_period_msg[0]['num_msgs'],
-            subs_num=subs_num
+        now_numbers[message["text"]] = message["num_msgs"]
+    for text in prev_numbers:
+        now_numbers.setdefault(text, 0)
+
+    return [
+        dict(
+            efficiency=calculate_bot_efficiency(
+                num_msg_now=num_msgs,
+                num_msg_prev=prev_numbers.get(text, 0),
+                subs_num=subs_num
+            ),
+            text=text
         )
-        data = dict(
-            efficiency=efficiency,
-            text=message["text"]
-        )
-        efficiency_statistics.append(data)
-
-    return efficiency_statistics
+        for text, num_msgs in now_numbers.items()
+    ]
 
 
 def get_efficiency_statistics(subs_num: int,
-                              now_msgs_statistics: QuerySet,
+                              now_msgs_statistics: list,
                               params: dict) -> list:
     prev_date_from, prev_date_to = get_previous_dates(
         date_from=params["date_from"], date_to=params["date_to"]
@@ -205,7 +421,11 @@ def get_efficiency_statistics(subs_num: int,
 
 
 def generate_excel(general_data, file_name) -> None:
-    workbook = xlsxwriter.Workbook(file_name)
+    """
+    Writes general statistics to xlsx, file_name can be a file object.
+    Rows are written in order, so only one row is kept in memory.
+    """
+    workbook = xlsxwriter.Workbook(file_name, {"constant_memory": True})
     worksheet = workbook.add_worksheet()
 
     row, column = 1, 0
@@ -243,3 +463,80 @@ def generate_excel(general_data, file_name) -> None:
         row += 1
 
     workbook.close()
+
+
+def write_messages_csv(channel: Channel, date_from: datetime,
+                       date_to: datetime, output) -> int:
+    """
+    Writes messages of the channel in [date_from; date_to] to text file
+    `output` as csv, messages are read from db by chunks.
+    Returns number of messages.
+    """
+    writer = csv.writer(output)
+    writer.writerow(["ID", "Відправлено", "Месенджер", "UID користувача",
+                     "Ім'я", "Зміст повідомлення", "Допомога"])
+    messages = Message.objects.filter(
+        sender__messengers_bot__channel=channel,
+        created__range=[date_from, date_to]
+    ).order_by("id").values_list(
+        "id", "created", "sender__messengers_bot__messenger",
+        "sender__user_id", "sender__name", "text", "is_help_message"
+    )
+    number = 0
+    for message_id, created, *fields in messages.iterator(
+            chunk_size=settings.ANALYTICS_EXPORT_CHUNK_SIZE):
+        created = timezone.localtime(created).strftime("%Y-%m-%d %H:%M:%S")
+        writer.writerow([message_id, created, *fields])
+        number += 1
+    return number
+
+
+def get_export_file_name(channel: Channel, kind: str, params: dict) -> str:
+    channel_name = '_'.join(channel.slug.split('-'))
+    dates = f"{params['date_from']}_{params['date_to']}"
+    if kind == AnalyticsExport.MESSAGES:
+        return f"messages_{channel_name}_{dates}.csv"
+    return f"{params['analytics_type']}_analytics_{channel_name}_{dates}.xlsx"
+
+
+def build_export_file(export: AnalyticsExport) -> None:
+    """
+    Writes analytics of export to a temporary file,
+    then saves it to export.file
+    """
+    date_from, date_to = validate_dates(date_from=export.params["date_from"],
+                                        date_to=export.params["date_to"])
+    with tempfile.TemporaryFile() as output:
+        if export.kind == AnalyticsExport.MESSAGES:
+            # excel opens utf-8 csv with BOM
+            text = io.TextIOWrapper(output, encoding="utf-8-sig", newline="")
+            write_messages_csv(export.channel, date_from, date_to, text)
+            text.detach()
+        else:
+            general_data = get_general_statistics(
+                date_from=date_from, date_to=date_to,
+                channel=export.channel,
+                analytics_type=export.params["analytics_type"]
+            )
+            generate_excel(general_data=general_data, file_name=output)
+        output.seek(0)
+        export.file.save(
+            get_export_file_name(export.channel, export.kind, export.params),
+            File(output), save=False
+        )
+    export.status = AnalyticsExport.DONE
+    export.save(update_fields=["file", "status"])
+
+
+def delete_old_exports(days: int) -> int:
+    """
+    Deletes exports created more than `days` ago with their files,
+    returns number of deleted exports
+    """
+    exports = AnalyticsExport.objects.filter(
+        created__lt=timezone.now() - timedelta(days=days)
+    )
+    for export in exports.exclude(file="").only("file").iterator():
+        export.file.delete(save=False)
+    number, _ = exports.delete()
+    return number
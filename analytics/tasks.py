@@ -0,0 +1,55 @@
+import logging
+
+from celery import shared_task
+from django.conf import settings
+from django.utils import timezone
+
+from .models import AnalyticsExport
+from .services import (
+    rollup_daily_stats, build_export_file, delete_old_exports
+)
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def update_daily_stats() -> None:
+    """
+    Counts statistics of all bots for the last ANALYTICS_ROLLUP_DAYS days,
+    runs by celery beat
+    """
+    date_to = timezone.localdate()
+    date_from = date_to - timezone.timedelta(
+        days=settings.ANALYTICS_ROLLUP_DAYS - 1
+    )
+    number = rollup_daily_stats(date_from, date_to)
+    logger.info(f"Statistics of {number} days of bots are updated")
+
+
+@shared_task(acks_late=True)
+def build_analytics_export(export_id: int) -> None:
+    """
+    Celery task for building file of analytics export
+    """
+    export = AnalyticsExport.objects.select_related("channel").filter(
+        pk=export_id, status=AnalyticsExport.PENDING
+    ).first()
+    if not export:
+        return
+    try:
+        build_export_file(export)
+    except Exception:
+        logger.exception(f"Analytics export {export_id} isn't built")
+        AnalyticsExport.objects.filter(pk=export_id).update(
+            status=AnalyticsExport.FAILED
+        )
+
+
+@shared_task
+def delete_old_analytics_exports() -> None:
+    """
+    Deletes analytics exports older than ANALYTICS_EXPORT_KEEP_DAYS days
+    with their files, runs by celery beat
+    """
+    number = delete_old_exports(settings.ANALYTICS_EXPORT_KEEP_DAYS)
+    logger.info(f"{number} old analytics exports are deleted")
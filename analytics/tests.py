@@ -0,0 +1,287 @@
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from analytics.models import (
+    DailyBotStats,
+    AnalyticsExport,
+    PrivateMediaStorage,
+)
+from analytics.services import (
+    get_day_range,
+    rollup_daily_stats,
+    get_daily_series,
+    create_efficiency_list_for_messenger,
+    get_msgs_statistics,
+    get_general_statistics,
+)
+from analytics.tasks import (
+    build_analytics_export,
+    delete_old_analytics_exports,
+)
+from bots_management.models import Bot, Channel
+from keyboards.models import Action, Button, Keyboard
+from subscribers.models import Message, Subscriber
+
+PRIVATE_MEDIA_ROOT = tempfile.mkdtemp()
+
+
+class DailyStatsTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.channel = Channel.objects.create(name="first", slug="first_slug")
+        cls.bot = Bot.objects.create(messenger="viber", channel=cls.channel,
+                                     token="1v")
+        first = Subscriber.objects.create(user_id="1", messengers_bot=cls.bot)
+        Subscriber.objects.create(user_id="2", messengers_bot=cls.bot,
+                                  is_active=False)
+        for _ in range(3):
+            Message.objects.create(sender=first, message_token="1",
+                                   text="text")
+        cls.today = timezone.localdate()
+        cls.yesterday = cls.today - timezone.timedelta(days=1)
+
+    def test_rollup_daily_stats(self):
+        self.assertEqual(rollup_daily_stats(self.yesterday, self.today), 2)
+        # old statistics of days are replaced
+        rollup_daily_stats(self.yesterday, self.today)
+
+        stats = DailyBotStats.objects.get(bot=self.bot, date=self.today)
+        self.assertEqual(stats.messages, 3)
+        self.assertEqual(stats.new_subscribers, 1)
+        self.assertEqual(stats.unsubscribed, 1)
+        self.assertEqual(stats.subscribers, 1)
+        stats = DailyBotStats.objects.get(bot=self.bot, date=self.yesterday)
+        self.assertEqual(stats.messages, 0)
+
+    def test_rollup_continues_saved_totals(self):
+        rollup_daily_stats(self.yesterday, self.today)
+        DailyBotStats.objects.filter(date=self.yesterday).update(
+            subscribers=10
+        )
+        # subscribed before saved day and unsubscribed after it
+        old = Subscriber.objects.create(user_id="3", messengers_bot=self.bot,
+                                        is_active=False)
+        Subscriber.objects.filter(pk=old.pk).update(
+            created=timezone.now() - timezone.timedelta(days=7)
+        )
+
+        rollup_daily_stats(self.today, self.today)
+        stats = DailyBotStats.objects.get(bot=self.bot, date=self.today)
+        self.assertEqual(stats.subscribers, 10 - 1 + 1)
+
+    def test_general_statistics_from_rollup(self):
+        rollup_daily_stats(self.yesterday, self.today)
+        date_to = timezone.localtime()
+        date_from = date_to - timezone.timedelta(days=1)
+        for analytics_type in ("bot", "subs_increase",
+                               "subs_decrease", "subs"):
+            params = dict(date_from=date_from, date_to=date_to,
+                          channel=self.channel,
+                          analytics_type=analytics_type)
+            expected = get_general_statistics(**params)
+            with override_settings(ANALYTICS_USE_ROLLUP=True):
+                with self.assertNumQueries(2):
+                    result = get_general_statistics(
+                        **params
+                    )
+            self.assertEqual(result, expected)
+
+    def test_daily_series(self):
+        old = Subscriber.objects.create(user_id="3", messengers_bot=self.bot)
+        week_ago = self.today - timezone.timedelta(days=7)
+        Subscriber.objects.filter(pk=old.pk).update(
+            created=timezone.now() - timezone.timedelta(days=7)
+        )
+        # number of queries doesn't depend on the period
+        for days in (7, 90):
+            with self.assertNumQueries(4):
+                series = get_daily_series(
+                    [self.bot], self.today - timezone.timedelta(days=days),
+                    self.today
+                )
+            self.assertEqual(len(series), days + 1)
+
+        self.assertEqual(series[(self.bot.id, self.today)], {
+            "messages": 3, "new_subscribers": 1,
+            "unsubscribed": 1, "subscribers": 2,
+        })
+        self.assertEqual(series[(self.bot.id, week_ago)]["subscribers"], 1)
+        self.assertEqual(series[(self.bot.id, self.yesterday)], {
+            "messages": 0, "new_subscribers": 0,
+            "unsubscribed": 0, "subscribers": 1,
+        })
+
+
+class DayRangeTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        channel = Channel.objects.create(name="first", slug="first_slug")
+        bot = Bot.objects.create(messenger="viber", channel=channel,
+                                 token="1v")
+        cls.subscriber = Subscriber.objects.create(user_id="1",
+                                                   messengers_bot=bot)
+
+    def test_range_is_same_as_date_lookup(self):
+        microsecond = timezone.timedelta(microseconds=1)
+        # usual day and days, when clocks are changed
+        for day in ("2020-06-15", "2020-03-29", "2020-10-25"):
+            date = timezone.make_aware(
+                timezone.datetime.strptime(day, "%Y-%m-%d")
+            )
+            day_start, day_end = get_day_range(date)
+            for created in (day_start - microsecond, day_start,
+                            day_end - microsecond, day_end):
+                message = Message.objects.create(sender=self.subscriber,
+                                                 message_token=day)
+                Message.objects.filter(pk=message.pk).update(created=created)
+
+            messages = Message.objects.filter(message_token=day)
+            in_range = messages.filter(created__gte=day_start,
+                                       created__lt=day_end)
+            self.assertEqual(in_range.count(), 2)
+            self.assertEqual(
+                set(in_range.values_list("id", flat=True)),
+                set(messages.filter(created__date=date.date()).values_list(
+                    "id", flat=True
+                ))
+            )
+
+
+class EfficiencyTestCase(TestCase):
+    def test_periods_are_joined_by_text(self):
+        now = [{"text": "a", "num_msgs": 3}, {"text": "b", "num_msgs": 1}]
+        prev = [{"text": "c", "num_msgs": 2}, {"text": "a", "num_msgs": 1}]
+        result = create_efficiency_list_for_messenger(now, prev, subs_num=10)
+        self.assertEqual(result, [
+            {"efficiency": 20.0, "text": "a"},
+            {"efficiency": 10.0, "text": "b"},
+            {"efficiency": -20.0, "text": "c"},
+        ])
+
+
+class MsgsStatisticsTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        texts = {"first": ["a", "b", "b"], "second": ["c"]}
+        for name, button_texts in texts.items():
+            channel = Channel.objects.create(name=name, slug=name)
+            keyboard = Keyboard.objects.create(name=name, channel=channel)
+            action = Action.objects.create(name=name, is_menu_action=False,
+                                           keyboard_to_represent=keyboard)
+            for i, text in enumerate(button_texts, 1):
+                Button.objects.create(keyboard=keyboard, action=action,
+                                      name=str(i), text=text, position=i)
+        cls.bot = Bot.objects.create(messenger="viber", token="1v",
+                                     channel=Channel.objects.get(name="first"))
+        subscriber = Subscriber.objects.create(user_id="1",
+                                               messengers_bot=cls.bot)
+        for text in ["a", "a", "c", "other"]:
+            Message.objects.create(sender=subscriber, message_token="1",
+                                   text=text)
+
+    def test_texts_of_channel_buttons_are_counted(self):
+        date_to = timezone.now()
+        date_from = date_to - timezone.timedelta(days=1)
+        with self.assertNumQueries(1):
+            result = get_msgs_statistics(date_from, date_to, "desc", self.bot)
+        self.assertEqual(result, [{"text": "a", "num_msgs": 2},
+                                  {"text": "b", "num_msgs": 0}])
+        result = get_msgs_statistics(date_from - timezone.timedelta(days=1),
+                                     date_from, "asc", self.bot)
+        self.assertEqual(result, [{"text": "a", "num_msgs": 0},
+                                  {"text": "b", "num_msgs": 0}])
+
+
+@override_settings(ANALYTICS_EXPORT_SYNC_DAYS=7)
+class AnalyticsExportTestCase(TestCase):
+    url = "/channel/first_slug/download_analytics/"
+
+    @classmethod
+    def setUpTestData(cls):
+        get_user_model().objects.create_superuser(username="super",
+                                                  password="1234")
+        channel = Channel.objects.create(name="first", slug="first_slug")
+        bot = Bot.objects.create(messenger="viber", channel=channel,
+                                 token="1v")
+        subscriber = Subscriber.objects.create(user_id="1", name="user",
+                                               messengers_bot=bot)
+        Message.objects.create(sender=subscriber, message_token="1",
+                               text="text, with comma")
+
+    def setUp(self):
+        self.client.login(username="super", password="1234")
+        self.today = timezone.localdate().strftime("%Y-%m-%d")
+        # storage of the field is created once, when models are loaded
+        patcher = mock.patch.object(
+            AnalyticsExport._meta.get_field("file"), "storage",
+            PrivateMediaStorage(location=PRIVATE_MEDIA_ROOT)
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(PRIVATE_MEDIA_ROOT, ignore_errors=True)
+
+    def test_short_period_is_built_at_once(self):
+        response = self.client.post(self.url, {
+            "date_from": self.today, "date_to": self.today,
+            "analytics_type": "bot", "kind": "general",
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("attachment", response["Content-Disposition"])
+        # xlsx is a zip archive
+        self.assertEqual(b"".join(response.streaming_content)[:2], b"PK")
+        self.assertFalse(AnalyticsExport.objects.exists())
+
+    def test_messages_are_exported_by_task(self):
+        response = self.client.post(self.url, {
+            "date_from": self.today, "date_to": self.today,
+            "kind": "messages",
+        })
+        export = AnalyticsExport.objects.get()
+        self.assertRedirects(response, export.get_absolute_url())
+        self.assertEqual(export.status, AnalyticsExport.PENDING)
+
+        build_analytics_export(export_id=export.pk)
+        export.refresh_from_db()
+        self.assertEqual(export.status, AnalyticsExport.DONE)
+        # file isn't served by web server
+        self.assertTrue(export.file.path.startswith(PRIVATE_MEDIA_ROOT))
+        with self.assertRaises(ValueError):
+            export.file.url
+        response = self.client.get(export.get_absolute_url())
+        self.assertContains(response, export.get_download_url())
+        response = self.client.get(export.get_download_url())
+        content = b"".join(response.streaming_content).decode("utf-8-sig")
+        rows = content.splitlines()
+        self.assertEqual(len(rows), 2)
+        self.assertIn('viber,1,user,"text, with comma",False', rows[1])
+
+    def test_old_exports_are_deleted(self):
+        channel = Channel.objects.get()
+        old, new = [
+            AnalyticsExport.objects.create(
+                channel=channel, kind=AnalyticsExport.MESSAGES,
+                params={"date_from": self.today, "date_to": self.today}
+            )
+            for _ in range(2)
+        ]
+        for export in (old, new):
+            build_analytics_export(export_id=export.pk)
+        AnalyticsExport.objects.filter(pk=old.pk).update(
+            created=timezone.now() - timezone.timedelta(days=8)
+        )
+        old.refresh_from_db()
+        new.refresh_from_db()
+
+        with self.settings(ANALYTICS_EXPORT_KEEP_DAYS=7):
+            delete_old_analytics_exports()
+        self.assertEqual(list(AnalyticsExport.objects.all()), [new])
+        self.assertFalse(os.path.exists(old.file.path))
+        self.assertTrue(os.path.exists(new.file.path))
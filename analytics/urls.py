@@ -1,7 +1,8 @@
 from django.urls import path
 
 from analytics.views import (
-    BotAnalyticsView, GeneralAnalyticsView, download_analytics
+    BotAnalyticsView, GeneralAnalyticsView, AnalyticsExportView,
+    AnalyticsExportDetailView, AnalyticsExportDownloadView
 )
 
 app_name = "analytics"
@@ -12,6 +13,12 @@ urlpatterns = [
          GeneralAnalyticsView.as_view(),
          name="general-analytics"),
     path("download_analytics/",
-         download_analytics,
+         AnalyticsExportView.as_view(),
          name="download-analytics"),
+    path("exports/<int:pk>/",
+         AnalyticsExportDetailView.as_view(),
+         name="export-detail"),
+    path("exports/<int:pk>/download/",
+         AnalyticsExportDownloadView.as_view(),
+         name="export-download"),
 ]
@@ -1,26 +1,25 @@
+import io
 import json
 import os
-from datetime import datetime
 
 from django.conf import settings
-from django.http import HttpResponse, FileResponse
-from django.utils import timezone
-from django.views.generic import ListView
+from django.db import transaction
+from django.http import FileResponse, Http404
+from django.shortcuts import get_object_or_404, redirect
+from django.views.generic import DetailView, ListView, View
 
 from bots_management.mixins import ModeratorRequiredMixin
-from bots_management.models import Channel
 from bots_management.services import get_channel_by_slug, get_bot_to_channel
 from subscribers.services import (
     get_num_of_subs_to_messenger
 )
 from .forms import BotAnalyticsForm, GeneralAnalyticsForm
+from .models import AnalyticsExport
 from .services import (
-    count_msgs_in_bot, get_msgs_statistics, create_list_of_dates,
-    calculate_bot_efficiency, validate_dates, get_efficiency_statistics,
-    count_subs_in_bot_in_date, calculate_subs_efficiency,
-    count_all_subs_in_bot_lte_date, count_inactive_subs_in_bot_in_date,
-    generate_excel
+    get_msgs_statistics, validate_dates, get_efficiency_statistics,
+    generate_excel, get_general_statistics, get_export_file_name
 )
+from .tasks import build_analytics_export
 
 
 class GeneralAnalyticsView(ModeratorRequiredMixin, ListView):
@@ -44,8 +43,9 @@ class GeneralAnalyticsView(ModeratorRequiredMixin, ListView):
         )
         context["date_from"], context["date_to"] = date_from, date_to
         analytics_type = self.request.GET.get("analytics_type", "bot")
+        context["analytics_type"] = analytics_type
 
-        all_data = self.get_general_statistics(
+        all_data = get_general_statistics(
             date_from=date_from, date_to=date_to,
             channel=channel, analytics_type=analytics_type
         )
@@ -54,88 +54,6 @@ class GeneralAnalyticsView(ModeratorRequiredMixin, ListView):
 
         return context
 
-    @staticmethod
-    def get_general_statistics(date_from: datetime, date_to: datetime,
-                               channel: Channel, analytics_type: str) -> list:
-        """
-        Creates list(generator) of each date in
-        period [`date_from`; `date_to`]. Counts messages/subs in this date,
-        counts messages/subs in the same date of previous period or day before,
-        counts efficiency.
-        Returns list of dicts. Dict:
-        {"date": certain datetime,
-        "num": Number of ALL messages/subs this date(mb in future only
-        non-menu messages for bot),
-        "efficiency": Counted efficiency,
-        "analytics_type": analytics' type
-        "bot_stats": [{"num": Number of msgs/subs for current bot,
-                      "efficiency": eff,
-                      "bot": messenger name}]}
-        """
-        now_period_dates = create_list_of_dates(date_from, date_to)
-        result = []
-        for date in now_period_dates:
-            prev_date = date - timezone.timedelta(days=1)
-            result.append({"date": date.timestamp() + date.utcoffset().seconds,
-                           "analytics_type": analytics_type,
-                           "bots_stats": []})
-            has_efficiency = True
-            for bot in channel.bots.all():
-                if analytics_type == "bot":
-                    num: int = count_msgs_in_bot(date=date,
-                                                 bot=bot)
-                    prev_num: int = count_msgs_in_bot(date=prev_date,
-                                                      bot=bot)
-                    subs_num: int = count_all_subs_in_bot_lte_date(date=date,
-                                                                   bot=bot)
-                    efficiency: float = calculate_bot_efficiency(num,
-                                                                 prev_num,
-                                                                 subs_num)
-                elif analytics_type == "subs_increase":
-                    # если нужно будет эффективность за весь период
-                    # то prev_date = date -
-                    # timedelta(days=(date_to-date_from).days)
-                    num: int = count_subs_in_bot_in_date(date=date,
-                                                         bot=bot)
-                    prev_num: int = count_subs_in_bot_in_date(date=prev_date,
-                                                              bot=bot)
-                    efficiency: float = calculate_subs_efficiency(num,
-                                                                  prev_num)
-                elif analytics_type == "subs_decrease":
-                    num: int = count_inactive_subs_in_bot_in_date(
-                        date=date, bot=bot
-                    )
-                    prev_num: int = count_inactive_subs_in_bot_in_date(
-                        date=prev_date, bot=bot
-                    )
-                    efficiency: float = calculate_subs_efficiency(num,
-                                                                  prev_num)
-                else:  # elif analytics_type == "subs"
-                    num: int = count_all_subs_in_bot_lte_date(date=date,
-                                                              bot=bot)
-                    prev_num: count_all_subs_in_bot_lte_date(date=prev_date,
-                                                             bot=bot)
-                    efficiency = None
-                    has_efficiency = False
-                bot_data = dict(
-                    num=num,
-                    efficiency=efficiency,
-                    bot=bot.messenger
-                )
-                result[-1]["bots_stats"].append(bot_data)
-            result[-1].update(
-                num=sum([bot["num"] for bot in result[-1]["bots_stats"]])
-            )
-            if has_efficiency:
-                result[-1].update(
-                    efficiency=sum(
-                        [bot["efficiency"] for bot in result[-1]["bots_stats"]]
-                    )
-                )
-            else:
-                result[-1].update(efficiency=None)
-        return result
-
 
 class BotAnalyticsView(ModeratorRequiredMixin, ListView):
     template_name = "analytics/bot.html"
@@ -163,8 +81,8 @@ class BotAnalyticsView(ModeratorRequiredMixin, ListView):
 
         order = self.request.GET.get("order", "desc")
 
-        # create QuerySet of {'text': Our non-menu message,
-        #                     'num_msgs': Number of messages}
+        # create list of {'text': Our non-menu message,
+        #                 'num_msgs': Number of messages}
         params = dict(date_from=date_from, date_to=date_to,
                       order=order, bot=bot)
         msgs_statistics = get_msgs_statistics(**params)
@@ -189,27 +107,71 @@ class BotAnalyticsView(ModeratorRequiredMixin, ListView):
         return context
 
 
-def download_analytics(request, slug):
-    if request.method == "POST":
-        general_data = request.POST.get("general_data")
-        if general_data:
-            general_data = json.loads(general_data)
-
-            channel_name = '_'.join(slug.split('-'))
-            gd_first = general_data[0]
-            first_date = timezone.datetime.fromtimestamp(
-                gd_first["date"]
-            ).strftime(settings.DATE_FORMAT)
-            last_date = timezone.datetime.fromtimestamp(
-                general_data[-1]["date"]
-            ).strftime(settings.DATE_FORMAT)
-            file_name = "%s_analytics_%s_%s_%s.xlsx" % (
-                gd_first['analytics_type'], channel_name, first_date, last_date
+class AnalyticsExportView(ModeratorRequiredMixin, View):
+    """
+    Builds xlsx with general analytics of a short period at once,
+    other exports are built by celery task, then user gets a link.
+    """
+
+    def post(self, request, *args, **kwargs):
+        channel = get_channel_by_slug(self.kwargs["slug"])
+        kind = request.POST.get("kind", AnalyticsExport.GENERAL)
+        if not channel or kind not in dict(AnalyticsExport.KINDS):
+            raise Http404
+        date_from, date_to = validate_dates(
+            date_from=request.POST.get("date_from"),
+            date_to=request.POST.get("date_to")
+        )
+        params = dict(
+            date_from=date_from.strftime(settings.DATE_FORMAT),
+            date_to=date_to.strftime(settings.DATE_FORMAT),
+            analytics_type=request.POST.get("analytics_type", "bot"),
+        )
+
+        is_short = (date_to - date_from).days < (
+            settings.ANALYTICS_EXPORT_SYNC_DAYS
+        )
+        if kind == AnalyticsExport.GENERAL and is_short:
+            general_data = get_general_statistics(
+                date_from=date_from, date_to=date_to, channel=channel,
+                analytics_type=params["analytics_type"]
+            )
+            output = io.BytesIO()
+            generate_excel(general_data=general_data, file_name=output)
+            output.seek(0)
+            return FileResponse(
+                output, as_attachment=True,
+                filename=get_export_file_name(channel, kind, params)
             )
 
-            generate_excel(general_data=general_data, file_name=file_name)
-            response = FileResponse(open(file_name, "rb"))
-            os.remove(file_name)
-            return response
-        return HttpResponse(status=404)
-    return HttpResponse(status=404)
+        export = AnalyticsExport.objects.create(channel=channel, kind=kind,
+                                                params=params)
+        transaction.on_commit(
+            lambda: build_analytics_export.delay(export_id=export.pk)
+        )
+        return redirect(export)
+
+
+class AnalyticsExportDetailView(ModeratorRequiredMixin, DetailView):
+    template_name = "analytics/export_detail.html"
+    context_object_name = "export"
+
+    def get_queryset(self):
+        return AnalyticsExport.objects.select_related("channel").filter(
+            channel__slug=self.kwargs["slug"]
+        )
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["channel"] = self.object.channel
+        return context
+
+
+class AnalyticsExportDownloadView(ModeratorRequiredMixin, View):
+    def get(self, request, *args, **kwargs):
+        export = get_object_or_404(
+            AnalyticsExport, pk=self.kwargs["pk"],
+            channel__slug=self.kwargs["slug"], status=AnalyticsExport.DONE
+        )
+        return FileResponse(export.file.open("rb"), as_attachment=True,
+                            filename=os.path.basename(export.file.name))
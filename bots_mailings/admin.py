@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from bots_mailings.models import Post, SentMessage
+from bots_mailings.models import Post, SentMessage, MailingChunk
 
 
 @admin.register(Post)
@@ -11,3 +11,10 @@ class Post(admin.ModelAdmin):
 @admin.register(SentMessage)
 class Post(admin.ModelAdmin):
     pass
+
+
+@admin.register(MailingChunk)
+class MailingChunkAdmin(admin.ModelAdmin):
+    list_display = ("post", "first_subscriber_id", "last_subscriber_id",
+                    "receivers_num", "actions_done", "is_done")
+    list_filter = ("is_done",)
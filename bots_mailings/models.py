@@ -104,3 +104,34 @@ class SentMessage(models.Model):
 
     def __str__(self) -> str:
         return f"Sent message {self.message_id} to {self.chat_id}"
+
+
+class MailingChunk(models.Model):
+    """
+    Part of receivers of the Post, that is sent by one celery task.
+    Receivers of chunk are subscribers with id in
+    [first_subscriber_id; last_subscriber_id].
+    """
+    post = models.ForeignKey(
+        to=Post,
+        on_delete=models.CASCADE,
+        related_name="chunks",
+        verbose_name="Публікація"
+    )
+    first_subscriber_id = models.IntegerField("ID першого підписника")
+    last_subscriber_id = models.IntegerField("ID останнього підписника")
+    receivers_num = models.PositiveIntegerField("Кількість отримувачів")
+    actions_done = models.PositiveSmallIntegerField(
+        "Кількість відправлених дій", default=0
+    )
+    is_done = models.BooleanField("Відправлення здійснене?", default=False)
+    updated = models.DateTimeField("Оновлений", auto_now=True)
+
+    class Meta:
+        verbose_name = "Частина розсилки"
+        verbose_name_plural = "Частини розсилки"
+        ordering = ["post", "first_subscriber_id"]
+
+    def __str__(self) -> str:
+        return (f"Post {self.post_id} subscribers "
+                f"{self.first_subscriber_id}-{self.last_subscriber_id}")
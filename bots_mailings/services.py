@@ -1,14 +1,26 @@
 from typing import Union
 
-from bots_mailings.models import Post, SentMessage
-from keyboards.models import Action
+from django.conf import settings
+from django.db.models import QuerySet
+
+from bots_mailings.models import Post, SentMessage, MailingChunk
+from bots_management.buffers import BulkCreateBuffer
+from keyboards.models import Action, IdFilesInMessenger
+from subscribers.services import get_all_active_subs
+from telegram_api.utils import get_media_path
+
+# order of actions of a mailing (as Meta.ordering of Action),
+# pk makes it stable, so actions_done of chunks can be resumed
+MAILING_ACTIONS_ORDERING = ("keyboard_to_represent__id", "name", "pk")
 
 
 def create_sent_message_object(
         chat_id: Union[int, str], message_id: str,
-        action: Action, post: Post) -> None:
+        action: Action, post: Post,
+        buffer: BulkCreateBuffer = None) -> None:
     """
-    Create an object of SentMessage model
+    Create an object of SentMessage model,
+    if buffer is provided, object is saved with others in bulk
     """
     sent_post = SentMessage(
         chat_id=chat_id,
@@ -16,4 +28,113 @@ def create_sent_message_object(
         action=action,
         post=post,
     )
-    sent_post.save()
+    if buffer is not None:
+        buffer.add(sent_post)
+    else:
+        sent_post.save()
+
+
+def get_sent_messages_buffer() -> BulkCreateBuffer:
+    return BulkCreateBuffer(
+        SentMessage,
+        size=settings.SENT_MESSAGES_BUFFER_SIZE,
+        interval=settings.SENT_MESSAGES_BUFFER_INTERVAL,
+    )
+
+
+def get_mailing_actions(post: Post) -> list:
+    """
+    Returns actions of the post in order they are sent
+    """
+    return list(post.actions.order_by(*MAILING_ACTIONS_ORDERING))
+
+
+def get_mailing_receivers(post: Post) -> QuerySet:
+    """
+    Returns chosen receivers of the post or all active subscribers
+    of the channel, if nobody was chosen
+    """
+    receivers = post.send_to.all()
+    if not receivers.exists():
+        receivers = get_all_active_subs(channel=post.channel)
+    return receivers
+
+
+def create_mailing_chunks(post: Post, size: int = None) -> list:
+    """
+    Splits receivers of the post into chunks by `size` subscribers
+    and saves them
+    """
+    size = size or settings.MAILING_CHUNK_SIZE
+    ids = get_mailing_receivers(post).order_by("pk").values_list(
+        "pk", flat=True
+    ).iterator(chunk_size=size)
+    chunks = []
+    for subscriber_id in ids:
+        if not chunks or chunks[-1].receivers_num == size:
+            chunks.append(MailingChunk(
+                post=post, first_subscriber_id=subscriber_id,
+                receivers_num=0
+            ))
+        chunks[-1].last_subscriber_id = subscriber_id
+        chunks[-1].receivers_num += 1
+    return MailingChunk.objects.bulk_create(chunks)
+
+
+def get_chunk_receivers(chunk: MailingChunk) -> QuerySet:
+    return get_mailing_receivers(chunk.post).filter(
+        pk__range=(chunk.first_subscriber_id, chunk.last_subscriber_id)
+    )
+
+
+def split_receivers_by_messenger(receivers: QuerySet) -> dict:
+    """
+    Returns user ids of receivers grouped by messenger,
+    e.g. {"telegram": [...], "viber": [...]}.
+    Only (user_id, messenger) rows are streamed from db.
+    """
+    user_ids: dict = {}
+    rows = receivers.order_by("pk").values_list(
+        "user_id", "messengers_bot__messenger"
+    ).iterator(chunk_size=settings.MAILING_CHUNK_SIZE)
+    for user_id, messenger in rows:
+        user_ids.setdefault(messenger, []).append(user_id)
+    return user_ids
+
+
+def get_first_telegram_receivers(post: Post, number: int) -> list:
+    return list(get_mailing_receivers(post).filter(
+        messengers_bot__messenger="telegram"
+    ).order_by("pk").values_list("user_id", flat=True)[:number])
+
+
+def get_telegram_file_ids(actions: list, token: str) -> dict:
+    """
+    Returns {action id: file id} of actions, which media is already
+    uploaded to telegram by the bot
+    """
+    paths: dict = {action.pk: get_media_path(action) for action in actions
+                   if get_media_path(action)}
+    files = IdFilesInMessenger.objects.filter(
+        action_id__in=paths, token_tg=token
+    ).values_list("action_id", "telegram_id", "path_media_tg")
+    return {action_id: file_id for action_id, file_id, path in files
+            if path == paths[action_id]}
+
+
+def get_already_sent_chat_ids(post: Post, action: Action,
+                              chat_ids: list) -> set:
+    """
+    Returns chat ids from `chat_ids`, that already got action of the post
+    """
+    return set(SentMessage.objects.filter(
+        post=post, action=action, chat_id__in=chat_ids
+    ).values_list("chat_id", flat=True))
+
+
+def finish_mailing_if_done(post: Post) -> None:
+    """
+    Marks post as sent, when all its chunks are sent
+    """
+    if not post.chunks.filter(is_done=False).exists():
+        Post.objects.filter(pk=post.pk).update(is_done=True)
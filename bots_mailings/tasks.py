@@ -1,59 +1,126 @@
 import logging
 
 from celery import shared_task
-from django.db.models import QuerySet
+from django.db import transaction
 
-from bots_mailings.models import Post
+from bots_mailings.models import Post, MailingChunk
+from bots_mailings.services import (
+    create_mailing_chunks,
+    get_chunk_receivers,
+    get_already_sent_chat_ids,
+    finish_mailing_if_done,
+    get_sent_messages_buffer,
+    split_receivers_by_messenger,
+    get_telegram_file_ids,
+    get_mailing_actions,
+)
 from bots_mailings.utils import (
     send_action_to_telegram_users,
     send_action_to_viber_users,
-    delete_telegram_messages
-)
-from subscribers.services import (
-    get_all_active_subs,
-    is_telegram_subscriber
+    delete_telegram_messages,
+    upload_telegram_media,
 )
+from bots_management.services import get_channel_tokens
+from viber_api.client import viber_client
+
 logger = logging.getLogger(__name__)
 
 
 @shared_task
 def send_mailing(post_id: int) -> None:
     """
-    Celery task for sending a mailing to a user/group of users
+    Celery task for sending a mailing to a user/group of users.
+    Splits receivers into chunks and sends each chunk in its own task.
+    If mailing was interrupted, call it again to send not finished chunks.
     """
-
-    try:
+    # post is locked only while chunks are created,
+    # so concurrent calls create them once
+    with transaction.atomic():
         # Moderator can delete post model before this function starts
-        post: Post = Post.objects.get(id=post_id)
-    except Post.DoesNotExist as e:
-        logger.info(e)
-        return
+        post: Post = Post.objects.select_for_update().filter(
+            id=post_id
+        ).first()
+        if not post:
+            logger.info(f"Post {post_id} does not exist")
+            return
+        if post.is_done:
+            return
+        if not post.chunks.exists():
+            create_mailing_chunks(post)
+
+    # uploads are long, they run without transaction,
+    # ids of uploaded files are saved by each upload
+    token = get_channel_tokens(post.channel).get("telegram")
+    if token:
+        upload_telegram_media(post, token)
 
-    receivers: QuerySet = post.send_to.all()
-    if not receivers:
-        receivers: QuerySet = get_all_active_subs(channel=post.channel)
+    for chunk_id in post.chunks.filter(is_done=False).values_list(
+            "id", flat=True):
+        send_mailing_chunk.delay(chunk_id=chunk_id)
+    finish_mailing_if_done(post)
+
+
+# acks_late: if worker dies, chunk will be sent by another worker
+@shared_task(acks_late=True)
+def send_mailing_chunk(chunk_id: int) -> None:
+    """
+    Celery task for sending a mailing to a chunk of receivers.
+    Telegram users, that already got an action, are skipped.
+    Viber users are resumed by finished actions of the chunk only,
+    broadcast doesn't return ids of messages for each receiver.
+    """
+    chunk = MailingChunk.objects.select_related(
+        "post", "post__channel"
+    ).filter(id=chunk_id).first()
+    if not chunk or chunk.is_done:
+        return
+    post: Post = chunk.post
 
-    telegram_users: list = []
-    viber_users: list = []
-    [telegram_users.append(receiver.user_id) if is_telegram_subscriber(receiver)
-     else viber_users.append(receiver.user_id) for receiver in receivers]
+    receivers: dict = split_receivers_by_messenger(
+        get_chunk_receivers(chunk)
+    )
+    telegram_users: list = receivers.get("telegram", [])
+    viber_users: list = receivers.get("viber", [])
+    tokens: dict = get_channel_tokens(post.channel)
 
-    for action in post.actions.all():
-        if viber_users:
-            send_action_to_viber_users(
-                subscriber_list=viber_users,
-                action=action,
-                token=post.channel.viber_token
-            )
-        if telegram_users:
-            send_action_to_telegram_users(
-                subscriber_list=telegram_users,
-                action=action,
-                post=post
-            )
+    actions = get_mailing_actions(post)
+    # media is uploaded by send_mailing, only ids of files are sent
+    file_ids: dict = get_telegram_file_ids(
+        actions, tokens.get("telegram")
+    ) if telegram_users else {}
+    # sent messages are saved in bulk, the rest of them is saved
+    # before progress of the chunk after each action and when task fails.
+    # Messages in the buffer are lost only if worker is killed during
+    # an action, then they are sent again to these receivers.
+    with get_sent_messages_buffer() as sent_messages:
+        for number, action in enumerate(actions[chunk.actions_done:],
+                                        start=chunk.actions_done + 1):
+            if viber_users:
+                send_action_to_viber_users(
+                    subscriber_list=viber_users,
+                    action=action,
+                    token=tokens.get("viber")
+                )
+            if telegram_users:
+                sent = get_already_sent_chat_ids(post, action, telegram_users)
+                send_action_to_telegram_users(
+                    subscriber_list=[chat_id for chat_id in telegram_users
+                                     if chat_id not in sent],
+                    action=action,
+                    post=post,
+                    sent_messages=sent_messages,
+                    token=tokens.get("telegram"),
+                    file_id=file_ids.get(action.pk)
+                )
+            sent_messages.flush()
+            chunk.actions_done = number
+            chunk.save(update_fields=["actions_done", "updated"])
 
-    post.is_done = True
-    post.save()
+    chunk.is_done = True
+    chunk.save(update_fields=["is_done", "updated"])
+    if viber_users:
+        logger.info(f"Viber API latency: {viber_client.get_stats()}")
+    finish_mailing_if_done(post)
 
 
 @shared_task
@@ -1,3 +1,274 @@
-# from django.test import TestCase
+import json
+import threading
+from unittest import mock
 
-# Create your tests here.
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+
+from bots_mailings.models import Post, SentMessage
+from bots_mailings.services import (
+    create_mailing_chunks,
+    get_mailing_actions,
+    split_receivers_by_messenger,
+    get_telegram_file_ids,
+)
+from bots_mailings.tasks import send_mailing, send_mailing_chunk
+from bots_mailings.utils import (
+    get_broadcast_body,
+    run_in_threads,
+    send_action_to_viber_users,
+    upload_telegram_media,
+)
+from bots_management.models import Channel, Bot
+from keyboards.models import Keyboard, Action, IdFilesInMessenger
+from subscribers.models import Subscriber
+
+
+class RunInThreadsTestCase(SimpleTestCase):
+    def test_items_are_taken_in_order(self):
+        calls = []
+        run_in_threads(calls.append, iter([3, None, 0, 1]), threads=1)
+        self.assertEqual(calls, [3, None, 0, 1])
+
+    def test_items_are_sent_by_threads(self):
+        barrier = threading.Barrier(3, timeout=5)
+        idents = set()
+
+        def function(item):
+            idents.add(threading.get_ident())
+            barrier.wait()
+
+        run_in_threads(function, range(6), threads=3)
+        self.assertEqual(len(idents), 3)
+        self.assertFalse(barrier.broken)
+
+    @mock.patch("bots_mailings.utils.logger")
+    def test_failed_item_does_not_stop_others(self, logger):
+        calls = []
+
+        def function(item):
+            if item == 1:
+                raise ValueError("failed")
+            calls.append(item)
+
+        run_in_threads(function, range(4), threads=2)
+        self.assertEqual(sorted(calls), [0, 2, 3])
+        logger.critical.assert_called_once_with(
+            "Mailing to 1 failed: failed"
+        )
+
+
+class MailingChunksTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        c = Channel.objects.create(name="first", slug="first_slug")
+        bot = Bot.objects.create(messenger="telegram", channel=c, token="1t")
+        Bot.objects.create(messenger="viber", channel=c, token="1v")
+        k = Keyboard.objects.create(name="keyboard", channel=c)
+        action = Action.objects.create(name="action", action_type="text",
+                                       keyboard_to_represent=k)
+        for i in range(5):
+            Subscriber.objects.create(user_id=str(i), messengers_bot=bot)
+        Subscriber.objects.create(user_id="inactive", messengers_bot=bot,
+                                  is_active=False)
+        post = Post.objects.create(channel=c)
+        post.actions.add(action)
+
+    def test_create_mailing_chunks(self):
+        post = Post.objects.get()
+        create_mailing_chunks(post, size=2)
+        self.assertEqual(
+            list(post.chunks.values_list("receivers_num", flat=True)),
+            [2, 2, 1]
+        )
+
+    def test_split_receivers_by_messenger(self):
+        viber_bot = Bot.objects.get(messenger="viber")
+        Subscriber.objects.create(user_id="v", messengers_bot=viber_bot)
+        with self.assertNumQueries(1):
+            receivers = split_receivers_by_messenger(
+                Subscriber.objects.filter(is_active=True)
+            )
+        self.assertEqual(receivers, {
+            "telegram": ["0", "1", "2", "3", "4"],
+            "viber": ["v"],
+        })
+
+    @mock.patch("bots_mailings.utils.send_action_to_telegram_user")
+    def test_upload_telegram_media(self, send_action):
+        post = Post.objects.get()
+        video = Action.objects.create(
+            name="video", action_type="video", video="video/1.mp4",
+            keyboard_to_represent=Keyboard.objects.get()
+        )
+        post.actions.add(video)
+        IdFilesInMessenger.objects.create(
+            action=video, token_tg="1t", telegram_id="old",
+            path_media_tg="/old/path.mp4"
+        )
+        # file of the action was changed, old id isn't used
+        self.assertEqual(get_telegram_file_ids([video], "1t"), {})
+
+        def upload(chat_id, action, post, token, file_id):
+            if action == video:
+                IdFilesInMessenger.objects.filter(action=video).update(
+                    telegram_id="new", path_media_tg=video.video.path
+                )
+        send_action.side_effect = upload
+
+        self.assertEqual(upload_telegram_media(post, "1t"),
+                         {video.pk: "new"})
+        # both actions are sent in their order to the first receiver
+        self.assertEqual(
+            [(c[1]["chat_id"], c[1]["action"].name)
+             for c in send_action.call_args_list],
+            [("0", "action"), ("0", "video")]
+        )
+        send_action.reset_mock()
+        upload_telegram_media(post, "1t")
+        send_action.assert_not_called()
+
+    @mock.patch("bots_mailings.tasks.send_action_to_telegram_users")
+    def test_actions_are_sent_in_order_of_action_model(self, send_action):
+        post = Post.objects.get()
+        post.actions.add(Action.objects.create(
+            name="a first", action_type="text",
+            keyboard_to_represent=Keyboard.objects.get()
+        ))
+        self.assertEqual([action.name for action in get_mailing_actions(post)],
+                         [action.name for action in post.actions.all()])
+        create_mailing_chunks(post, size=5)
+        send_mailing_chunk(chunk_id=post.chunks.get().id)
+        self.assertEqual([c[1]["action"].name
+                          for c in send_action.call_args_list],
+                         ["a first", "action"])
+
+    @mock.patch("bots_mailings.tasks.send_action_to_telegram_users")
+    def test_send_mailing_chunk(self, send_action):
+        post = Post.objects.get()
+        action = Action.objects.get()
+        create_mailing_chunks(post, size=3)
+        chunks = list(post.chunks.all())
+        SentMessage.objects.create(chat_id="1", message_id=1,
+                                   action=action, post=post)
+
+        send_mailing_chunk(chunk_id=chunks[0].id)
+        # "1" already got the action
+        self.assertEqual(send_action.call_args[1]["subscriber_list"],
+                         ["0", "2"])
+        self.assertEqual(send_action.call_args[1]["token"], "1t")
+        chunks[0].refresh_from_db()
+        self.assertTrue(chunks[0].is_done)
+        self.assertEqual(chunks[0].actions_done, 1)
+        post.refresh_from_db()
+        self.assertFalse(post.is_done)
+
+        send_mailing_chunk(chunk_id=chunks[1].id)
+        self.assertEqual(send_action.call_args[1]["subscriber_list"],
+                         ["3", "4"])
+        post.refresh_from_db()
+        self.assertTrue(post.is_done)
+
+        # done chunks aren't sent again
+        send_action.reset_mock()
+        send_mailing_chunk(chunk_id=chunks[0].id)
+        send_action.assert_not_called()
+
+    @mock.patch("bots_mailings.tasks.send_action_to_telegram_users")
+    def test_sent_messages_are_saved_before_progress(self, send_action):
+        post = Post.objects.get()
+        first = Action.objects.get()
+        second = Action.objects.create(
+            name="second", action_type="text",
+            keyboard_to_represent=first.keyboard_to_represent
+        )
+        post.actions.add(second)
+        create_mailing_chunks(post, size=5)
+        chunk = post.chunks.get()
+
+        def send(subscriber_list, action, post, sent_messages, **kwargs):
+            if action == second:
+                # messages of the first action are saved with progress
+                chunk.refresh_from_db()
+                self.assertEqual(chunk.actions_done, 1)
+                self.assertTrue(SentMessage.objects.filter(
+                    action=first).exists())
+            sent_messages.add(SentMessage(chat_id="0", message_id=1,
+                                          action=action, post=post))
+        send_action.side_effect = send
+
+        send_mailing_chunk(chunk_id=chunk.id)
+        self.assertEqual(send_action.call_count, 2)
+        self.assertEqual(SentMessage.objects.count(), 2)
+
+
+class SendMailingTestCase(TransactionTestCase):
+    def setUp(self):
+        c = Channel.objects.create(name="first", slug="first_slug")
+        bot = Bot.objects.create(messenger="telegram", channel=c, token="1t")
+        for i in range(3):
+            Subscriber.objects.create(user_id=str(i), messengers_bot=bot)
+        self.post = Post.objects.create(channel=c)
+
+    @mock.patch("bots_mailings.tasks.upload_telegram_media")
+    @mock.patch("bots_mailings.tasks.send_mailing_chunk")
+    def test_send_mailing_again(self, send_chunk, upload):
+        def outside_transaction(*args, **kwargs):
+            # post isn't locked during uploads, chunks are committed
+            self.assertFalse(connection.in_atomic_block)
+            self.assertTrue(self.post.chunks.exists())
+        upload.side_effect = outside_transaction
+        send_chunk.delay.side_effect = outside_transaction
+
+        with self.settings(MAILING_CHUNK_SIZE=2):
+            send_mailing(self.post.pk)
+            send_mailing(self.post.pk)
+        chunk_ids = list(self.post.chunks.values_list("id", flat=True))
+        self.assertEqual(len(chunk_ids), 2)
+        self.assertEqual(
+            [c[1]["chunk_id"] for c in send_chunk.delay.call_args_list],
+            chunk_ids * 2
+        )
+        upload.assert_called_with(self.post, "1t")
+
+
+# batches are sent by other threads, they must see saved data
+class ViberBroadcastTestCase(TransactionTestCase):
+    def setUp(self):
+        c = Channel.objects.create(name="first", slug="first_slug")
+        bot = Bot.objects.create(messenger="viber", channel=c, token="1v")
+        k = Keyboard.objects.create(name="keyboard", channel=c)
+        Action.objects.create(name="action", action_type="text",
+                              text="hello", keyboard_to_represent=k)
+        for i in range(3):
+            Subscriber.objects.create(user_id=str(i), messengers_bot=bot)
+
+    def test_get_broadcast_body(self):
+        message = json.dumps({"type": "text", "text": "hello"})
+        self.assertEqual(
+            json.loads(get_broadcast_body(message, ["1", "2"])),
+            {"type": "text", "text": "hello", "broadcast_list": ["1", "2"]}
+        )
+
+    @mock.patch("bots_mailings.utils.v_send_message")
+    def test_send_action_to_viber_users(self, send_message):
+        send_message.return_value = {"status": 0, "failed_list": [
+            {"receiver": "1", "status": 6},
+            {"receiver": "2", "status": 1},
+        ]}
+        send_action_to_viber_users(
+            subscriber_list=["0", "1", "2", "3"],
+            action=Action.objects.get(),
+            token="1v",
+            limit=2
+        )
+        # no empty batch, when receivers are divided by limit
+        self.assertEqual(send_message.call_count, 2)
+        lists = sorted(json.loads(call[0][0])["broadcast_list"]
+                       for call in send_message.call_args_list)
+        self.assertEqual(lists, [["0", "1"], ["2", "3"]])
+        self.assertEqual(
+            list(Subscriber.objects.filter(is_active=False).values_list(
+                "user_id", flat=True)),
+            ["1"]
+        )
@@ -1,32 +1,90 @@
+import json
 import logging
+import threading
+from typing import Callable, Iterable
 
-from time import sleep
+from django.conf import settings
+from django.db import connection
 
 from telegram_api.api import (
     delete_message as tg_delete_message
 )
-from bots_mailings.models import Post, SentMessage
-from bots_mailings.services import create_sent_message_object
+from bots_mailings.models import Post
+from bots_mailings.services import (
+    create_sent_message_object,
+    get_sent_messages_buffer,
+    get_already_sent_chat_ids,
+    get_first_telegram_receivers,
+    get_telegram_file_ids,
+    get_mailing_actions,
+)
+from bots_management.buffers import BulkCreateBuffer
 from keyboards.models import Action
-from viber_api.handlers import action_handler as v_action_handler
+from subscribers.services import deactivate_viber_subscribers
+from viber_api.api import send_message as v_send_message
+from viber_api.handlers import get_action_messages as v_get_action_messages
 from telegram_api.handlers import action_handler as tg_action_handler
+from telegram_api.rate_limit import rate_limiter
+from telegram_api.utils import get_media_path
 
 logger = logging.getLogger(__name__)
 
+# statuses of failed_list: receiver isn't registered or subscribed
+VIBER_DEAD_RECEIVER_STATUSES = (5, 6)
+
+# end of items in run_in_threads, None can be an item
+_DONE = object()
+
+
+def run_in_threads(function: Callable, items: Iterable,
+                   threads: int = None) -> None:
+    """
+    Calls function(item) for every item in a pool of threads.
+    Items are taken from iterable lazily, so it can be a generator.
+    Each thread closes its database connection when there are no items.
+    """
+    threads = threads or settings.MAILING_SENDER_THREADS
+    items = iter(items)
+    lock = threading.Lock()
+
+    def worker():
+        try:
+            while True:
+                with lock:
+                    item = next(items, _DONE)
+                if item is _DONE:
+                    return
+                try:
+                    function(item)
+                except Exception as e:
+                    logger.critical(f"Mailing to {item} failed: {e}")
+        finally:
+            connection.close()
+
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+
 
 def send_action_to_telegram_user(
-        chat_id: int, action: Action, post: Post) -> None:
+        chat_id: int, action: Action, post: Post, token: str,
+        sent_messages: BulkCreateBuffer = None,
+        file_id: str = None) -> None:
     """
     Parse action due to it`s type
-    and send message with provided content to chat_id
+    and send message with provided content to chat_id,
+    requests wait for rate limits of telegram
     """
-    token = post.channel.telegram_token
-
-    response = tg_action_handler(
-        uid=chat_id,
-        channel=post.channel,
-        action=action
-    )
+    with rate_limiter.throttling():
+        response = tg_action_handler(
+            uid=chat_id,
+            channel=post.channel,
+            action=action,
+            token=token,
+            file_id=file_id
+        )
 
     for message in response:
         if message:
@@ -34,70 +92,141 @@ def send_action_to_telegram_user(
                 chat_id=chat_id,
                 message_id=message.message_id,
                 post=post,
-                action=action
+                action=action,
+                buffer=sent_messages
             )
 
 
 def send_action_to_telegram_users(
-        subscriber_list: list, action: Action, post: Post) -> None:
+        subscriber_list: Iterable, action: Action, post: Post,
+        sent_messages: BulkCreateBuffer = None,
+        token: str = None, file_id: str = None) -> None:
     """
     Send action to all telegram subscribers in subscriber_list
+    concurrently, requests wait for telegram rate limits
+    in telegram_api.api.
+    sent_messages: buffer for SentMessage objects, they are saved
+    in bulk instead of one by one. All of them are saved before return.
+    file_id: id of already uploaded media of the action
     """
-    for subscriber in subscriber_list:
-        send_action_to_telegram_user(
-            chat_id=subscriber,
-            action=action,
-            post=post
+    token = token or post.channel.telegram_token
+    # keyboard is loaded and cached before threads use it
+    action.keyboard_to_represent.get_telegram_markup()
+    if sent_messages is None:
+        sent_messages = get_sent_messages_buffer()
+    with sent_messages:
+        run_in_threads(
+            lambda chat_id: send_action_to_telegram_user(
+                chat_id=chat_id, action=action, post=post, token=token,
+                sent_messages=sent_messages, file_id=file_id
+            ),
+            subscriber_list
         )
 
-        # Telegram API will not allow send more than 30 messages per second
-        # to bypass blocking sleep thread for 0.5 secs
-        # TODO: try to find more efficient way to bypass blocking
-        sleep(0.1)
+
+def upload_telegram_media(post: Post, token: str, attempts: int = 3) -> dict:
+    """
+    Uploads media of the post to telegram before the mailing, so every
+    file is uploaded once and not by each worker. Actions are sent in their
+    order to first receivers (they are skipped later), until all media
+    is uploaded or `attempts` receivers failed.
+    Returns {action id: file id}.
+    """
+    all_actions: list = get_mailing_actions(post)
+    actions: list = [action for action in all_actions
+                     if get_media_path(action)]
+    file_ids: dict = get_telegram_file_ids(actions, token)
+    not_uploaded: list = [action.pk for action in actions
+                          if action.pk not in file_ids]
+    if not not_uploaded:
+        return file_ids
+    for chat_id in get_first_telegram_receivers(post, attempts):
+        # actions are sent up to the last one with not uploaded media
+        last = max(number for number, action in enumerate(all_actions)
+                   if action.pk in not_uploaded)
+        for action in all_actions[:last + 1]:
+            if get_already_sent_chat_ids(post, action, [chat_id]):
+                continue
+            send_action_to_telegram_user(
+                chat_id=chat_id, action=action, post=post, token=token,
+                file_id=file_ids.get(action.pk)
+            )
+        file_ids = get_telegram_file_ids(actions, token)
+        not_uploaded = [action.pk for action in actions
+                        if action.pk not in file_ids]
+        if not not_uploaded:
+            break
+    return file_ids
 
 
-def delete_telegram_messages(messages:dict, token):
+def delete_telegram_messages(messages: dict, token: str) -> None:
     """
     Delete all messages of the post in Telegram
     """
+    def delete_message(message: tuple) -> None:
+        with rate_limiter.throttling():
+            tg_delete_message(chat_id=message[1], message_id=message[0],
+                              token=token)
 
-    for message_id, chat_id in messages.items():
-        tg_delete_message(
-            chat_id=chat_id,
-            message_id=message_id,
-            token=token
-        )
-        # Telegram API will not allow send more than 30 messages per second
-        # to bypass blocking sleep thread for 0.5 secs
-        # TODO: try to find more efficient way to bypass blocking
-        sleep(0.1)
+    run_in_threads(delete_message, messages.items())
+
+
+def get_broadcast_body(message: str, broadcast_list: list) -> str:
+    """
+    Adds broadcast_list to message, that is already serialized to json,
+    so message isn't serialized again for every batch of receivers
+    """
+    return f'{message[:-1]}, "broadcast_list": {json.dumps(broadcast_list)}}}'
+
+
+def get_failed_receivers(response: dict) -> list:
+    """
+    Returns ids of receivers from failed_list of viber broadcast response,
+    that aren't registered or subscribed to the bot
+    """
+    return [
+        failed.get('receiver') for failed in response.get('failed_list', [])
+        if failed.get('status') in VIBER_DEAD_RECEIVER_STATUSES
+    ]
 
 
 def broadcast_to_viber_users(
-        broadcast_list: list, action: Action, token: str) -> None:
+        broadcast_list: list, messages: list, token: str) -> None:
     """
-    Parse action due to it`s type
-    and send message with provided content to chat_id
-    """
-    uid = [subscriber for subscriber in broadcast_list]
-    v_action_handler(
-        uid=uid,
-        token=token,
-        action=action,
-        broadcast=True,
-    )
+    Send serialized messages of an action to broadcast_list
+    one after another and deactivate receivers, that are
+    unsubscribed from the bot
+    """
+    failed: set = set()
+    for message in messages:
+        response = v_send_message(
+            get_broadcast_body(message, broadcast_list), token,
+            broadcast=True
+        )
+        failed.update(get_failed_receivers(response or {}))
+    if failed:
+        deactivate_viber_subscribers(list(failed), token)
 
 
 def send_action_to_viber_users(
         subscriber_list: list, action: Action,
         token: str, limit: int = 300) -> None:
     """
-    Call broadcast_to_viber_users
-    for every 300 receivers due to viber`s limitation
+    Call broadcast_to_viber_users for every `limit` receivers
+    due to viber`s limitation, batches are sent concurrently
     """
-    for i in range(len(subscriber_list) // limit + 1):
-        broadcast_to_viber_users(
-            broadcast_list=subscriber_list[i * limit:(i + 1) * limit],
-            action=action,
+    messages: list = [json.dumps(message)
+                      for message in v_get_action_messages(action)]
+    if not messages:
+        return
+    batches = (subscriber_list[i:i + limit]
+               for i in range(0, len(subscriber_list), limit))
+    run_in_threads(
+        lambda batch: broadcast_to_viber_users(
+            broadcast_list=batch,
+            messages=messages,
             token=token
-        )
+        ),
+        batches,
+        threads=settings.VIBER_BROADCAST_THREADS
+    )
@@ -0,0 +1,56 @@
+"""
+Small helpers for benchmark management commands.
+"""
+import time
+from typing import Callable
+
+
+def measure(function: Callable, iterations: int) -> list:
+    """
+    Calls `function(i)` `iterations` times.
+    Returns list of durations of each call in milliseconds.
+    """
+    durations = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        function(i)
+        durations.append((time.perf_counter() - start) * 1000)
+    return durations
+
+
+def percentile(durations: list, percent: float) -> float:
+    """
+    Returns percentile (nearest-rank method) of durations.
+    """
+    ordered = sorted(durations)
+    index = max(int(round(percent / 100.0 * len(ordered))) - 1, 0)
+    return ordered[index]
+
+
+def summarize(title: str, durations: list) -> str:
+    """
+    Returns one line report about durations in milliseconds.
+    """
+    total = sum(durations)
+    return (
+        f"{title}: {len(durations)} calls, "
+        f"{len(durations) / (total / 1000):.1f} calls/s, "
+        f"p50 {percentile(durations, 50):.2f} ms, "
+        f"p95 {percentile(durations, 95):.2f} ms, "
+        f"p99 {percentile(durations, 99):.2f} ms, "
+        f"max {max(durations):.2f} ms"
+    )
+
+
+class QueryCounter:
+    """
+    Counts sql queries, use as
+    with connection.execute_wrapper(counter): ...
+    """
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
@@ -0,0 +1,92 @@
+import atexit
+import logging
+import os
+import threading
+import time
+
+from django.db import close_old_connections, models
+
+logger = logging.getLogger(__name__)
+
+
+class BulkCreateBuffer:
+    """
+    Collects unsaved objects of a model and saves them with bulk_create,
+    when `size` objects are collected or `interval` seconds passed since
+    the last flush. Can be used by many threads.
+    Use it as context manager to save the rest objects on exit (even if
+    there was an exception).
+    background: objects are also saved by a thread of the process every
+    `interval` seconds and when the process exits, for long living
+    buffers (e.g. in web workers).
+    """
+
+    def __init__(self, model, size: int = 500, interval: float = 1.0,
+                 background: bool = False):
+        self.model = model
+        self.size = size
+        self.interval = interval
+        self.background = background
+        self._objects = []
+        self._flushed_at = time.monotonic()
+        self._lock = threading.Lock()
+        self._flusher_pid = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.flush()
+
+    def __len__(self) -> int:
+        return len(self._objects)
+
+    def add(self, obj: models.Model) -> None:
+        if self.background:
+            self._start_flusher()
+        with self._lock:
+            self._objects.append(obj)
+            is_full = any([
+                len(self._objects) >= self.size,
+                time.monotonic() - self._flushed_at >= self.interval,
+            ])
+        if is_full:
+            self.flush()
+
+    def flush(self) -> list:
+        """
+        Saves all collected objects, returns them.
+        """
+        with self._lock:
+            objects, self._objects = self._objects, []
+            self._flushed_at = time.monotonic()
+        if objects:
+            self.model.objects.bulk_create(objects, batch_size=self.size)
+        return objects
+
+    def _start_flusher(self) -> None:
+        # threads don't survive fork, so flusher is started in each process
+        if self._flusher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._flusher_pid == os.getpid():
+                return
+            if self._flusher_pid is not None:
+                # objects of parent process are saved by parent
+                self._objects = []
+            self._flusher_pid = os.getpid()
+        threading.Thread(target=self._flush_periodically, daemon=True).start()
+        atexit.register(self.flush)
+
+    def _flush_periodically(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            if time.monotonic() - self._flushed_at < self.interval:
+                continue
+            try:
+                close_old_connections()
+                self.flush()
+            except Exception as e:
+                logger.critical(
+                    f"Objects of {self.model.__name__} aren't saved: {e}"
+                )
@@ -0,0 +1,55 @@
+import threading
+import time
+import uuid
+from typing import Callable, Hashable
+
+from django.core.cache import cache
+
+
+class LocalVersionedCache:
+    """
+    In-process cache for values, that are built from database.
+    Version of each key is kept in django cache, so `invalidate` in one
+    process makes all processes, that share django cache, rebuild value.
+    `ttl` limits how long value can be used if django cache isn't shared.
+    """
+
+    def __init__(self, prefix: str, ttl: float):
+        self.prefix = prefix
+        self.ttl = ttl
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _version_key(self, key: Hashable) -> str:
+        return f"{self.prefix}:version:{key}"
+
+    def get(self, key: Hashable, build: Callable):
+        """
+        Returns cached value of `key` or calls `build()` to create it.
+        """
+        version = cache.get(self._version_key(key))
+        item = self._values.get(key)
+        if item is not None:
+            item_version, built_at, value = item
+            if all([item_version == version,
+                    time.monotonic() - built_at < self.ttl]):
+                return value
+        value = build()
+        with self._lock:
+            self._values[key] = (version, time.monotonic(), value)
+        return value
+
+    def invalidate(self, key: Hashable) -> None:
+        """
+        Drops value of `key` in this process and in all others.
+        """
+        cache.set(self._version_key(key), uuid.uuid4().hex, None)
+        with self._lock:
+            self._values.pop(key, None)
+
+    def clear(self) -> None:
+        """
+        Drops all values of this process.
+        """
+        with self._lock:
+            self._values.clear()
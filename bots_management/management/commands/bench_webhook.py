@@ -0,0 +1,69 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory, override_settings
+
+from bots_management.benchmarks import measure, summarize
+from bots_management.services import get_channel_by_slug
+from bots_management.views import telegram_index, viber_index
+
+
+class Command(BaseCommand):
+    """
+    Measures latency of webhook views with inline handling of updates
+    and with handling in celery workers (WEBHOOK_ASYNC).
+    Handlers really run, so use a test channel: bots will try to answer
+    to fake users. For async mode broker must be available.
+
+    python manage.py bench_webhook <slug> --messenger telegram -n 1000
+    """
+    help = "Measures p50/p95/p99 latency of telegram/viber webhooks"
+
+    def add_arguments(self, parser):
+        parser.add_argument("slug")
+        parser.add_argument("--messenger", default="telegram",
+                            choices=["telegram", "viber"])
+        parser.add_argument("-n", "--iterations", type=int, default=500)
+        parser.add_argument("--text", default="benchmark")
+
+    def handle(self, *args, **options):
+        slug = options["slug"]
+        if not get_channel_by_slug(slug):
+            raise CommandError(f"Channel {slug} does not exist")
+
+        factory = RequestFactory()
+        messenger = options["messenger"]
+        if messenger == "telegram":
+            view, make_update = telegram_index, self.telegram_update
+        else:
+            view, make_update = viber_index, self.viber_update
+
+        def call_webhook(i):
+            request = factory.post(
+                f"/{messenger}_prod/{slug}/",
+                data=make_update(i, options["text"]),
+                content_type="application/json",
+            )
+            view(request, slug=slug)
+
+        for is_async in (False, True):
+            with override_settings(WEBHOOK_ASYNC=is_async, DEBUG=False):
+                durations = measure(call_webhook, options["iterations"])
+            title = "async queue" if is_async else "inline handlers"
+            self.stdout.write(summarize(f"{messenger} {title}", durations))
+
+    @staticmethod
+    def telegram_update(i: int, text: str) -> dict:
+        chat = {"id": 10 ** 9 + i % 100, "first_name": "bench"}
+        return {
+            "update_id": i,
+            "message": {"message_id": i, "chat": chat, "from": chat,
+                        "date": 0, "text": text},
+        }
+
+    @staticmethod
+    def viber_update(i: int, text: str) -> dict:
+        return {
+            "event": "message",
+            "message_token": i,
+            "sender": {"id": f"bench{i % 100}", "name": "bench"},
+            "message": {"type": "text", "text": text},
+        }
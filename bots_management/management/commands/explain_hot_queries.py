@@ -0,0 +1,91 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from analytics.services import get_day_range
+from bots_management.services import get_channel_by_slug
+from keyboards.models import Button
+from keyboards.services import get_button_and_joined_action
+from subscribers.models import Message, Subscriber
+from subscribers.services import get_all_help_messages
+
+
+class Command(BaseCommand):
+    """
+    Shows plans of hot queries of a channel and checks, that they use
+    indexes, that were added for them. On small tables database prefers
+    sequential scan, so run it on a copy of production data.
+
+    python manage.py explain_hot_queries <slug> --verbose
+    """
+    help = "Runs EXPLAIN ANALYZE on hot queries and checks their indexes"
+
+    def add_arguments(self, parser):
+        parser.add_argument("slug")
+        parser.add_argument("--verbose", action="store_true",
+                            help="print full plans")
+
+    def handle(self, *args, **options):
+        channel = get_channel_by_slug(options["slug"])
+        if not channel:
+            raise CommandError(f"Channel {options['slug']} does not exist")
+
+        missing = 0
+        for title, queryset, index in self.get_hot_queries(channel):
+            plan = self.explain(queryset)
+            if index in plan:
+                self.stdout.write(self.style.SUCCESS(f"{title}: {index}"))
+            else:
+                missing += 1
+                self.stdout.write(self.style.WARNING(
+                    f"{title}: {index} is NOT used"
+                ))
+            if options["verbose"] or index not in plan:
+                self.stdout.write(plan + "\n")
+        self.stdout.write(f"{missing} queries don't use expected indexes")
+
+    @staticmethod
+    def explain(queryset) -> str:
+        # only postgres runs query with ANALYZE option
+        if connection.vendor == "postgresql":
+            return queryset.explain(analyze=True)
+        return queryset.explain()
+
+    @staticmethod
+    def get_hot_queries(channel) -> list:
+        """
+        Returns list of (title, queryset, name of expected index)
+        """
+        day_start, day_end = get_day_range(timezone.localtime())
+        button = Button.objects.filter(keyboard__channel=channel).first()
+        queries = [
+            ("help messages",
+             get_all_help_messages(channel.slug),
+             "message_help_idx"),
+            ("button by text",
+             get_button_and_joined_action(button.text if button else "",
+                                          channel.slug),
+             "button_text_keyboard_idx"),
+        ]
+        for bot in channel.bots.all():
+            queries += [
+                (f"{bot.messenger} messages of day",
+                 Message.objects.filter(
+                     sender__messengers_bot=bot,
+                     created__gte=day_start, created__lt=day_end
+                 ),
+                 "message_sender_created_idx"),
+                (f"{bot.messenger} new subscribers of day",
+                 Subscriber.objects.filter(
+                     messengers_bot=bot, is_active=True,
+                     created__gte=day_start, created__lt=day_end
+                 ),
+                 "subscriber_bot_created_idx"),
+                (f"{bot.messenger} unsubscribed of day",
+                 Subscriber.objects.filter(
+                     messengers_bot=bot, is_active=False,
+                     updated__gte=day_start, updated__lt=day_end
+                 ),
+                 "subscriber_bot_updated_idx"),
+            ]
+        return queries
@@ -0,0 +1,124 @@
+"""
+Keyset (cursor) pagination for long lists ordered by descending id.
+
+Page is found by id of the last (or first) object of the neighbour page,
+so each page is one indexed range query instead of OFFSET, and the total
+is estimated by the database planner instead of COUNT(*).
+"""
+import json
+from typing import Union
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import QuerySet
+
+
+def get_approximate_count(queryset: QuerySet) -> int:
+    """
+    Returns number of rows of queryset, that postgres planner expects
+    (from table statistics). Small numbers and other databases are
+    counted exactly.
+    """
+    db = queryset.db
+    if connections[db].vendor == "postgresql":
+        sql, params = queryset.order_by().query.sql_with_params()
+        with connections[db].cursor() as cursor:
+            cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        estimate = int(plan[0]["Plan"]["Plan Rows"])
+        if estimate > settings.EXACT_COUNT_LIMIT:
+            return estimate
+    return queryset.count()
+
+
+class KeysetPage:
+    """
+    Page of objects ordered by descending id,
+    count is approximate number of all objects.
+    """
+
+    def __init__(self, object_list: list, has_next: bool,
+                 has_previous: bool, count: int = 0):
+        self.object_list = object_list
+        self._has_next = has_next
+        self._has_previous = has_previous
+        self.count = count
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self) -> int:
+        return len(self.object_list)
+
+    def has_next(self) -> bool:
+        return self._has_next
+
+    def has_previous(self) -> bool:
+        return self._has_previous
+
+    def has_other_pages(self) -> bool:
+        return self._has_next or self._has_previous
+
+    @property
+    def next_cursor(self) -> Union[int, None]:
+        if not self._has_next or not self.object_list:
+            return None
+        return self.object_list[-1].pk
+
+    @property
+    def previous_cursor(self) -> Union[int, None]:
+        if not self._has_previous or not self.object_list:
+            return None
+        return self.object_list[0].pk
+
+
+def get_keyset_page(queryset: QuerySet, per_page: int,
+                    after: Union[int, None] = None,
+                    before: Union[int, None] = None) -> KeysetPage:
+    """
+    Returns page of objects with id less than `after` (next page),
+    or greater than `before` (previous page), or the first page.
+    If there are no objects after the cursor, the last page is returned.
+    """
+    if before is not None:
+        objects = list(queryset.filter(pk__gt=before).order_by("pk")[
+            :per_page + 1
+        ])
+        if len(objects) <= per_page:
+            # newest objects, first page is full
+            return get_keyset_page(queryset, per_page)
+        objects = objects[:per_page][::-1]
+        has_next, has_previous = True, True
+    else:
+        page = queryset if after is None else queryset.filter(pk__lt=after)
+        objects = list(page.order_by("-pk")[:per_page + 1])
+        if not objects and after is not None:
+            # cursor is older than all objects, the last page is shown
+            objects = list(queryset.order_by("pk")[:per_page + 1])
+            return KeysetPage(objects[:per_page][::-1], has_next=False,
+                              has_previous=len(objects) > per_page)
+        has_next = len(objects) > per_page
+        objects = objects[:per_page]
+        has_previous = after is not None
+    return KeysetPage(objects, has_next, has_previous)
+
+
+class KeysetPaginationMixin:
+    """
+    Mixin for ListView: paginates by ?after=<id> and ?before=<id>
+    instead of ?page=<number>. Template gets `page_obj` (KeysetPage).
+    """
+    paginate_by = 100
+
+    def get_cursor(self, name: str) -> Union[int, None]:
+        value = self.request.GET.get(name)
+        return int(value) if value and value.isdigit() else None
+
+    def paginate_queryset(self, queryset, page_size):
+        page = get_keyset_page(queryset, page_size,
+                               after=self.get_cursor("after"),
+                               before=self.get_cursor("before"))
+        page.count = get_approximate_count(queryset)
+        return None, page, page.object_list, page.has_other_pages()
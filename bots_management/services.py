@@ -1,17 +1,94 @@
 import json
-from typing import Union
+import zlib
+from typing import NamedTuple, Union
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.db.models import QuerySet, Q
 from django.forms import model_to_dict
 
+from keyboards.models import Action
+from .cache import LocalVersionedCache
 from .models import Channel, Bot
 
 
+class ChannelContext(NamedTuple):
+    """
+    Channel with its bots, that is resolved once per slug and cached
+    in process. Has same attributes, that handlers use of Channel.
+    """
+    channel: Channel
+    telegram_bot: Union[Bot, None]
+    viber_bot: Union[Bot, None]
+
+    @property
+    def id(self) -> int:
+        return self.channel.id
+
+    @property
+    def slug(self) -> str:
+        return self.channel.slug
+
+    @property
+    def is_media_allowed(self) -> bool:
+        return self.channel.is_media_allowed
+
+    @property
+    def is_geo_allowed(self) -> bool:
+        return self.channel.is_geo_allowed
+
+    @property
+    def telegram_token(self) -> Union[str, None]:
+        return self.telegram_bot.token if self.telegram_bot else None
+
+    @property
+    def viber_token(self) -> Union[str, None]:
+        return self.viber_bot.token if self.viber_bot else None
+
+    @property
+    def welcome_action(self) -> Union[Action, None]:
+        """
+        New object every time, handlers change its text
+        """
+        if not self.channel.welcome_action_id:
+            return None
+        return Action.objects.select_related("keyboard_to_represent").filter(
+            pk=self.channel.welcome_action_id
+        ).first()
+
+
+# slug -> ChannelContext
+channel_contexts = LocalVersionedCache("channel",
+                                       settings.CHANNEL_CONTEXT_TTL)
+
+
 def get_channel_by_slug(slug: str) -> Union[Channel, None]:
     return Channel.objects.filter(slug=slug).first()
 
 
+def build_channel_context(slug: str) -> Union[ChannelContext, None]:
+    channel = get_channel_by_slug(slug)
+    if not channel:
+        return None
+    bots = {bot.messenger: bot for bot in channel.bots.all()}
+    return ChannelContext(
+        channel=channel,
+        telegram_bot=bots.get("telegram"),
+        viber_bot=bots.get("viber"),
+    )
+
+
+def get_channel_context(slug: str) -> Union[ChannelContext, None]:
+    """
+    Returns cached context of the channel, that handlers use
+    """
+    return channel_contexts.get(slug, lambda: build_channel_context(slug))
+
+
+def invalidate_channel_context(slug: str) -> None:
+    channel_contexts.invalidate(slug)
+
+
 def get_all_available_channels_to_moderator(user) -> QuerySet:
     """
     Returns all available channels to moderator, or all
@@ -26,6 +103,14 @@ def get_all_related_bots(channel: Channel) -> QuerySet:
     return channel.bots.all()
 
 
+def get_channel_tokens(channel: Channel) -> dict:
+    """
+    Returns tokens of all bots of the channel by one query,
+    e.g. {"telegram": "...", "viber": "..."}
+    """
+    return dict(channel.bots.values_list("messenger", "token"))
+
+
 def get_all_bots() -> QuerySet:
     return Bot.objects.all()
 
@@ -67,3 +152,50 @@ def get_moderators_to_json() -> json:   # it returns str btw
     moderators = [{'name': moderator.username,
                    'id': moderator.id} for moderator in moderators]
     return json.dumps(moderators)
+
+
+def load_incoming_data(body: bytes, required_key: str) -> Union[dict, None]:
+    """
+    Returns decoded body of webhook request, or None if it isn't
+    a json object with `required_key`.
+    """
+    try:
+        incoming_data = json.loads(body.decode("utf-8"))
+    except (UnicodeDecodeError, ValueError):
+        return
+    if isinstance(incoming_data, dict) and required_key in incoming_data:
+        return incoming_data
+
+
+def get_telegram_chat_id(incoming_data: dict) -> Union[int, None]:
+    """
+    Returns id of the chat, the telegram update belongs to.
+    Update has only one object ("message", "edited_message", ...),
+    that contains "chat" or "from".
+    """
+    for value in incoming_data.values():
+        if isinstance(value, dict):
+            chat = value.get("chat") or value.get("from")
+            if isinstance(chat, dict):
+                return chat.get("id")
+
+
+def get_viber_chat_id(incoming_data: dict) -> Union[str, None]:
+    """
+    Returns id of the viber user, the event belongs to.
+    """
+    for key in ("sender", "user"):
+        user = incoming_data.get(key)
+        if isinstance(user, dict):
+            return user.get("id")
+    return incoming_data.get("user_id")
+
+
+def get_webhook_queue(chat_id: Union[int, str, None]) -> str:
+    """
+    Returns name of the celery queue for updates of certain chat.
+    crc32 is used instead of hash(), because hash() of str differs
+    between processes.
+    """
+    number = zlib.crc32(str(chat_id).encode()) % settings.WEBHOOK_QUEUES
+    return f"webhook_{number}"
@@ -0,0 +1,30 @@
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from bots_management.models import Channel, Bot
+from bots_management.services import invalidate_channel_context
+
+
+@receiver(pre_save, sender=Channel)
+def channel_will_change(sender, instance: Channel, **kwargs) -> None:
+    # slug can be changed, context of old slug is dropped
+    if instance.pk:
+        old_slug = Channel.objects.filter(
+            pk=instance.pk
+        ).values_list("slug", flat=True).first()
+        if old_slug:
+            invalidate_channel_context(old_slug)
+
+
+@receiver([post_save, post_delete], sender=Channel)
+def channel_changed(sender, instance: Channel, **kwargs) -> None:
+    invalidate_channel_context(instance.slug)
+
+
+@receiver([post_save, post_delete], sender=Bot)
+def bot_changed(sender, instance: Bot, **kwargs) -> None:
+    slug = Channel.objects.filter(
+        pk=instance.channel_id
+    ).values_list("slug", flat=True).first()
+    if slug:
+        invalidate_channel_context(slug)
@@ -0,0 +1,26 @@
+import logging
+
+from celery import shared_task
+
+from telegram_api.handlers import event_handler_tg
+from viber_api.handlers import event_handler
+
+logger = logging.getLogger(__name__)
+
+
+# acks_late: update is removed from the queue only after it was handled,
+# so it won't be lost if worker dies
+@shared_task(acks_late=True)
+def handle_telegram_update(incoming_data: dict, channel_slug: str) -> None:
+    """
+    Celery task for handling update, that was received by telegram webhook
+    """
+    event_handler_tg(incoming_data=incoming_data, channel_slug=channel_slug)
+
+
+@shared_task(acks_late=True)
+def handle_viber_update(incoming_data: dict, channel_slug: str) -> None:
+    """
+    Celery task for handling event, that was received by viber webhook
+    """
+    event_handler(incoming_data=incoming_data, channel_slug=channel_slug)
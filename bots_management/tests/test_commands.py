@@ -0,0 +1,59 @@
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command, CommandError
+from django.test import TestCase
+
+from bots_management.management.commands.explain_hot_queries import Command
+from bots_management.models import Bot, Channel
+from keyboards.models import Action, Button, Keyboard
+
+
+class ExplainHotQueriesTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        c = Channel.objects.create(name="first", slug="first_slug")
+        Bot.objects.create(messenger="viber", channel=c, token="1v")
+        k = Keyboard.objects.create(name="keyboard", channel=c)
+        action = Action.objects.create(name="action", keyboard_to_represent=k)
+        Button.objects.create(keyboard=k, action=action, name="button",
+                              text="button", position=1)
+
+    def call(self, *args) -> str:
+        out = StringIO()
+        call_command("explain_hot_queries", *args, stdout=out)
+        return out.getvalue()
+
+    def test_plans_of_database(self):
+        # every query can be explained on the test database
+        self.assertIn("queries don't use expected indexes", self.call(
+            "first_slug"
+        ))
+
+    @mock.patch.object(Command, "explain")
+    def test_missing_indexes(self, explain):
+        explain.side_effect = [
+            "Index Scan using message_help_idx on subscribers_message",
+            "Seq Scan on keyboards_button",
+            "Index Scan using message_sender_created_idx",
+            "Bitmap Index Scan on subscriber_bot_created_idx",
+            "Index Scan using subscriber_bot_updated_idx",
+        ]
+        output = self.call("first_slug")
+        self.assertIn("help messages: message_help_idx\n", output)
+        self.assertIn("button by text: button_text_keyboard_idx is NOT used",
+                      output)
+        self.assertIn("Seq Scan on keyboards_button\n", output)
+        self.assertNotIn("Index Scan using message_help_idx on", output)
+        self.assertTrue(output.endswith(
+            "1 queries don't use expected indexes\n"
+        ))
+
+    @mock.patch.object(Command, "explain", return_value="plan")
+    def test_verbose(self, _):
+        self.assertEqual(self.call("first_slug", "--verbose").count("plan\n"),
+                         5)
+
+    def test_unknown_channel(self):
+        with self.assertRaises(CommandError):
+            self.call("unknown")
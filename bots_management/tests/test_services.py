@@ -1,6 +1,9 @@
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase, override_settings
 import json
+import time
 
+from bots_management.buffers import BulkCreateBuffer
+from bots_management.pagination import get_keyset_page
 from bots_management.models import Bot, Channel
 from bots_management.services import (
     get_channel_by_slug,
@@ -8,10 +11,17 @@ from bots_management.services import (
     get_moderators_to_json,
     get_all_bots,
     get_all_related_bots,
-    get_bot_to_channel
+    get_bot_to_channel,
+    load_incoming_data,
+    get_telegram_chat_id,
+    get_viber_chat_id,
+    get_webhook_queue,
+    get_channel_context,
+    channel_contexts,
 )
 
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 
 
 class ChannelsTestCase(TestCase):
@@ -90,3 +100,155 @@ class BotsTestCase(TestCase):
         b2v = Bot.objects.get(channel=c2, messenger="viber")
 
         self.assertEqual(b2v, get_bot_to_channel("second_slug", "viber"))
+
+
+class WebhookServicesTestCase(TestCase):
+    def test_load_incoming_data(self):
+        self.assertEqual(
+            load_incoming_data(b'{"update_id": 1}', "update_id"),
+            {"update_id": 1}
+        )
+        self.assertIsNone(load_incoming_data(b'{"event": 1}', "update_id"))
+        self.assertIsNone(load_incoming_data(b'[1, 2]', "update_id"))
+        self.assertIsNone(load_incoming_data(b'not json', "update_id"))
+
+    def test_get_telegram_chat_id(self):
+        update = {"update_id": 1, "message": {"chat": {"id": 42}}}
+        self.assertEqual(get_telegram_chat_id(update), 42)
+        update = {"update_id": 1, "callback_query": {"from": {"id": 7}}}
+        self.assertEqual(get_telegram_chat_id(update), 7)
+        self.assertIsNone(get_telegram_chat_id({"update_id": 1}))
+
+    def test_get_viber_chat_id(self):
+        self.assertEqual(
+            get_viber_chat_id({"event": "message", "sender": {"id": "a"}}),
+            "a"
+        )
+        self.assertEqual(
+            get_viber_chat_id({"event": "subscribed", "user": {"id": "b"}}),
+            "b"
+        )
+        self.assertEqual(
+            get_viber_chat_id({"event": "seen", "user_id": "c"}), "c"
+        )
+
+    @override_settings(WEBHOOK_QUEUES=4)
+    def test_get_webhook_queue(self):
+        self.assertEqual(get_webhook_queue(42), get_webhook_queue("42"))
+        queues = {get_webhook_queue(chat_id) for chat_id in range(100)}
+        self.assertEqual(
+            queues, {"webhook_0", "webhook_1", "webhook_2", "webhook_3"}
+        )
+
+
+class BulkCreateBufferTestCase(TestCase):
+    def test_flush_when_full(self):
+        buffer = BulkCreateBuffer(Channel, size=2, interval=60)
+        buffer.add(Channel(name="first", slug="first"))
+        self.assertEqual(Channel.objects.count(), 0)
+        buffer.add(Channel(name="second", slug="second"))
+        self.assertEqual(Channel.objects.count(), 2)
+        self.assertEqual(len(buffer), 0)
+
+    def test_flush_by_interval(self):
+        buffer = BulkCreateBuffer(Channel, size=100, interval=0)
+        buffer.add(Channel(name="first", slug="first"))
+        self.assertEqual(Channel.objects.count(), 1)
+
+    def test_flush_on_exit(self):
+        with self.assertRaises(ValueError):
+            with BulkCreateBuffer(Channel, size=100, interval=60) as buffer:
+                buffer.add(Channel(name="first", slug="first"))
+                raise ValueError
+        self.assertEqual(Channel.objects.count(), 1)
+
+
+# background thread uses its own connection
+class BackgroundBulkCreateBufferTestCase(TransactionTestCase):
+    def test_flush_in_background(self):
+        buffer = BulkCreateBuffer(Channel, size=100, interval=0.05,
+                                  background=True)
+        buffer.add(Channel(name="first", slug="first"))
+        for _ in range(100):
+            if not len(buffer):
+                break
+            time.sleep(0.05)
+        self.assertEqual(Channel.objects.count(), 1)
+
+
+class KeysetPaginationTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for i in range(5):
+            Channel.objects.create(name=str(i), slug=str(i))
+        cls.ids = list(Channel.objects.order_by("-pk").values_list(
+            "pk", flat=True
+        ))
+
+    def get_ids(self, page) -> list:
+        return [channel.pk for channel in page]
+
+    def test_pages(self):
+        queryset = Channel.objects.all()
+        first = get_keyset_page(queryset, 2)
+        self.assertEqual(self.get_ids(first), self.ids[:2])
+        self.assertFalse(first.has_previous())
+
+        with self.assertNumQueries(1):
+            second = get_keyset_page(queryset, 2, after=first.next_cursor)
+        self.assertEqual(self.get_ids(second), self.ids[2:4])
+        last = get_keyset_page(queryset, 2, after=second.next_cursor)
+        self.assertEqual(self.get_ids(last), self.ids[4:])
+        self.assertFalse(last.has_next())
+
+        previous = get_keyset_page(queryset, 2, before=last.previous_cursor)
+        self.assertEqual(self.get_ids(previous), self.ids[2:4])
+        self.assertTrue(previous.has_previous())
+        # the first page is always full
+        previous = get_keyset_page(queryset, 2, before=self.ids[1])
+        self.assertEqual(self.get_ids(previous), self.ids[:2])
+        self.assertFalse(previous.has_previous())
+
+    def test_cursor_after_the_end(self):
+        queryset = Channel.objects.all()
+        page = get_keyset_page(queryset, 2, after=min(self.ids))
+        self.assertEqual(self.get_ids(page), self.ids[3:])
+        self.assertFalse(page.has_next())
+        self.assertIsNone(page.next_cursor)
+        self.assertEqual(page.previous_cursor, self.ids[3])
+
+        page = get_keyset_page(Channel.objects.none(), 2, after=1)
+        self.assertEqual(len(page), 0)
+        self.assertIsNone(page.previous_cursor)
+
+
+class ChannelContextTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        c = Channel.objects.create(name="first", slug="first_slug")
+        Bot.objects.create(messenger="telegram", channel=c, token="1t")
+
+    def setUp(self):
+        channel_contexts.clear()
+        cache.clear()
+
+    def test_context_is_cached(self):
+        context = get_channel_context("first_slug")
+        self.assertEqual(context.telegram_token, "1t")
+        self.assertIsNone(context.viber_token)
+        self.assertIsNone(context.welcome_action)
+        with self.assertNumQueries(0):
+            self.assertIs(get_channel_context("first_slug"), context)
+        self.assertIsNone(get_channel_context("unknown"))
+
+    def test_context_is_invalidated(self):
+        get_channel_context("first_slug")
+        channel = Channel.objects.get()
+        Bot.objects.create(messenger="viber", channel=channel, token="1v")
+        self.assertEqual(get_channel_context("first_slug").viber_token, "1v")
+
+        channel.slug = "new_slug"
+        channel.save()
+        self.assertIsNone(get_channel_context("first_slug"))
+        self.assertEqual(get_channel_context("new_slug").telegram_token,
+                         "1t")
@@ -1,4 +1,6 @@
-from django.test import TestCase
+from unittest import mock
+
+from django.test import TestCase, override_settings
 from django.test import Client
 
 from django.urls import reverse
@@ -30,3 +32,40 @@ class FuncTestCases(TestCase):
         c.login(username="super", password="1234")
         response = c.get("/sadsadsadsadsad/")
         self.assertEqual(response.url, "/channels/")
+
+
+class WebhookTestCases(TestCase):
+    def test_invalid_body(self):
+        c = Client()
+        response = c.post("/telegram_prod/first_slug/", data="not json",
+                          content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+        response = c.post("/viber_prod/first_slug/", data={"a": 1},
+                          content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+
+    @override_settings(WEBHOOK_ASYNC=True)
+    def test_async_telegram_webhook(self):
+        update = {"update_id": 1, "message": {"chat": {"id": 42}}}
+        with mock.patch(
+            "bots_management.views.handle_telegram_update.apply_async"
+        ) as apply_async:
+            response = Client().post("/telegram_prod/first_slug/",
+                                     data=update,
+                                     content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        apply_async.assert_called_once()
+        args, kwargs = apply_async.call_args
+        self.assertEqual(args[0], (update, "first_slug"))
+        self.assertTrue(kwargs["queue"].startswith("webhook_"))
+
+    @override_settings(WEBHOOK_ASYNC=True)
+    def test_async_viber_webhook(self):
+        event = {"event": "seen", "user_id": "abc"}
+        with mock.patch(
+            "bots_management.views.handle_viber_update.apply_async"
+        ) as apply_async:
+            response = Client().post("/viber_prod/first_slug/", data=event,
+                                     content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        apply_async.assert_called_once()
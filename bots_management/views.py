@@ -39,8 +39,10 @@ from .services import (
     get_channel_by_slug, get_all_related_bots,
     get_all_available_channels_to_moderator,
     get_channel_to_json, extract_data,
-    get_moderators_to_json,
+    get_moderators_to_json, load_incoming_data,
+    get_telegram_chat_id, get_viber_chat_id, get_webhook_queue,
 )
+from .tasks import handle_telegram_update, handle_viber_update
 from keyboards.services import get_actions_related_to_channel_by_obj
 
 
@@ -247,12 +249,19 @@ def telegram_index(request, slug):
         telegram request dispatcher
     """
     if request.method == "POST":
-        incoming_data: dict = json.loads(request.body.decode("utf-8"))
+        incoming_data = load_incoming_data(request.body, "update_id")
+        if incoming_data is None:
+            return HttpResponse(status=400)
         if settings.DEBUG:
             logger.warning(
                 f"""\n {incoming_data} \n"""
             )
-        event_handler_tg(incoming_data=incoming_data, channel_slug=slug)
+        if settings.WEBHOOK_ASYNC:
+            queue = get_webhook_queue(get_telegram_chat_id(incoming_data))
+            handle_telegram_update.apply_async((incoming_data, slug),
+                                               queue=queue)
+        else:
+            event_handler_tg(incoming_data=incoming_data, channel_slug=slug)
         return HttpResponse(status=200)
 
     return HttpResponse(status=404)
@@ -264,12 +273,19 @@ def viber_index(request, slug):
         viber request dispatcher
     """
     if request.method == "POST":
-        incoming_data: dict = json.loads(request.body.decode("utf-8"))
+        incoming_data = load_incoming_data(request.body, "event")
+        if incoming_data is None:
+            return HttpResponse(status=400)
         if settings.DEBUG:
             logger.warning(
                 f"""\n {incoming_data} \n"""
             )
-        event_handler(incoming_data=incoming_data, channel_slug=slug)
+        if settings.WEBHOOK_ASYNC:
+            queue = get_webhook_queue(get_viber_chat_id(incoming_data))
+            handle_viber_update.apply_async((incoming_data, slug),
+                                            queue=queue)
+        else:
+            event_handler(incoming_data=incoming_data, channel_slug=slug)
         return HttpResponse(status=200)
     return HttpResponse(status=404)
 
@@ -14,6 +14,9 @@ STATICFILES_DIRS = [
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 MEDIA_URL = "media/"
 MEDIA_DIRS = (os.path.join(BASE_DIR, "media"), "/media/")
+# files, that aren't served by web server (analytics exports),
+# views give them to moderators
+PRIVATE_MEDIA_ROOT = os.path.join(BASE_DIR, "private_media")
 
 SECRET_KEY = env.get('SECRET_KEY')
 DEBUG = bool(int(env.get('DEBUG')))
@@ -81,6 +84,32 @@ DATABASES = {
     }
 }
 
+# Cache must be shared by all processes (gunicorn workers, celery),
+# otherwise changes of keyboards reach other processes only after ttl
+CACHES = {
+    "default": {
+        "BACKEND": env.get(
+            "CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": env.get("CACHE_LOCATION", ""),
+    }
+}
+
+# seconds, how long process can use its routing table (button text ->
+# action) without checking for changes
+ROUTING_TABLE_TTL = 60
+# seconds, how long process can use channel with its bots in webhooks
+# without checking for changes
+CHANNEL_CONTEXT_TTL = 300
+
+# seconds, how long id and profile of subscriber are kept in cache,
+# with not shared cache (locmem) it also limits how long other processes
+# can miss changes of is_active
+SUBSCRIBER_CACHE_TIMEOUT = 60 * 10
+
+# seconds, how long ready keyboards for messengers are kept in cache
+KEYBOARD_CACHE_TIMEOUT = 60 * 60 * 24
+
 AUTH_PASSWORD_VALIDATORS = [
     {"NAME": "django.contrib.auth.password_validation."
              "UserAttributeSimilarityValidator", },
@@ -201,3 +230,93 @@ DATE_FORMAT = "%Y-%m-%d"
 
 # celery settings looks like redis://localhost:6379
 CELERY_BROKER_URL = env.get('CELERY_BROKER_URL')
+
+# If WEBHOOK_ASYNC is set, webhooks only put incoming updates into celery
+# queues "webhook_0" ... "webhook_<WEBHOOK_QUEUES - 1>" and return 200.
+# Updates of one chat always go to the same queue, so run exactly one
+# worker with concurrency 1 per queue to keep the order of messages, e.g.
+# celery -A bots_settings worker -Q webhook_0 -c 1 --prefetch-multiplier 1
+WEBHOOK_ASYNC = bool(int(env.get('WEBHOOK_ASYNC', 0)))
+WEBHOOK_QUEUES = int(env.get('WEBHOOK_QUEUES', 4))
+
+# Telegram limits: messages per second of one bot and in one chat.
+# Limits are shared by all processes through redis
+TELEGRAM_BOT_RATE = 30
+TELEGRAM_CHAT_RATE = 1
+TELEGRAM_CHAT_BURST = 3
+TELEGRAM_RATE_LIMIT_REDIS_URL = env.get(
+    'RATE_LIMIT_REDIS_URL', CELERY_BROKER_URL
+)
+# how many times to repeat request after 429 "Too Many Requests"
+TELEGRAM_MAX_RETRIES = 3
+# connections to telegram API are kept alive and shared by threads,
+# POOL_MAXSIZE should be not less than MAILING_SENDER_THREADS
+TELEGRAM_POOL_CONNECTIONS = 4
+TELEGRAM_POOL_MAXSIZE = 32
+# seconds
+TELEGRAM_CONNECT_TIMEOUT = 5
+TELEGRAM_READ_TIMEOUT = 60
+
+# viber API client: size of connection pool, timeouts in seconds,
+# number of retries after 5xx and connection errors, first delay of retry
+VIBER_POOL_MAXSIZE = 32
+VIBER_CONNECT_TIMEOUT = 5
+VIBER_READ_TIMEOUT = 30
+VIBER_MAX_RETRIES = 2
+VIBER_RETRY_BACKOFF = 0.5
+# number of broadcast requests (300 receivers each) sent at the same time
+VIBER_BROADCAST_THREADS = 4
+
+# long lists (messages, subscribers) show total estimated by postgres,
+# if it's more than this, smaller totals are counted exactly
+EXACT_COUNT_LIMIT = 10000
+
+# incoming text messages are saved in bulk by each process, when buffer
+# has SIZE messages or every INTERVAL seconds. Messages, that aren't saved
+# yet, are lost if process is killed
+MESSAGE_WRITE_BEHIND = bool(int(env.get('MESSAGE_WRITE_BEHIND', 0)))
+MESSAGE_BUFFER_SIZE = 100
+MESSAGE_BUFFER_INTERVAL = 0.5
+
+# media of incoming messages is downloaded by celery tasks in this queue,
+# concurrency of its workers limits number of parallel downloads
+MEDIA_DOWNLOAD_QUEUE = env.get('MEDIA_DOWNLOAD_QUEUE', 'celery')
+MEDIA_DOWNLOAD_MAX_RETRIES = 3
+# seconds
+MEDIA_DOWNLOAD_TIMEOUT = 60
+MEDIA_DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+# number of threads, that send messages of one mailing,
+# speed of sending is limited by rate limits above
+MAILING_SENDER_THREADS = 16
+# number of receivers, that are sent by one celery task
+MAILING_CHUNK_SIZE = 500
+# info about sent messages is saved in bulk, when buffer has SIZE objects
+# or INTERVAL seconds passed
+SENT_MESSAGES_BUFFER_SIZE = 200
+SENT_MESSAGES_BUFFER_INTERVAL = 2.0
+
+# analytics pages read statistics of days from DailyBotStats, celery beat
+# updates them for the last ROLLUP_DAYS days every ROLLUP_INTERVAL seconds
+# (celery -A bots_settings beat). Before turning it on fill old days:
+# python manage.py backfill_daily_stats
+ANALYTICS_USE_ROLLUP = bool(int(env.get('ANALYTICS_USE_ROLLUP', 0)))
+ANALYTICS_ROLLUP_DAYS = 2
+ANALYTICS_ROLLUP_INTERVAL = 300
+CELERY_BEAT_SCHEDULE = {
+    'update-daily-stats': {
+        'task': 'analytics.tasks.update_daily_stats',
+        'schedule': ANALYTICS_ROLLUP_INTERVAL,
+    },
+    'delete-old-analytics-exports': {
+        'task': 'analytics.tasks.delete_old_analytics_exports',
+        'schedule': 24 * 60 * 60,
+    },
+}
+
+# xlsx of general analytics for shorter periods is built in the request,
+# other exports are built by celery task. Messages are read by chunks
+ANALYTICS_EXPORT_SYNC_DAYS = 31
+ANALYTICS_EXPORT_CHUNK_SIZE = 2000
+# exports and their files are deleted after this number of days
+ANALYTICS_EXPORT_KEEP_DAYS = 7
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class KeyboardsConfig(AppConfig):
     name = 'keyboards'
     verbose_name = "Клавіатури"
+
+    def ready(self):
+        from keyboards import signals  # noqa: F401
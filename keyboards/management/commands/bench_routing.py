@@ -0,0 +1,65 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from bots_management.benchmarks import measure, summarize, QueryCounter
+from bots_management.services import get_channel_by_slug
+from keyboards.models import Action, Button
+from keyboards.services import (
+    get_button_and_joined_action, get_action_by_name,
+    get_action_id_by_text, get_action_by_pk, invalidate_routing_table
+)
+
+
+class Command(BaseCommand):
+    """
+    Compares resolving of incoming text to action with the old queries
+    and with the routing table.
+
+    python manage.py bench_routing <slug> -n 5000
+    """
+    help = "Measures messages/second of text -> action resolving"
+
+    def add_arguments(self, parser):
+        parser.add_argument("slug")
+        parser.add_argument("-n", "--iterations", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        channel = get_channel_by_slug(options["slug"])
+        if not channel:
+            raise CommandError(f"Channel {options['slug']} does not exist")
+
+        texts = list(Button.objects.filter(
+            keyboard__channel=channel
+        ).values_list("text", flat=True))
+        texts += list(Action.objects.filter(
+            keyboard_to_represent__channel=channel
+        ).values_list("name", flat=True))
+        # users often write text, that isn't a button
+        texts += [f"unknown text {i}" for i in range(len(texts) // 4 + 1)]
+
+        def old_lookup(i):
+            text = texts[i % len(texts)]
+            tag = get_button_and_joined_action(text, channel_slug=channel.slug)
+            actions = get_action_by_name(text, channel_slug=channel.slug)
+            if tag.exists():
+                return tag.first().action
+            elif actions.exists():
+                return actions.first()
+
+        def routing_table_lookup(i):
+            text = texts[i % len(texts)]
+            action_id = get_action_id_by_text(text, channel_id=channel.id)
+            if action_id:
+                return get_action_by_pk(action_id)
+
+        invalidate_routing_table(channel.id)
+        for title, lookup in (("queries", old_lookup),
+                              ("routing table", routing_table_lookup)):
+            counter = QueryCounter()
+            with connection.execute_wrapper(counter):
+                durations = measure(lookup, options["iterations"])
+            self.stdout.write(summarize(title, durations))
+            self.stdout.write(
+                f"    {counter.count / options['iterations']:.2f} "
+                f"queries per message"
+            )
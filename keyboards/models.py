@@ -1,3 +1,7 @@
+import json
+
+from django.conf import settings
+from django.core.cache import cache
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.db import models
 from django.urls import reverse
@@ -19,6 +23,11 @@ class Keyboard(models.Model):
         verbose_name="Колір фону (тільки Viber)",
         null=True, blank=True, max_length=7
     )
+    # increased on every change of keyboard or its buttons,
+    # it's a part of the cache key of ready keyboards for messengers
+    version = models.PositiveIntegerField(
+        verbose_name="Версія", default=1, editable=False
+    )
 
     class Meta:
         verbose_name = "Клавіатура"
@@ -29,7 +38,33 @@ class Keyboard(models.Model):
     def __str__(self) -> str:
         return f"Клавіатура: {self.name}"
 
+    def save(self, *args, **kwargs):
+        is_update = not self._state.adding
+        if is_update:
+            self.version = models.F("version") + 1
+        super().save(*args, **kwargs)
+        if is_update:
+            self.refresh_from_db(fields=["version"])
+
+    def get_cached_payload(self, messenger: str, build) -> object:
+        """
+        Returns keyboard for messenger from django cache or
+        builds it with `build()` and saves to cache.
+        """
+        key = f"keyboard:{self.pk}:{self.version}:{messenger}"
+        payload = cache.get(key)
+        if payload is None:
+            payload = build()
+            cache.set(key, payload, settings.KEYBOARD_CACHE_TIMEOUT)
+        return payload
+
     def get_keyboard_params(self) -> dict:
+        """
+        Returns viber keyboard, cached until keyboard or buttons change.
+        """
+        return self.get_cached_payload("viber", self.build_keyboard_params)
+
+    def build_keyboard_params(self) -> dict:
         color = self.bg_color if self.bg_color else "#8074D6"
         data = {
             "Type": "keyboard",
@@ -46,16 +81,29 @@ class Keyboard(models.Model):
         ]
         return buttons_with_params
 
+    def get_telegram_markup(self) -> str:
+        """
+        Returns json of telegram ReplyKeyboardMarkup, cached until
+        keyboard or buttons change.
+        """
+        return self.get_cached_payload("telegram",
+                                       self.build_telegram_markup)
+
+    def build_telegram_markup(self) -> str:
+        keyboard = [
+            [{"text": btn.text} for btn in row]
+            for row in self.get_telegram_buttons()
+        ]
+        return json.dumps({"keyboard": keyboard})
+
     def get_telegram_buttons(self) -> list:
-        all_buttons = self.buttons.all()
-        rows = set(all_buttons.values_list('tg_row', flat=True))
-        buttons = []
-        for i in rows:
-            tmp = all_buttons.filter(tg_row=i)
-            if tmp:
-                tmp = sorted(tmp, key=lambda btn: btn.position)
-                buttons.append(tmp)
-        return buttons
+        """
+        Returns rows of buttons (sorted by tg_row) sorted by position.
+        """
+        rows = {}
+        for btn in self.get_sorted_by_position_buttons_list():
+            rows.setdefault(btn.tg_row, []).append(btn)
+        return [rows[row] for row in sorted(rows)]
 
     def get_sorted_by_position_buttons_list(self) -> list:
         return sorted(self.buttons.all(), key=lambda btn: btn.position)
@@ -124,6 +172,11 @@ class Action(models.Model):
     video = models.FileField(
         upload_to="video", blank=True, null=True, verbose_name="Відео"
     )
+    # path, size, duration, width and height of the video,
+    # they are read when action is saved
+    video_meta = models.JSONField(
+        "Метадані відео", blank=True, null=True, editable=False
+    )
     file = models.FileField(
         upload_to="file", blank=True, null=True, verbose_name="Файл"
     )
@@ -249,6 +302,11 @@ class Button(models.Model):
         verbose_name_plural = "Кнопки"
         ordering = ["-keyboard__id", "position"]
         unique_together = [["keyboard", "position"], ["keyboard", "name"]]
+        # buttons are found by text, that user sent
+        indexes = [
+            models.Index(fields=["text", "keyboard"],
+                         name="button_text_keyboard_idx"),
+        ]
 
     def __str__(self) -> str:
         return f"Кнопка: {self.name}"
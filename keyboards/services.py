@@ -1,11 +1,20 @@
+import logging
+import os
 from typing import Union
 
+from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.db.models import QuerySet, Q
 
+from bots_management.cache import LocalVersionedCache
 from bots_management.models import Channel
 from keyboards.models import Keyboard, Action, Button
 
+logger = logging.getLogger(__name__)
+
+# channel id -> {button text or action name: action id}
+routing_tables = LocalVersionedCache("routing", settings.ROUTING_TABLE_TTL)
+
 
 def get_keyboards_related_to_channel(slug: str) -> QuerySet:
     return Keyboard.objects.filter(channel__slug=slug)
@@ -43,7 +52,9 @@ def get_actions_related_to_channel_by_obj(channel: object) -> QuerySet:
 
 
 def get_action_by_pk(pk: int) -> Union[Action, None]:
-    return Action.objects.filter(pk=pk).first()
+    return Action.objects.select_related(
+        "keyboard_to_represent"
+    ).filter(pk=pk).first()
 
 
 def get_home_action(slug: str) -> Union[Action, None]:
@@ -98,3 +109,79 @@ def get_action_by_name(text: str, channel_slug: str) -> QuerySet:
 
 def get_buttons_related_to_keyboard(keyboard: Keyboard) -> QuerySet:
     return Button.objects.filter(keyboard=keyboard)
+
+
+def build_routing_table(channel_id: int) -> dict:
+    """
+    Returns dict {text: action id} for all buttons and actions of channel.
+    Button text has priority over action name, like in the old lookup.
+    """
+    table = {}
+    buttons = Button.objects.filter(
+        keyboard__channel_id=channel_id
+    ).values_list("text", "action_id")
+    for text, action_id in buttons:
+        table.setdefault(text, action_id)
+    actions = Action.objects.filter(
+        keyboard_to_represent__channel_id=channel_id
+    ).values_list("name", "id")
+    for name, action_id in actions:
+        table.setdefault(name, action_id)
+    return table
+
+
+def get_routing_table(channel_id: int) -> dict:
+    return routing_tables.get(
+        channel_id, lambda: build_routing_table(channel_id)
+    )
+
+
+def get_action_id_by_text(text: str, channel_id: int) -> Union[int, None]:
+    """
+    text: text of the button or name of the action.
+    channel_id: id of related channel.
+    """
+    return get_routing_table(channel_id).get(text)
+
+
+def invalidate_routing_table(channel_id: int) -> None:
+    routing_tables.invalidate(channel_id)
+
+
+def probe_video(path: str) -> dict:
+    """
+    Returns path, size (bytes), duration (seconds), width and height
+    of the video file
+    """
+    # moviepy starts ffmpeg, it's loaded only when video is probed
+    from moviepy.video.io.VideoFileClip import VideoFileClip
+
+    meta = {"path": path, "size": os.path.getsize(path)}
+    try:
+        clip = VideoFileClip(path)
+    except OSError as e:
+        logger.warning(f"Can't read metadata of video {path}: {e}")
+        return meta
+    try:
+        meta["duration"] = clip.duration
+        meta["width"], meta["height"] = clip.size
+    finally:
+        clip.close()
+    return meta
+
+
+def update_video_meta(action: Action) -> None:
+    """
+    Probes video of the action, if it was changed since last probe
+    """
+    if not action.video:
+        return
+    meta = action.video_meta or {}
+    if meta.get("path") == action.video.path:
+        return
+    try:
+        action.video_meta = probe_video(action.video.path)
+    except OSError as e:
+        logger.warning(f"Can't read video of {action}: {e}")
+        return
+    Action.objects.filter(pk=action.pk).update(video_meta=action.video_meta)
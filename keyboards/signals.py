@@ -0,0 +1,44 @@
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from keyboards.models import Keyboard, Action, Button
+from keyboards.services import invalidate_routing_table
+from keyboards.tasks import update_action_video_meta
+
+
+@receiver([post_save, post_delete], sender=Keyboard)
+def keyboard_changed(sender, instance: Keyboard, **kwargs) -> None:
+    invalidate_routing_table(instance.channel_id)
+
+
+@receiver([post_save, post_delete], sender=Button)
+def button_changed(sender, instance: Button, **kwargs) -> None:
+    keyboards = Keyboard.objects.filter(pk=instance.keyboard_id)
+    # new version of keyboard makes cached keyboards for messengers outdated
+    keyboards.update(version=F("version") + 1)
+    keyboard = keyboards.first()
+    if keyboard:
+        invalidate_routing_table(keyboard.channel_id)
+
+
+@receiver([post_save, post_delete], sender=Action)
+def action_changed(sender, instance: Action, **kwargs) -> None:
+    keyboard = Keyboard.objects.filter(
+        pk=instance.keyboard_to_represent_id
+    ).first()
+    if keyboard:
+        invalidate_routing_table(keyboard.channel_id)
+
+
+@receiver(post_save, sender=Action)
+def action_saved(sender, instance: Action, **kwargs) -> None:
+    # metadata of video is read once, senders use it
+    if not instance.video:
+        return
+    if (instance.video_meta or {}).get("path") == instance.video.path:
+        return
+    transaction.on_commit(
+        lambda: update_action_video_meta.delay(action_id=instance.pk)
+    )
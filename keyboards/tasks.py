@@ -0,0 +1,15 @@
+from celery import shared_task
+
+from keyboards.models import Action
+from keyboards.services import update_video_meta
+
+
+@shared_task
+def update_action_video_meta(action_id: int) -> None:
+    """
+    Celery task for reading metadata of video of the action,
+    ffmpeg is started by worker and not by web request.
+    """
+    action = Action.objects.filter(pk=action_id).first()
+    if action:
+        update_video_meta(action)
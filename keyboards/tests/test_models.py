@@ -1,3 +1,6 @@
+import json
+
+from django.core.cache import cache
 from django.test import TestCase
 
 from bots_management.models import Channel
@@ -122,3 +125,68 @@ class ButtonModelTest(TestCase):
         self.assertEqual(b.v_align_for_template(), 20)
         b.height = 1
         self.assertEqual(b.v_align_for_template(), 5)
+
+
+class KeyboardCacheTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        c1 = Channel.objects.create(name="first", slug="first_slug")
+        k = Keyboard.objects.create(name="first_keyboard", channel=c1)
+        a1 = Action.objects.create(
+            name="first_action",
+            keyboard_to_represent=k
+        )
+        Button.objects.create(keyboard=k, action=a1, name="first_button",
+                              text="1", position=2, tg_row=1)
+        Button.objects.create(keyboard=k, action=a1, name="second_button",
+                              text="2", position=1, tg_row=2)
+        Button.objects.create(keyboard=k, action=a1, name="third_button",
+                              text="3", position=3, tg_row=1)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_get_telegram_buttons(self):
+        k = Keyboard.objects.get(name="first_keyboard")
+        rows = [[btn.text for btn in row]
+                for row in k.get_telegram_buttons()]
+        self.assertEqual(rows, [["1", "3"], ["2"]])
+
+    def test_get_telegram_markup(self):
+        k = Keyboard.objects.get(name="first_keyboard")
+        self.assertEqual(
+            json.loads(k.get_telegram_markup()),
+            {"keyboard": [[{"text": "1"}, {"text": "3"}], [{"text": "2"}]]}
+        )
+
+    def test_payloads_are_cached(self):
+        k = Keyboard.objects.get(name="first_keyboard")
+        params = k.get_keyboard_params()
+        markup = k.get_telegram_markup()
+
+        k = Keyboard.objects.get(name="first_keyboard")
+        with self.assertNumQueries(0):
+            self.assertEqual(k.get_keyboard_params(), params)
+            self.assertEqual(k.get_telegram_markup(), markup)
+
+    def test_cache_is_outdated_after_changes(self):
+        k = Keyboard.objects.get(name="first_keyboard")
+        k.get_keyboard_params()
+        k.get_telegram_markup()
+
+        button = Button.objects.get(name="second_button")
+        button.text = "new"
+        button.save()
+        k = Keyboard.objects.get(name="first_keyboard")
+        self.assertIn("new", [
+            btn["Text"] for btn in k.get_keyboard_params()["Buttons"]
+        ])
+        self.assertIn("new", k.get_telegram_markup())
+
+        k.bg_color = "#000000"
+        k.save()
+        self.assertEqual(k.get_keyboard_params()["BgColor"], "#000000")
+
+        button.delete()
+        k = Keyboard.objects.get(name="first_keyboard")
+        self.assertEqual(len(k.get_keyboard_params()["Buttons"]), 2)
@@ -1,12 +1,18 @@
-from django.test import TestCase
+from unittest import mock
 
-from keyboards.models import Keyboard, Action
+from django.test import TestCase, TransactionTestCase
+
+from keyboards.models import Keyboard, Action, Button
 from bots_management.models import Channel
 
 from keyboards.services import (
     get_home_action,
     get_emergency_action,
+    get_routing_table,
+    get_action_id_by_text,
+    routing_tables,
 )
+from keyboards.tasks import update_action_video_meta
 
 
 class ServicesTestCase(TestCase):
@@ -38,3 +44,95 @@ class ServicesTestCase(TestCase):
             keyboard_to_represent=k
         )
         self.assertEqual(get_home_action("second_slug"), action)
+
+
+class RoutingTableTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        c1 = Channel.objects.create(name="first", slug="first_slug")
+        k = Keyboard.objects.create(name="keyboard", channel=c1)
+        a1 = Action.objects.create(name="first_action",
+                                   keyboard_to_represent=k)
+        Action.objects.create(name="second_action", keyboard_to_represent=k)
+        Button.objects.create(keyboard=k, action=a1, name="first_button",
+                              text="second_action", position=1)
+
+        c2 = Channel.objects.create(name="second", slug="second_slug")
+        k2 = Keyboard.objects.create(name="keyboard", channel=c2)
+        Action.objects.create(name="other_action", keyboard_to_represent=k2)
+
+    def setUp(self):
+        routing_tables.clear()
+
+    def test_get_routing_table(self):
+        c1 = Channel.objects.get(slug="first_slug")
+        a1 = Action.objects.get(name="first_action")
+        # button text has priority over action name
+        self.assertEqual(
+            get_routing_table(c1.id),
+            {"first_action": a1.id, "second_action": a1.id}
+        )
+
+    def test_get_action_id_by_text(self):
+        c1 = Channel.objects.get(slug="first_slug")
+        a1 = Action.objects.get(name="first_action")
+        get_routing_table(c1.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_action_id_by_text("first_action", c1.id),
+                             a1.id)
+            self.assertIsNone(get_action_id_by_text("other_action", c1.id))
+
+    def test_invalidated_on_change(self):
+        c1 = Channel.objects.get(slug="first_slug")
+        self.assertIsNone(get_action_id_by_text("new_text", c1.id))
+
+        button = Button.objects.get(name="first_button")
+        button.text = "new_text"
+        button.save()
+        self.assertEqual(get_action_id_by_text("new_text", c1.id),
+                         button.action_id)
+
+        button.delete()
+        self.assertIsNone(get_action_id_by_text("new_text", c1.id))
+
+        action = Action.objects.get(name="second_action")
+        action.name = "renamed_action"
+        action.save()
+        self.assertEqual(get_action_id_by_text("renamed_action", c1.id),
+                         action.id)
+
+
+# video is probed by task after commit
+class VideoMetaTestCase(TransactionTestCase):
+    def setUp(self):
+        c = Channel.objects.create(name="first", slug="first_slug")
+        self.keyboard = Keyboard.objects.create(name="keyboard", channel=c)
+
+    @mock.patch("keyboards.signals.update_action_video_meta")
+    @mock.patch("keyboards.services.probe_video")
+    def test_video_is_probed_once(self, probe_video, task):
+        task.delay.side_effect = update_action_video_meta
+        probe_video.side_effect = lambda path: {"path": path, "duration": 5}
+        action = Action.objects.create(
+            name="video", action_type="video", video="video/1.mp4",
+            keyboard_to_represent=self.keyboard
+        )
+        action.refresh_from_db()
+        self.assertEqual(action.video_meta["duration"], 5)
+
+        action.text = "text"
+        action.save()
+        probe_video.assert_called_once()
+
+        action.video = "video/2.mp4"
+        action.save()
+        self.assertEqual(probe_video.call_count, 2)
+
+    @mock.patch("keyboards.signals.update_action_video_meta")
+    def test_action_without_video(self, task):
+        action = Action.objects.create(
+            name="text", action_type="text",
+            keyboard_to_represent=self.keyboard
+        )
+        self.assertIsNone(action.video_meta)
+        task.delay.assert_not_called()
@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from subscribers.models import Subscriber, Message, HelpReply
+from subscribers.models import Subscriber, Message, HelpReply, MediaBlob
 
 
 @admin.register(Subscriber)
@@ -12,10 +12,18 @@ class SubscriberAdmin(admin.ModelAdmin):
 
 @admin.register(Message)
 class MessageAdmin(admin.ModelAdmin):
-    list_display = ("id", "sender", "created", "is_help_message")
+    list_display = ("id", "sender", "created", "is_help_message",
+                    "media_status")
+    list_filter = ("media_status",)
 
 
 @admin.register(HelpReply)
 class HelpReplyAdmin(admin.ModelAdmin):
     list_display = ("id", "message", "is_started", "is_closed")
     list_filter = ("is_started",)
+
+
+@admin.register(MediaBlob)
+class MediaBlobAdmin(admin.ModelAdmin):
+    list_display = ("id", "file", "size", "ref_count", "created")
+    search_fields = ("sha256", "source_key")
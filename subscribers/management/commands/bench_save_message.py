@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+
+from bots_management.benchmarks import measure, summarize
+from subscribers.models import Subscriber, Message
+from subscribers.services import message_buffer, persist_message
+
+
+class Command(BaseCommand):
+    """
+    Measures saving of incoming text messages one by one and in bulk
+    (MESSAGE_WRITE_BEHIND). Messages are saved for the given subscriber
+    and deleted after the benchmark.
+
+    python manage.py bench_save_message <subscriber_id> -n 5000
+    """
+    help = "Measures throughput of saving incoming messages"
+    message_token = "bench"
+
+    def add_arguments(self, parser):
+        parser.add_argument("subscriber_id", type=int)
+        parser.add_argument("-n", "--iterations", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        sender = Subscriber.objects.filter(
+            pk=options["subscriber_id"]
+        ).first()
+        if not sender:
+            raise CommandError("Subscriber does not exist")
+
+        def save(i):
+            persist_message(Message(sender=sender, text=f"benchmark {i}",
+                                    message_token=self.message_token))
+
+        try:
+            for write_behind in (False, True):
+                with override_settings(MESSAGE_WRITE_BEHIND=write_behind):
+                    durations = measure(save, options["iterations"])
+                    # the rest messages are part of the work
+                    durations[-1] += measure(
+                        lambda i: message_buffer.flush(), 1
+                    )[0]
+                title = "write-behind" if write_behind else "one by one"
+                self.stdout.write(summarize(title, durations))
+        finally:
+            Message.objects.filter(
+                sender=sender, message_token=self.message_token
+            ).delete()
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from subscribers.services import get_media_dedup_stats
+
+
+class Command(BaseCommand):
+    """
+    Shows how much disk space is saved by keeping same media once.
+
+    python manage.py media_dedup_report
+    """
+    help = "Reports dedup ratio of media, that subscribers sent"
+
+    def handle(self, *args, **options):
+        stats = get_media_dedup_stats()
+        self.stdout.write(
+            f"files: {stats['blobs']}, messages with them: "
+            f"{stats['references']}\n"
+            f"stored: {stats['stored_bytes'] / 2 ** 20:.1f} MB, "
+            f"referenced: {stats['referenced_bytes'] / 2 ** 20:.1f} MB\n"
+            f"dedup ratio: {stats['ratio']:.2f}"
+        )
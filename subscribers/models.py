@@ -1,5 +1,5 @@
 from django.contrib.auth import get_user_model
-from django.db import models
+from django.db import models, transaction
 from django.urls import reverse
 
 from bots_management.models import Bot
@@ -32,6 +32,13 @@ class Subscriber(models.Model):
         verbose_name = "Підписник"
         verbose_name_plural = "Підписники"
         unique_together = [["user_id", "messengers_bot"]]
+        # for statistics of bots by dates
+        indexes = [
+            models.Index(fields=["messengers_bot", "is_active", "created"],
+                         name="subscriber_bot_created_idx"),
+            models.Index(fields=["messengers_bot", "is_active", "updated"],
+                         name="subscriber_bot_updated_idx"),
+        ]
 
     def ban_user(self):
         """
@@ -49,6 +56,48 @@ class Subscriber(models.Model):
                        kwargs={"slug": self.user_id})
 
 
+class MediaBlob(models.Model):
+    """
+    Model representing file of media, that subscribers sent.
+    Same media is kept once: it's found by hash of content or by id of
+    the file in messenger (e.g. file_unique_id in telegram).
+    ref_count is number of messages with the file.
+    """
+    sha256 = models.CharField("SHA-256", max_length=64, unique=True)
+    source_key = models.CharField(
+        "ID файлу в месенджері", max_length=250,
+        unique=True, blank=True, null=True
+    )
+    file = models.FileField("Файл", upload_to="message/media")
+    size = models.PositiveBigIntegerField("Розмір", default=0)
+    ref_count = models.PositiveIntegerField("Кількість посилань", default=0)
+    created = models.DateTimeField("Створений", auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Медіафайл"
+        verbose_name_plural = "Медіафайли"
+
+    def __str__(self) -> str:
+        return f"{self.file.name} ({self.ref_count})"
+
+    @classmethod
+    def release(cls, pk: int) -> None:
+        """
+        Decreases number of references to the blob,
+        deletes it with the file, if there are no references
+        """
+        with transaction.atomic():
+            blob = cls.objects.select_for_update().filter(pk=pk).first()
+            if not blob:
+                return
+            blob.ref_count -= 1
+            if blob.ref_count > 0:
+                blob.save(update_fields=["ref_count"])
+                return
+            blob.delete()
+            transaction.on_commit(lambda: blob.file.delete(save=False))
+
+
 class Message(models.Model):
     """
     Model representing message.
@@ -81,9 +130,48 @@ class Message(models.Model):
         verbose_name="Повідомлення про допомогу", default=False
     )
 
+    # media is downloaded by celery task after the message is saved
+    MEDIA_PENDING = "pending"
+    MEDIA_DONE = "done"
+    MEDIA_FAILED = "failed"
+    MEDIA_STATUSES = (
+        (MEDIA_PENDING, "Завантажується"),
+        (MEDIA_DONE, "Завантажено"),
+        (MEDIA_FAILED, "Помилка завантаження"),
+    )
+    media_status = models.CharField(
+        "Статус медіа", max_length=10, choices=MEDIA_STATUSES,
+        blank=True, default=""
+    )
+    # "image" or "file"
+    media_field = models.CharField(
+        "Поле медіа", max_length=10, blank=True, default=""
+    )
+    # id of file in telegram, url of the file is got by it
+    media_file_id = models.CharField(
+        "ID файлу в месенджері", max_length=250, blank=True, default=""
+    )
+    # e.g. "telegram:<file_unique_id>", same media has same key
+    media_source_key = models.CharField(
+        "Ключ медіа", max_length=250, blank=True, default=""
+    )
+    media_blob = models.ForeignKey(
+        MediaBlob, on_delete=models.SET_NULL, blank=True, null=True,
+        verbose_name="Медіафайл", related_name="messages"
+    )
+
     class Meta:
         verbose_name = "Повідомлення"
         verbose_name_plural = "Повідомлення"
+        indexes = [
+            # messages of bot by dates, for statistics
+            models.Index(fields=["sender", "created"],
+                         name="message_sender_created_idx"),
+            # help messages are a small part of all messages
+            models.Index(fields=["sender"],
+                         condition=models.Q(is_help_message=True),
+                         name="message_help_idx"),
+        ]
 
     def __str__(self) -> str:
         return f"{self.text}"
@@ -91,7 +179,13 @@ class Message(models.Model):
     def delete(self, *args, **kwargs):
         """
         deletes files if message is deleted.
+        File of media blob is deleted, when no message uses it.
         """
+        media_blob_id = self.media_blob_id
+        if media_blob_id:
+            super().delete(*args, **kwargs)
+            MediaBlob.release(media_blob_id)
+            return
         if self.file:
             self.file.delete()
         if self.image:
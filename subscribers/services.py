@@ -1,10 +1,34 @@
-from typing import Union
-
-from django.db import ProgrammingError
-from django.db.models import Q, QuerySet, Count
-
+import hashlib
+import json
+from os.path import basename
+from typing import Iterable, Tuple, Union
+from urllib.parse import urlsplit
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files import File
+from django.db import (
+    ProgrammingError, IntegrityError, connection, transaction
+)
+from django.db.models import (
+    Q, QuerySet, Count, F, Sum, ExpressionWrapper, BigIntegerField
+)
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from bots_management.buffers import BulkCreateBuffer
 from bots_management.models import Bot, Channel
-from .models import Subscriber, Message, HelpReply
+from bots_management.services import ChannelContext
+from .models import Subscriber, Message, HelpReply, MediaBlob
+
+# incoming messages, that are saved in bulk (MESSAGE_WRITE_BEHIND)
+message_buffer = BulkCreateBuffer(
+    Message,
+    size=settings.MESSAGE_BUFFER_SIZE,
+    interval=settings.MESSAGE_BUFFER_INTERVAL,
+    background=True,
+)
 
 
 # def get_subscriber(uid: str, bot: Bot) -> Union[Subscriber, None]:
@@ -13,35 +37,122 @@ from .models import Subscriber, Message, HelpReply
 #     ).first()
 
 
-def get_subscriber_viber(user: dict,
-                         channel: Channel) -> Union[Subscriber, None]:
-    return Subscriber.objects.update_or_create(
+def get_subscriber_cache_key(bot_id: int, user_id: Union[str, int]) -> str:
+    return f"subscriber:{bot_id}:{user_id}"
+
+
+def get_profile_hash(profile: dict) -> str:
+    return hashlib.md5(
+        json.dumps(profile, sort_keys=True).encode()
+    ).hexdigest()
+
+
+def upsert_subscriber(bot: Bot, user_id: str,
+                      profile: dict) -> Tuple[int, bool]:
+    """
+    Creates subscriber or updates its profile fields, if they are changed.
+    Returns id of subscriber and True, if it was created.
+    """
+    if connection.vendor != "postgresql":
+        subscriber, created = Subscriber.objects.get_or_create(
+            user_id=user_id, messengers_bot=bot, defaults=profile
+        )
+        if not created and any(getattr(subscriber, field) != value
+                               for field, value in profile.items()):
+            Subscriber.objects.filter(pk=subscriber.pk).update(
+                updated=timezone.now(), **profile
+            )
+        return subscriber.pk, created
+
+    # one query: insert new user or update changed profile,
+    # row isn't touched if nothing changed
+    table = Subscriber._meta.db_table
+    columns = [Subscriber._meta.get_field(field).column for field in profile]
+    now = timezone.now()
+    sql = f"""
+        INSERT INTO {table} (user_id, messengers_bot_id, is_admin,
+                             created, updated, {", ".join(columns)})
+        VALUES (%s, %s, false, %s, %s, {", ".join(["%s"] * len(columns))})
+        ON CONFLICT (user_id, messengers_bot_id) DO UPDATE SET
+            updated = EXCLUDED.updated,
+            {", ".join(f"{c} = EXCLUDED.{c}" for c in columns)}
+        WHERE ({", ".join(f"{table}.{c}" for c in columns)})
+            IS DISTINCT FROM ({", ".join(f"EXCLUDED.{c}" for c in columns)})
+        RETURNING id, xmax = 0
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [user_id, bot.pk, now, now, *profile.values()])
+        row = cursor.fetchone()
+    if row:
+        return row[0], row[1]
+    return Subscriber.objects.filter(
+        user_id=user_id, messengers_bot=bot
+    ).values_list("id", flat=True).get(), False
+
+
+def get_subscriber(bot: Bot, user_id: Union[str, int],
+                   profile: dict) -> Tuple[Subscriber, bool]:
+    """
+    Returns active subscriber of the bot with the profile (name, avatar)
+    and True, if it was created.
+    Id of subscriber and hash of its profile are kept in cache, database
+    is written only when profile or is_active is changed.
+    Other fields of returned subscriber (created, updated, is_admin, info)
+    are deferred, they are loaded from database when they are accessed.
+    """
+    user_id = str(user_id)
+    profile = dict(profile, is_active=True)
+    profile_hash = get_profile_hash(profile)
+    key = get_subscriber_cache_key(bot.pk, user_id)
+    cached = cache.get(key)
+    created = False
+    if cached and cached[1] == profile_hash:
+        subscriber_id = cached[0]
+    else:
+        subscriber_id, created = upsert_subscriber(bot, user_id, profile)
+        cache.set(key, (subscriber_id, profile_hash),
+                  settings.SUBSCRIBER_CACHE_TIMEOUT)
+    values = dict(profile, id=subscriber_id, user_id=user_id,
+                  messengers_bot_id=bot.pk)
+    # from_db takes values in order of fields of the model
+    fields = [field.attname for field in Subscriber._meta.concrete_fields
+              if field.attname in values]
+    subscriber = Subscriber.from_db(Subscriber.objects.db, fields,
+                                    [values[field] for field in fields])
+    subscriber.messengers_bot = bot
+    return subscriber, created
+
+
+def invalidate_subscribers(bot_id: int, user_ids: Iterable) -> None:
+    """
+    Drops cached subscribers, must be called after their is_active,
+    name or avatar is changed without save()
+    """
+    cache.delete_many([get_subscriber_cache_key(bot_id, user_id)
+                       for user_id in user_ids])
+
+
+def get_subscriber_viber(
+        user: dict, channel: ChannelContext) -> Tuple[Subscriber, bool]:
+    return get_subscriber(
+        bot=channel.viber_bot,
         user_id=user.get('id'),
-        messengers_bot=channel.viber_bot,
-        defaults={
-            'user_id': user.get('id'),
+        profile={
             'name': user.get('name'),
             'avatar': user.get('avatar'),
-            'is_active': True,
-            'messengers_bot': channel.viber_bot
         }
     )
 
 
-def get_subscriber_telegram(user: dict,
-                            channel: Channel) -> Union[Subscriber, None]:
+def get_subscriber_telegram(
+        user: dict, channel: ChannelContext) -> Tuple[Subscriber, bool]:
     username = user.get('username')
     if not username:
         username = user.get('first_name')
-    return Subscriber.objects.update_or_create(
+    return get_subscriber(
+        bot=channel.telegram_bot,
         user_id=user.get('id'),
-        messengers_bot=channel.telegram_bot,
-        defaults={
-            'user_id': user.get('id'),
-            'name': username,
-            'is_active': True,
-            'messengers_bot': channel.telegram_bot,
-        }
+        profile={'name': username}
     )
 
 
@@ -100,9 +211,9 @@ def get_num_of_subs_to_messenger(channel: Channel, messenger: str) -> int:
 def get_messages_subscribers_of_channel(slug: str,
                                         messenger: str = 'all') -> QuerySet:
     senders = get_subscribers_of_messenger(slug, messenger)
-    messages = Message.objects.prefetch_related('sender').filter(
-        sender__in=senders
-    )
+    messages = Message.objects.select_related(
+        'sender__messengers_bot__channel'
+    ).filter(sender__in=senders)
     return messages.order_by('-id')
 
 
@@ -161,3 +272,153 @@ def is_telegram_subscriber(subscriber: Subscriber) -> bool:
 
 def is_viber_subscriber(subscriber: Subscriber) -> bool:
     return subscriber.messengers_bot.messenger == "viber"
+
+
+def deactivate_viber_subscribers(user_ids: list, token: str) -> int:
+    """
+    Sets is_active=False to subscribers of viber bot with the token
+    by one query, returns number of them
+    """
+    bot = Bot.objects.filter(messenger="viber", token=token).first()
+    if not bot:
+        return 0
+    updated = Subscriber.objects.filter(
+        user_id__in=user_ids, messengers_bot=bot
+    ).update(is_active=False)
+    invalidate_subscribers(bot.pk, user_ids)
+    return updated
+
+
+class ResponseFile(File):
+    """
+    File, which content is read from streamed http response by chunks,
+    so it isn't kept in memory or in temporary file.
+    sha256 and size of the content are counted while it's read.
+    """
+
+    def __init__(self, response: requests.Response, name: str):
+        super().__init__(response.raw, name)
+        self.response = response
+        self.sha256 = hashlib.sha256()
+        self.read_size = 0
+
+    def chunks(self, chunk_size: int = None):
+        for chunk in self.response.iter_content(
+                chunk_size or settings.MEDIA_DOWNLOAD_CHUNK_SIZE):
+            self.sha256.update(chunk)
+            self.read_size += len(chunk)
+            yield chunk
+
+    def multiple_chunks(self, chunk_size: int = None) -> bool:
+        return True
+
+
+def download_to_file_field(url: str, field) -> ResponseFile:
+    """
+    Streams file from url to storage of the field,
+    model isn't saved. Returns downloaded file.
+    """
+    with requests.get(url, stream=True,
+                      timeout=settings.MEDIA_DOWNLOAD_TIMEOUT) as response:
+        response.raise_for_status()
+        name = basename(urlsplit(url).path)
+        content = ResponseFile(response, name)
+        field.save(name, content, save=False)
+    return content
+
+
+def set_pending_media(message: Message, field: str,
+                      file_id: str = "", source_key: str = "") -> None:
+    """
+    Marks media of the message to be downloaded in background.
+    field: "image" or "file"
+    file_id: id of the file in telegram, if url isn't known yet
+    source_key: id of the media, that is same for same media,
+    e.g. "telegram:<file_unique_id>"
+    """
+    message.media_status = Message.MEDIA_PENDING
+    message.media_field = field
+    message.media_file_id = file_id or ""
+    message.media_source_key = source_key or ""
+
+
+def get_media_blob(source_key: str) -> Union[MediaBlob, None]:
+    if not source_key:
+        return None
+    return MediaBlob.objects.filter(source_key=source_key).first()
+
+
+def download_media_blob(url: str, source_key: str = "") -> MediaBlob:
+    """
+    Downloads file and returns blob with it. If blob with same content
+    exists, downloaded file is deleted and that blob is returned.
+    """
+    blob = MediaBlob()
+    content = download_to_file_field(url, blob.file)
+    blob.sha256 = content.sha256.hexdigest()
+    blob.size = content.read_size
+    blob.source_key = source_key or None
+    try:
+        with transaction.atomic():
+            blob.save()
+        return blob
+    except IntegrityError:
+        # same content or source_key is already saved
+        blob.file.delete(save=False)
+    same_blob = Q(sha256=blob.sha256)
+    if source_key:
+        same_blob |= Q(source_key=source_key)
+    existing = MediaBlob.objects.filter(same_blob).first()
+    if existing and source_key and not existing.source_key:
+        MediaBlob.objects.filter(pk=existing.pk).update(source_key=source_key)
+    return existing
+
+
+def attach_media_blob(message: Message, blob: MediaBlob) -> bool:
+    """
+    Saves file of the blob as media of the message.
+    Returns False, if blob was already deleted.
+    """
+    with transaction.atomic():
+        if not MediaBlob.objects.filter(pk=blob.pk).update(
+                ref_count=F("ref_count") + 1):
+            return False
+        Message.objects.filter(pk=message.pk).update(**{
+            message.media_field: blob.file.name,
+            "media_blob": blob,
+            "media_status": Message.MEDIA_DONE,
+        })
+    return True
+
+
+def get_media_dedup_stats() -> dict:
+    """
+    Returns number of media files and references to them, their sizes
+    and dedup ratio: size of referenced media / size of stored files
+    """
+    stats = MediaBlob.objects.aggregate(
+        blobs=Count("id"),
+        references=Coalesce(Sum("ref_count"), 0),
+        stored_bytes=Coalesce(Sum("size"), 0),
+        referenced_bytes=Coalesce(Sum(ExpressionWrapper(
+            F("size") * F("ref_count"), output_field=BigIntegerField()
+        )), 0),
+    )
+    stats["ratio"] = (stats["referenced_bytes"] / stats["stored_bytes"]
+                      if stats["stored_bytes"] else 1.0)
+    return stats
+
+
+def persist_message(message: Message) -> None:
+    """
+    Saves incoming message. If MESSAGE_WRITE_BEHIND is on, text messages
+    are saved in bulk a bit later. Help messages (operators must see them
+    at once) and messages with media (download task needs id) are saved
+    immediately.
+    """
+    if all([settings.MESSAGE_WRITE_BEHIND,
+            not message.is_help_message,
+            not message.media_status]):
+        message_buffer.add(message)
+    else:
+        message.save()
@@ -0,0 +1,10 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from subscribers.models import Subscriber
+from subscribers.services import invalidate_subscribers
+
+
+@receiver([post_save, post_delete], sender=Subscriber)
+def subscriber_changed(sender, instance: Subscriber, **kwargs) -> None:
+    invalidate_subscribers(instance.messengers_bot_id, [instance.user_id])
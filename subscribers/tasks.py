@@ -0,0 +1,74 @@
+import logging
+
+import requests
+from celery import shared_task
+from django.conf import settings
+from django.db import transaction
+from telebot.apihelper import ApiException
+
+from telegram_api.client import get_bot
+from .models import Message
+from .services import (
+    get_media_blob, download_media_blob, attach_media_blob
+)
+
+logger = logging.getLogger(__name__)
+
+
+def download_media_later(message: Message) -> None:
+    """
+    Starts download of pending media of the message,
+    after the message is saved in db
+    """
+    if message.media_status != Message.MEDIA_PENDING:
+        return
+    transaction.on_commit(lambda: download_message_media.apply_async(
+        kwargs={"message_id": message.pk},
+        queue=settings.MEDIA_DOWNLOAD_QUEUE,
+    ))
+
+
+@shared_task(bind=True, acks_late=True,
+             max_retries=settings.MEDIA_DOWNLOAD_MAX_RETRIES)
+def download_message_media(self, message_id: int) -> None:
+    """
+    Celery task for downloading media of a message from messenger.
+    Number of parallel downloads is limited by concurrency of workers
+    of MEDIA_DOWNLOAD_QUEUE.
+    """
+    message = Message.objects.select_related(
+        "sender__messengers_bot"
+    ).filter(pk=message_id).first()
+    if not message or message.media_status != Message.MEDIA_PENDING:
+        return
+    # same media can be already saved, then it isn't downloaded
+    blob = get_media_blob(message.media_source_key)
+    if blob and attach_media_blob(message, blob):
+        return
+    url = message.url
+    attached, error = False, None
+    try:
+        if message.media_file_id:
+            # telegram gives url of the file by its id
+            url = get_bot(message.sender.messengers_bot.token).get_file_url(
+                message.media_file_id
+            )
+        # blob can be deleted by other process before it's attached,
+        # then the file is downloaded once more
+        for _ in range(2):
+            blob = download_media_blob(url, message.media_source_key)
+            attached = bool(blob) and attach_media_blob(message, blob)
+            if attached:
+                break
+    except (requests.RequestException, ApiException, OSError) as e:
+        if self.request.retries < self.max_retries:
+            raise self.retry(exc=e, countdown=2 ** self.request.retries)
+        error = e
+    if not attached:
+        logger.warning(f"Media of message {message_id} isn't downloaded: "
+                       f"{error or 'file was deleted'}")
+        Message.objects.filter(pk=message_id).update(
+            media_status=Message.MEDIA_FAILED
+        )
+        return
+    Message.objects.filter(pk=message_id).update(url=url)
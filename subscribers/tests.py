@@ -1,3 +1,330 @@
-from django.test import TestCase
+import shutil
+import tempfile
+import unittest
+from unittest import mock
 
-# Create your tests here.
+import requests
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from bots_management.buffers import BulkCreateBuffer
+from bots_management.models import Channel, Bot
+from subscribers.models import Subscriber, Message, MediaBlob
+from subscribers.services import (
+    set_pending_media,
+    get_media_dedup_stats,
+    get_subscriber,
+    upsert_subscriber,
+    deactivate_viber_subscribers,
+    persist_message,
+)
+from subscribers.tasks import download_message_media
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def get_response(content: bytes) -> mock.MagicMock:
+    response = mock.MagicMock()
+    response.__enter__.return_value = response
+    response.iter_content.side_effect = lambda size: [
+        content[i:i + size] for i in range(0, len(content), size)
+    ]
+    return response
+
+
+# files of media blobs are deleted after commit
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, MEDIA_DOWNLOAD_CHUNK_SIZE=2)
+class DownloadMediaTestCase(TransactionTestCase):
+    def setUp(self):
+        c = Channel.objects.create(name="first", slug="first_slug")
+        bot = Bot.objects.create(messenger="viber", channel=c, token="1v")
+        self.subscriber = Subscriber.objects.create(user_id="1",
+                                                    messengers_bot=bot)
+
+    def tearDown(self):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def create_message(self, source_key: str = "") -> Message:
+        message = Message(sender=self.subscriber, message_token="1",
+                          url="https://viber.com/media/photo.jpg")
+        set_pending_media(message, "image", source_key=source_key)
+        message.save()
+        return message
+
+    @mock.patch("subscribers.services.requests.get")
+    def test_download_message_media(self, get):
+        get.return_value = get_response(b"image")
+        message = self.create_message()
+
+        download_message_media(message_id=message.pk)
+        message.refresh_from_db()
+        self.assertEqual(message.media_status, Message.MEDIA_DONE)
+        self.assertEqual(message.image.name, "message/media/photo.jpg")
+        with message.image.open() as image:
+            self.assertEqual(image.read(), b"image")
+
+    @mock.patch("subscribers.services.requests.get")
+    def test_download_failed(self, get):
+        get.side_effect = requests.ConnectionError
+        message = self.create_message()
+
+        with mock.patch.object(download_message_media, "max_retries", 0):
+            download_message_media(message_id=message.pk)
+        message.refresh_from_db()
+        self.assertEqual(message.media_status, Message.MEDIA_FAILED)
+        self.assertFalse(message.image)
+
+    @mock.patch("subscribers.services.requests.get")
+    def test_same_media_is_saved_once(self, get):
+        get.side_effect = lambda *args, **kwargs: get_response(b"image")
+        first, second = self.create_message(), self.create_message()
+        download_message_media(message_id=first.pk)
+        download_message_media(message_id=second.pk)
+
+        blob = MediaBlob.objects.get()
+        self.assertEqual(blob.ref_count, 2)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertEqual(len(blob.file.storage.listdir("message/media")[1]),
+                         1)
+        self.assertEqual(get_media_dedup_stats()["ratio"], 2.0)
+
+        first.delete()
+        blob.refresh_from_db()
+        self.assertEqual(blob.ref_count, 1)
+        self.assertTrue(blob.file.storage.exists(blob.file.name))
+        second.delete()
+        self.assertFalse(MediaBlob.objects.exists())
+        self.assertFalse(blob.file.storage.exists(blob.file.name))
+
+    @mock.patch("subscribers.services.requests.get")
+    def test_media_with_known_source_key_is_not_downloaded(self, get):
+        get.side_effect = lambda *args, **kwargs: get_response(b"sticker")
+        first = self.create_message(source_key="viber:sticker:1")
+        download_message_media(message_id=first.pk)
+        second = self.create_message(source_key="viber:sticker:1")
+        download_message_media(message_id=second.pk)
+
+        get.assert_called_once()
+        self.assertEqual(MediaBlob.objects.get().ref_count, 2)
+
+    @mock.patch("subscribers.tasks.attach_media_blob", return_value=False)
+    @mock.patch("subscribers.services.requests.get")
+    def test_deleted_blob_is_downloaded_again(self, get, attach):
+        get.side_effect = lambda *args, **kwargs: get_response(b"image")
+        message = self.create_message()
+        download_message_media(message_id=message.pk)
+        self.assertEqual(attach.call_count, 2)
+        message.refresh_from_db()
+        self.assertEqual(message.media_status, Message.MEDIA_FAILED)
+
+        attach.side_effect = [False, True]
+        Message.objects.filter(pk=message.pk).update(
+            media_status=Message.MEDIA_PENDING
+        )
+        download_message_media(message_id=message.pk)
+        self.assertEqual(attach.call_count, 4)
+        message.refresh_from_db()
+        self.assertEqual(message.media_status, Message.MEDIA_PENDING)
+
+
+class SubscriberCacheTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        c = Channel.objects.create(name="first", slug="first_slug")
+        cls.bot = Bot.objects.create(messenger="viber", channel=c,
+                                     token="1v")
+
+    def setUp(self):
+        cache.clear()
+
+    def test_subscriber_is_written_only_when_changed(self):
+        subscriber, created = get_subscriber(self.bot, "1", {"name": "a"})
+        self.assertTrue(created)
+        self.assertEqual(subscriber.pk, Subscriber.objects.get().pk)
+
+        with self.assertNumQueries(0):
+            same, created = get_subscriber(self.bot, "1", {"name": "a"})
+        self.assertFalse(created)
+        self.assertEqual(same.pk, subscriber.pk)
+
+        get_subscriber(self.bot, "1", {"name": "b"})
+        self.assertEqual(Subscriber.objects.get().name, "b")
+
+    def test_deactivated_subscriber_is_activated(self):
+        get_subscriber(self.bot, "1", {"name": "a"})
+        deactivate_viber_subscribers(["1"], "1v")
+        self.assertFalse(Subscriber.objects.get().is_active)
+
+        get_subscriber(self.bot, "1", {"name": "a"})
+        self.assertTrue(Subscriber.objects.get().is_active)
+
+        subscriber = Subscriber.objects.get()
+        subscriber.ban_user()
+        get_subscriber(self.bot, "1", {"name": "a"})
+        self.assertTrue(Subscriber.objects.get().is_active)
+
+    def test_other_fields_are_loaded_from_db(self):
+        saved = Subscriber.objects.create(user_id="1", messengers_bot=self.bot,
+                                          name="a", is_admin=True)
+        with self.assertNumQueries(1):
+            subscriber, _ = get_subscriber(self.bot, "1", {"name": "a"})
+        with self.assertNumQueries(0):
+            self.assertEqual(subscriber.messengers_bot, self.bot)
+            self.assertEqual((subscriber.pk, subscriber.name), (saved.pk, "a"))
+        with self.assertNumQueries(1):
+            self.assertTrue(subscriber.is_admin)
+        self.assertEqual(subscriber.created, saved.created)
+
+    def test_upsert_subscriber(self):
+        subscriber_id, created = upsert_subscriber(
+            self.bot, "1", {"name": "a", "is_active": True}
+        )
+        self.assertTrue(created)
+        updated = Subscriber.objects.get(pk=subscriber_id).updated
+
+        self.assertEqual(
+            upsert_subscriber(self.bot, "1", {"name": "a", "is_active": True}),
+            (subscriber_id, False)
+        )
+        self.assertEqual(Subscriber.objects.get().updated, updated)
+
+        self.assertEqual(
+            upsert_subscriber(self.bot, "1", {"name": "b", "is_active": True}),
+            (subscriber_id, False)
+        )
+        subscriber = Subscriber.objects.get()
+        self.assertEqual(subscriber.name, "b")
+        self.assertGreater(subscriber.updated, updated)
+        self.assertFalse(subscriber.is_admin)
+
+
+@unittest.skipUnless(connection.vendor == "postgresql",
+                     "INSERT ... ON CONFLICT is used by postgres only")
+class PostgresUpsertSubscriberTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        c = Channel.objects.create(name="first", slug="first_slug")
+        cls.bot = Bot.objects.create(messenger="viber", channel=c,
+                                     token="1v")
+
+    def setUp(self):
+        self.profile = {"name": "a", "avatar": None, "is_active": True}
+
+    def test_new_subscriber_is_inserted(self):
+        with self.assertNumQueries(1):
+            subscriber_id, created = upsert_subscriber(self.bot, "1",
+                                                       self.profile)
+        self.assertTrue(created)
+        subscriber = Subscriber.objects.get()
+        self.assertEqual(subscriber.pk, subscriber_id)
+        self.assertEqual(subscriber.name, "a")
+        self.assertIsNotNone(subscriber.created)
+        self.assertIsNotNone(subscriber.updated)
+
+    def test_unchanged_profile_is_not_written(self):
+        subscriber_id, _ = upsert_subscriber(self.bot, "1", self.profile)
+        updated = Subscriber.objects.get().updated
+        # row isn't changed, it's id is selected
+        with self.assertNumQueries(2):
+            self.assertEqual(upsert_subscriber(self.bot, "1", self.profile),
+                             (subscriber_id, False))
+        self.assertEqual(Subscriber.objects.get().updated, updated)
+
+    def test_changed_profile_is_updated(self):
+        subscriber_id, _ = upsert_subscriber(self.bot, "1", self.profile)
+        updated = Subscriber.objects.get().updated
+        profile = dict(self.profile, name="b", is_active=False)
+        with self.assertNumQueries(1):
+            self.assertEqual(upsert_subscriber(self.bot, "1", profile),
+                             (subscriber_id, False))
+        subscriber = Subscriber.objects.get()
+        self.assertEqual(subscriber.name, "b")
+        self.assertFalse(subscriber.is_active)
+        self.assertGreater(subscriber.updated, updated)
+
+
+@override_settings(MESSAGE_WRITE_BEHIND=True)
+class PersistMessageTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        c = Channel.objects.create(name="first", slug="first_slug")
+        bot = Bot.objects.create(messenger="viber", channel=c, token="1v")
+        cls.subscriber = Subscriber.objects.create(user_id="1",
+                                                   messengers_bot=bot)
+
+    def setUp(self):
+        self.buffer = BulkCreateBuffer(Message, size=2, interval=60)
+        patcher = mock.patch("subscribers.services.message_buffer",
+                             self.buffer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def create_message(self, **kwargs) -> Message:
+        message = Message(sender=self.subscriber, message_token="1",
+                          **kwargs)
+        persist_message(message)
+        return message
+
+    def test_text_messages_are_saved_in_bulk(self):
+        self.create_message(text="first")
+        self.assertFalse(Message.objects.exists())
+        with self.assertNumQueries(1):
+            self.create_message(text="second")
+        self.assertEqual(Message.objects.count(), 2)
+        self.assertEqual(len(self.buffer), 0)
+
+    def test_help_and_media_messages_are_saved_at_once(self):
+        self.create_message(text="/help", is_help_message=True)
+        message = Message(sender=self.subscriber, message_token="2",
+                          url="https://viber.com/media/photo.jpg")
+        set_pending_media(message, "image")
+        persist_message(message)
+        self.assertIsNotNone(message.pk)
+        self.assertEqual(Message.objects.count(), 2)
+        self.assertEqual(len(self.buffer), 0)
+
+    @override_settings(MESSAGE_WRITE_BEHIND=False)
+    def test_write_behind_is_off(self):
+        message = self.create_message(text="first")
+        self.assertIsNotNone(message.pk)
+
+
+class SubscriberMessagesListViewTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        get_user_model().objects.create_superuser(username="super",
+                                                  password="1234")
+        c = Channel.objects.create(name="first", slug="first_slug")
+        bot = Bot.objects.create(messenger="viber", channel=c, token="1v")
+        subscriber = Subscriber.objects.create(user_id="1",
+                                               messengers_bot=bot)
+        cls.messages = [
+            Message.objects.create(sender=subscriber, message_token=str(i),
+                                   text=str(i))
+            for i in range(3)
+        ]
+
+    @mock.patch("subscribers.views.SubscriberMessagesListView.paginate_by",
+                2)
+    def test_next_page_by_cursor(self):
+        self.client.login(username="super", password="1234")
+        url = "/subscribers/first_slug/messages/all"
+        response = self.client.get(url)
+        page = response.context["page_obj"]
+        self.assertEqual(list(page), self.messages[:0:-1])
+        self.assertEqual(page.count, 3)
+        self.assertContains(response, f"?after={self.messages[1].pk}")
+
+        response = self.client.get(url, {"after": page.next_cursor})
+        self.assertEqual(list(response.context["messages"]),
+                         self.messages[:1])
+
+        # cursor after the oldest message shows the last page
+        response = self.client.get(url, {"after": self.messages[0].pk})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.context["messages"]),
+                         self.messages[1::-1])
@@ -4,6 +4,7 @@ from django.utils import timezone
 from django.views import generic
 
 from bots_management.mixins import ModeratorRequiredMixin
+from bots_management.pagination import KeysetPaginationMixin
 from bots_management.services import get_channel_by_slug
 from keyboards.services import get_actions_related_to_channel
 from subscribers.forms import (
@@ -18,7 +19,8 @@ from subscribers.services import (
 )
 
 
-class SubscribersListView(ModeratorRequiredMixin, generic.ListView):
+class SubscribersListView(ModeratorRequiredMixin, KeysetPaginationMixin,
+                          generic.ListView):
     """
     List of all subscribers of a particular channel.
     """
@@ -77,7 +79,8 @@ class SubscriberUpdateView(ModeratorRequiredMixin, generic.UpdateView):
         return context
 
 
-class SubscriberMessagesListView(ModeratorRequiredMixin, generic.ListView):
+class SubscriberMessagesListView(ModeratorRequiredMixin,
+                                 KeysetPaginationMixin, generic.ListView):
     """
     List of all message subscribers of a particular channel.
     """
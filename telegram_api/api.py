@@ -1,20 +1,17 @@
-import json
 import logging
 from typing import Union
 
-import requests
-
 from django.conf import settings
 
-from telebot import TeleBot
 from telebot.types import ReplyKeyboardMarkup, Message
 from telebot.apihelper import ApiException
 
-from moviepy.editor import VideoFileClip
-
 from bots_management.models import Bot
 from keyboards.models import IdFilesInMessenger
 from subscribers.models import Subscriber
+from subscribers.services import invalidate_subscribers
+from .client import get_bot, request
+from .rate_limit import rate_limiter
 
 
 logger = logging.getLogger(__name__)
@@ -24,7 +21,7 @@ def get_webhook_info(token: str) -> dict:
     """
     Get information about tg webhook
     """
-    res = requests.get(settings.TELEGRAM_BASE_URL % (token, "getWebhookInfo"))
+    res = request(token, "getWebhookInfo")
     return res.json().get('result')
 
 
@@ -32,62 +29,109 @@ def get_bot_info(token: str) -> dict:
     """
         Get information about tg bot
     """
-    res = requests.get(settings.TELEGRAM_BASE_URL % (token, "getMe"))
+    res = request(token, "getMe")
     return res.json().get('result')
 
 
+def get_error_description(error: ApiException) -> Union[str, None]:
+    """
+    Returns description of error from response of telegram API
+    """
+    try:
+        return error.result.json().get('description')
+    except (AttributeError, ValueError):
+        return
+
+
+def get_retry_after(error: ApiException) -> Union[int, None]:
+    """
+    Returns number of seconds to wait, if telegram API
+    answered 429 "Too Many Requests"
+    """
+    result = getattr(error, 'result', None)
+    if result is None or result.status_code != 429:
+        return
+    try:
+        return result.json().get('parameters', {}).get('retry_after', 1)
+    except ValueError:
+        return 1
+
+
 def checking_send_message(function):
     """
-    decorator for logging sending message in telegram
+    decorator for logging sending message in telegram.
+    Inside rate_limiter.throttling() (mailings) waits for rate limits
+    of the bot and the chat before each request and repeats request
+    after 429 "Too Many Requests". Other requests (webhook replies)
+    only take their slots, so web workers don't sleep.
     """
     def send_message_with_check(*arg, **kwargs):
-        try:
-            return function(*arg, **kwargs)
-        except ApiException as e:
-            e = str(e)
-            response = json.loads(
-                e[e.index('{'):e.index('}')+1]
-            ).get('description')
-            if response == 'Forbidden: bot was blocked by the user':
-                bot = Bot.objects.filter(token=kwargs.get('token')).first()
-                subscriber = Subscriber.objects.filter(
-                    user_id=kwargs.get('chat_id'),
-                    messengers_bot=bot,
-                )
-                if subscriber.exists():
-                    subscriber.update(is_active=False)
-                    # TODO it's works, but don't save changes in db
+        token = kwargs.get('token')
+        chat_id = kwargs.get('chat_id')
+        throttled = rate_limiter.throttled
+        retries = settings.TELEGRAM_MAX_RETRIES if throttled else 0
+        for attempt in range(retries + 1):
+            if throttled:
+                rate_limiter.wait(token, chat_id)
+            else:
+                rate_limiter.reserve(token, chat_id)
+            try:
+                return function(*arg, **kwargs)
+            except ApiException as e:
+                retry_after = get_retry_after(e)
+                if retry_after:
+                    # all workers of the bot will wait retry_after
+                    rate_limiter.block(token, retry_after)
+                if retry_after and attempt < retries:
                     logger.warning(
-                        f"""User {subscriber} unsubscribed (is_active=False)"""
+                        f"""Send {function.__name__} to {chat_id} is
+                        limited, retry after {retry_after} s."""
                     )
-            logger.warning(
-                f"""Send {function.__name__} to {kwargs.get('chat_id')} failed.
-                token: {kwargs.get('token')}.
-                Error: {e}"""
-            )
-        except Exception as e:
-            logger.critical(
-                f"""Send {function.__name__} to {kwargs.get('chat_id')} failed.
-                token: {kwargs.get('token')}.
-                Error: {e}"""
-            )
+                    continue
+                response = get_error_description(e)
+                if response == 'Forbidden: bot was blocked by the user':
+                    bot = Bot.objects.filter(token=token).first()
+                    subscriber = Subscriber.objects.filter(
+                        user_id=chat_id,
+                        messengers_bot=bot,
+                    )
+                    if subscriber.exists():
+                        subscriber.update(is_active=False)
+                        invalidate_subscribers(bot.pk, [chat_id])
+                        # TODO it's works, but don't save changes in db
+                        logger.warning(
+                            f"""User {subscriber} unsubscribed """
+                            f"""(is_active=False)"""
+                        )
+                logger.warning(
+                    f"""Send {function.__name__} to {chat_id} failed.
+                    token: {token}.
+                    Error: {e}"""
+                )
+            except Exception as e:
+                logger.critical(
+                    f"""Send {function.__name__} to {chat_id} failed.
+                    token: {token}.
+                    Error: {e}"""
+                )
+            return
     return send_message_with_check
 
 
 @checking_send_message
 def send_message(chat_id: int, text: str, token: str,
-                 reply_markup: ReplyKeyboardMarkup = None,
+                 reply_markup: Union[ReplyKeyboardMarkup, str] = None,
                  **kwargs) -> Message:
     """Sends `sendMessage` API request to the telegramAPI.
 
     chat_id: Id of the chat.
     text: Text of the message.
-    reply_markup: Instance of the `InlineKeyboardMarkup`.
+    reply_markup: Instance of the `InlineKeyboardMarkup` or its json.
     token: bot's token
 
     Returns: None.
     """
-    response: Message = TeleBot(token).send_message(
+    response: Message = get_bot(token).send_message(
         chat_id=chat_id,
         text=text,
         reply_markup=reply_markup
@@ -132,15 +176,15 @@ def send_media_with_id(chat_id: int, token: str,
     send media in telegram if we have file_id
     """
     if media_type == 'photo':
-        response: Message = TeleBot(token).send_photo(
+        response: Message = get_bot(token).send_photo(
             chat_id=chat_id, photo=file_id
         )
     if media_type == 'video':
-        response: Message = TeleBot(token).send_video(
+        response: Message = get_bot(token).send_video(
             chat_id=chat_id, data=file_id
         )
     if media_type == 'document':
-        response: Message = TeleBot(token).send_document(
+        response: Message = get_bot(token).send_document(
             chat_id=chat_id, data=file_id
         )
     return response
@@ -155,20 +199,22 @@ def send_media_without_id(chat_id: int, token: str,
     """
     if media_type == 'photo':
         with open(file_path, 'rb') as file:
-            response: Message = TeleBot(token).send_photo(
+            response: Message = get_bot(token).send_photo(
                 chat_id=chat_id, photo=file
             )
             file_id = response.json.get('photo')[-1].get('file_id')
     if media_type == 'video':
+        # duration is read when action is saved
+        duration = (getattr(action, 'video_meta', None) or {}).get('duration')
         with open(file_path, 'rb') as file:
-            clip = VideoFileClip(file_path)
-            response: Message = TeleBot(token).send_video(
-                chat_id=chat_id, data=file, duration=clip.duration
+            response: Message = get_bot(token).send_video(
+                chat_id=chat_id, data=file,
+                duration=int(duration) if duration else None
             )
             file_id = response.json.get('video').get('file_id')
     if media_type == 'document':
         with open(file_path, 'rb') as file:
-            response: Message = TeleBot(token).send_document(
+            response: Message = get_bot(token).send_document(
                 chat_id=chat_id, data=file
             )
             file_id = response.json.get('document').get('file_id')
@@ -188,7 +234,7 @@ def send_location(chat_id: int, token: str,
 
     Returns: None.
     """
-    response: Message = TeleBot(token).send_location(
+    response: Message = get_bot(token).send_location(
         chat_id=chat_id,
         longitude=lon,
         latitude=lat
@@ -211,7 +257,7 @@ def send_sticker(chat_id: int, token: str,
     if sticker_id:
         sticker_id = sticker_id.split('//')
         if len(sticker_id) == 2:
-            response = TeleBot(token).send_sticker(
+            response = get_bot(token).send_sticker(
                 chat_id=chat_id, data=sticker_id[1]
             )
             return response
@@ -226,7 +272,8 @@ def delete_message(chat_id: Union[str, int], message_id: int,
     :param message_id: Id of a message.
     :param token: Bot`s token
     """
-    response = TeleBot(token).delete_message(chat_id=chat_id, message_id=message_id)
+    response = get_bot(token).delete_message(chat_id=chat_id,
+                                             message_id=message_id)
     return response
 
 
@@ -235,10 +282,9 @@ def set_webhook_ajax(slug: str, host: str, token: str) -> dict:
     Sets telegram webhook for certain channel.
     """
     webhook = f"https://{host}/telegram_prod/{slug}/"
-    url = f"https://api.telegram.org/bot{token}/setWebhook?url={webhook}"
-    response = requests.get(url)
+    response = request(token, "setWebhook", url=webhook)
     logger.warning(
-        f"""Set telegram-webhook with ajax {url}.
+        f"""Set telegram-webhook with ajax {webhook}.
             token {token}. Answer: {response.text}"""
     )
     return response.json()
@@ -249,10 +295,9 @@ def unset_webhook_ajax(token: str) -> dict:
     Sets telegram webhook for certain channel.
     """
     webhook = ""
-    url = f"https://api.telegram.org/bot{token}/setWebhook?url={webhook}"
-    response = requests.get(url)
+    response = request(token, "setWebhook", url=webhook)
     logger.warning(
-        f"""Set telegram-webhook with ajax {url}.
+        f"""Set telegram-webhook with ajax {webhook}.
             token {token}. Answer: {response.text}"""
     )
     return response.json()
@@ -0,0 +1,77 @@
+"""
+HTTP client of telegram API.
+
+All requests of a process go through one requests.Session with a pool of
+keep-alive connections, so TLS handshake is done once per connection and
+not per message. pyTelegramBotAPI uses the same session.
+"""
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+from telebot import TeleBot, apihelper
+
+_bots: dict = {}
+_lock = threading.Lock()
+_session = None
+_session_pid = None
+
+
+def create_session() -> requests.Session:
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=settings.TELEGRAM_POOL_CONNECTIONS,
+        pool_maxsize=settings.TELEGRAM_POOL_MAXSIZE,
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_session() -> requests.Session:
+    """
+    Returns session of the process. Connections can't be shared with
+    forked processes (e.g. celery workers), so new session is created
+    after fork.
+    """
+    global _session, _session_pid
+    if _session_pid != os.getpid():
+        with _lock:
+            if _session_pid != os.getpid():
+                _session = create_session()
+                _session_pid = os.getpid()
+                _bots.clear()
+                apihelper.session = _session
+                apihelper.CONNECT_TIMEOUT = settings.TELEGRAM_CONNECT_TIMEOUT
+                apihelper.READ_TIMEOUT = settings.TELEGRAM_READ_TIMEOUT
+                # session of current thread is cached by apihelper
+                apihelper._get_req_session(reset=True)
+    return _session
+
+
+def get_bot(token: str) -> TeleBot:
+    """
+    Returns bot of the token, one bot is created per token
+    """
+    get_session()
+    bot = _bots.get(token)
+    if bot is None:
+        with _lock:
+            # threaded bot starts pool of threads for polling,
+            # we don't need it for requests
+            bot = _bots.setdefault(token, TeleBot(token, threaded=False))
+    return bot
+
+
+def request(token: str, method: str, **params) -> requests.Response:
+    """
+    Sends request to `method` of telegram API
+    """
+    return get_session().get(
+        settings.TELEGRAM_BASE_URL % (token, method),
+        params=params,
+        timeout=(settings.TELEGRAM_CONNECT_TIMEOUT,
+                 settings.TELEGRAM_READ_TIMEOUT),
+    )
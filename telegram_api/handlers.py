@@ -5,11 +5,11 @@ from django.conf import settings
 from telebot.types import Message
 
 from bots_management.models import Channel
-from keyboards.models import Action, Keyboard
+from keyboards.models import Action
 from keyboards.services import (
     get_home_action, get_emergency_action
 )
-from bots_management.services import get_channel_by_slug
+from bots_management.services import ChannelContext, get_channel_context
 from .api import (
     send_message
 )
@@ -27,7 +27,8 @@ def event_handler_tg(incoming_data: dict, channel_slug: str) -> None:
     """
     main handler
     """
-    channel = get_channel_by_slug(slug=channel_slug)
+    # channel with bots is resolved once per slug and cached
+    channel = get_channel_context(slug=channel_slug)
     message = incoming_data.get("message")
     if message:
         uid = message["chat"]["id"]
@@ -40,7 +41,7 @@ def event_handler_tg(incoming_data: dict, channel_slug: str) -> None:
                 need_action = False
             elif message.get("text").startswith("/"):
                 sys_action_handler(
-                    in_data=incoming_data, channel_slug=channel_slug
+                    in_data=incoming_data, channel=channel
                 )
                 need_action = False
         if need_action:
@@ -60,13 +61,17 @@ def event_handler_tg(incoming_data: dict, channel_slug: str) -> None:
         return
 
 
-def action_handler(uid: str, channel: Channel, action: Action) -> list:
+def action_handler(uid: str, channel: Union[Channel, ChannelContext],
+                   action: Action,
+                   token: str = None, file_id: str = None) -> list:
     """
         Prepare data for message and send answer message
         separate sending media and text (if they are in one action)
+        token: token of the channel's bot, if it's already known
+        file_id: id of media of the action in telegram, if it's known
     """
     data = {
-        'token': channel.telegram_token,
+        'token': token or channel.telegram_token,
         'chat_id': uid,
     }
     response = []
@@ -78,7 +83,9 @@ def action_handler(uid: str, channel: Channel, action: Action) -> list:
         if action.name == 'Виклик 102':
             data['reply_markup'] = create_inline_markup(action)
         if action_type != "text":
-            response.append(send_message_with_media(data, action))
+            response.append(
+                send_message_with_media(data, action, file_id)
+            )
         if action.text:
             # data['reply_markup'] = create_markup(action)
             response.append(send_message(
@@ -93,7 +100,7 @@ def action_handler(uid: str, channel: Channel, action: Action) -> list:
     return response
 
 
-def help_message_handler(in_data: dict, channel_slug: str) -> None:
+def help_message_handler(in_data: dict, channel: ChannelContext) -> None:
     """
     Sends message to user, that his help message was sent and
     moderator will contact him
@@ -101,44 +108,41 @@ def help_message_handler(in_data: dict, channel_slug: str) -> None:
     # TODO create help message and send notification to moderator
 
     action: Union[Action, None] = get_emergency_action(
-        channel_slug=channel_slug
+        channel_slug=channel.slug
     )
 
     if not action:
-        action: Action = get_home_action(slug=channel_slug)
-
-    keyboard: Keyboard = action.keyboard_to_represent
+        action: Action = get_home_action(slug=channel.slug)
 
     send_message(
         chat_id=in_data["message"]["chat"]["id"],
         text=action.text,
         reply_markup=create_markup(action),
-        token=keyboard.channel.telegram_token
+        token=channel.telegram_token
     )
 
 
-def sys_action_handler(in_data: dict, channel_slug: str) -> None:
+def sys_action_handler(in_data: dict, channel: ChannelContext) -> None:
     """
         handler for command starts with '/'
     """
     if in_data["message"]["text"][:5].upper() == "/HELP":
-        help_message_handler(in_data=in_data, channel_slug=channel_slug)
-        save_message(channel=get_channel_by_slug(channel_slug),
+        help_message_handler(in_data=in_data, channel=channel)
+        save_message(channel=channel,
                      in_data=in_data,
                      is_help_message=True)
     # TODO if other system commands add elif
     else:
-        action: Action = get_home_action(slug=channel_slug)
-        keyboard: Keyboard = action.keyboard_to_represent
+        action: Action = get_home_action(slug=channel.slug)
         send_message(
             chat_id=in_data["message"]["chat"]["id"],
             text=action.text,
             reply_markup=create_markup(action),
-            token=keyboard.channel.telegram_token
+            token=channel.telegram_token
         )
 
 
-def subscribed_handler(in_data: dict, channel: object) -> None:
+def subscribed_handler(in_data: dict, channel: ChannelContext) -> None:
     """
         Handler for saving new/returned subscribers
     """
@@ -0,0 +1,194 @@
+"""
+Rate limiting of requests to telegram API.
+
+Telegram allows about 30 messages per second for one bot and about
+1 message per second in one chat. Each limit is a bucket (GCRA): every
+request reserves the next free slot of the bucket. Mailings sleep until
+the slot, webhook replies only take it and don't block the web worker.
+Buckets are kept in redis, so all processes and celery workers share them,
+if redis isn't available they are kept in memory of the process.
+"""
+import hashlib
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Union
+
+import redis
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# KEYS[1] - bucket, ARGV - now, interval between requests, burst
+RESERVE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local interval = tonumber(ARGV[2])
+local burst = tonumber(ARGV[3])
+local tat = tonumber(redis.call('GET', KEYS[1]) or ARGV[1])
+if tat < now then tat = now end
+local wait = tat - (burst - 1) * interval - now
+if wait < 0 then wait = 0 end
+local new_tat = tat + interval
+local ttl = math.ceil((new_tat - now) * 1000) + 1000
+redis.call('SET', KEYS[1], tostring(new_tat), 'PX', ttl)
+return tostring(wait)
+"""
+
+# KEYS[1] - bucket, ARGV - now, time when requests are allowed again
+BLOCK_SCRIPT = """
+local now = tonumber(ARGV[1])
+local blocked_until = tonumber(ARGV[2])
+local tat = tonumber(redis.call('GET', KEYS[1]) or ARGV[1])
+if tat < blocked_until then
+    local ttl = math.ceil((blocked_until - now) * 1000) + 1000
+    redis.call('SET', KEYS[1], tostring(blocked_until), 'PX', ttl)
+end
+return 1
+"""
+
+
+class MemoryBuckets:
+    """
+    Buckets in memory of the process.
+    Buckets with time in the past are empty and are removed
+    every `prune_interval` seconds.
+    """
+    prune_interval = 60
+
+    def __init__(self):
+        self._tats = {}
+        self._lock = threading.Lock()
+        self._prune_at = 0.0
+
+    def _prune(self, now: float) -> None:
+        # called with lock held
+        if now < self._prune_at:
+            return
+        self._tats = {key: tat for key, tat in self._tats.items()
+                      if tat > now}
+        self._prune_at = now + self.prune_interval
+
+    def reserve(self, key: str, rate: float, burst: int) -> float:
+        """
+        Reserves slot in bucket `key`.
+        Returns number of seconds to wait before the request.
+        """
+        interval = 1.0 / rate
+        now = time.time()
+        with self._lock:
+            self._prune(now)
+            tat = max(self._tats.get(key, now), now)
+            self._tats[key] = tat + interval
+        return max(tat - (burst - 1) * interval - now, 0.0)
+
+    def block(self, key: str, seconds: float) -> None:
+        """
+        Forbids requests to bucket `key` for `seconds`.
+        """
+        now = time.time()
+        blocked_until = now + seconds
+        with self._lock:
+            self._prune(now)
+            if self._tats.get(key, 0) < blocked_until:
+                self._tats[key] = blocked_until
+
+
+class RedisBuckets:
+    """
+    Buckets in redis, shared by all processes.
+    """
+
+    def __init__(self, url: str):
+        self.client = redis.Redis.from_url(
+            url, socket_timeout=1, socket_connect_timeout=1
+        )
+        self._reserve = self.client.register_script(RESERVE_SCRIPT)
+        self._block = self.client.register_script(BLOCK_SCRIPT)
+
+    def reserve(self, key: str, rate: float, burst: int) -> float:
+        wait = self._reserve(keys=[key],
+                             args=[time.time(), 1.0 / rate, burst])
+        return float(wait)
+
+    def block(self, key: str, seconds: float) -> None:
+        now = time.time()
+        self._block(keys=[key], args=[now, now + seconds])
+
+
+class TelegramRateLimiter:
+    """
+    Limits requests of each bot and requests to each chat of the bot.
+    """
+
+    # seconds to use memory buckets after redis error
+    redis_retry_delay = 30
+
+    def __init__(self, redis_url: Union[str, None] = None):
+        self.memory = MemoryBuckets()
+        self.redis = RedisBuckets(redis_url) if redis_url else None
+        self._redis_retry_at = 0.0
+        self._local = threading.local()
+
+    @staticmethod
+    def _bot_key(token: str) -> str:
+        # don't keep tokens in redis
+        return "tg_rate:" + hashlib.sha1(token.encode()).hexdigest()[:16]
+
+    def _call(self, method: str, *args):
+        if self.redis and time.monotonic() >= self._redis_retry_at:
+            try:
+                return getattr(self.redis, method)(*args)
+            except redis.RedisError as e:
+                self._redis_retry_at = (time.monotonic() +
+                                        self.redis_retry_delay)
+                logger.warning(f"Rate limiter uses memory, redis error: {e}")
+        return getattr(self.memory, method)(*args)
+
+    def reserve(self, token: str, chat_id: Union[int, str, None]) -> float:
+        """
+        Returns number of seconds to wait before the request.
+        """
+        bot_key = self._bot_key(token)
+        wait = self._call("reserve", bot_key,
+                          settings.TELEGRAM_BOT_RATE, 1)
+        if chat_id is not None:
+            wait = max(wait, self._call(
+                "reserve", f"{bot_key}:{chat_id}",
+                settings.TELEGRAM_CHAT_RATE, settings.TELEGRAM_CHAT_BURST
+            ))
+        return wait
+
+    @contextmanager
+    def throttling(self):
+        """
+        Requests of the current thread inside the block wait for
+        rate limits and repeat after 429 (used by mailings).
+        """
+        previous = self.throttled
+        self._local.throttled = True
+        try:
+            yield
+        finally:
+            self._local.throttled = previous
+
+    @property
+    def throttled(self) -> bool:
+        return getattr(self._local, "throttled", False)
+
+    def wait(self, token: str, chat_id: Union[int, str, None]) -> None:
+        """
+        Blocks until request of bot to chat is allowed.
+        """
+        seconds = self.reserve(token, chat_id)
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def block(self, token: str, seconds: float) -> None:
+        """
+        Forbids requests of bot for `seconds` (retry_after of 429 response).
+        """
+        self._call("block", self._bot_key(token), seconds)
+
+
+rate_limiter = TelegramRateLimiter(settings.TELEGRAM_RATE_LIMIT_REDIS_URL)
@@ -0,0 +1,185 @@
+import threading
+from unittest import mock
+
+import redis
+from django.test import SimpleTestCase, override_settings
+from telebot import apihelper
+from telebot.apihelper import ApiException
+
+from telegram_api import client
+from telegram_api.api import checking_send_message
+from telegram_api.rate_limit import (
+    MemoryBuckets,
+    RedisBuckets,
+    TelegramRateLimiter,
+)
+
+
+class MemoryBucketsTestCase(SimpleTestCase):
+    def setUp(self):
+        self.now = 1000.0
+        # time module of other threads isn't patched
+        patcher = mock.patch("telegram_api.rate_limit.time")
+        patcher.start().time.side_effect = lambda: self.now
+        self.addCleanup(patcher.stop)
+        self.buckets = MemoryBuckets()
+
+    def test_burst_and_interval(self):
+        waits = [self.buckets.reserve("chat", 1, 3) for _ in range(5)]
+        self.assertEqual(waits, [0, 0, 0, 1, 2])
+
+    def test_bucket_is_refilled(self):
+        for _ in range(4):
+            self.buckets.reserve("chat", 2, 1)
+        self.now += 2
+        self.assertEqual(self.buckets.reserve("chat", 2, 1), 0)
+
+    def test_block(self):
+        self.buckets.block("bot", 5)
+        self.assertEqual(self.buckets.reserve("bot", 30, 1), 5)
+
+    def test_expired_buckets_are_removed(self):
+        self.buckets.reserve("chat 1", 1, 1)
+        self.buckets.reserve("chat 2", 1, 1)
+        self.now += MemoryBuckets.prune_interval + 1
+        self.buckets.reserve("chat 3", 1, 1)
+        self.assertEqual(list(self.buckets._tats), ["chat 3"])
+
+
+class RedisBucketsTestCase(SimpleTestCase):
+    @mock.patch("telegram_api.rate_limit.time")
+    @mock.patch("telegram_api.rate_limit.redis.Redis.from_url")
+    def test_scripts(self, from_url, time):
+        time.time.return_value = 1000.0
+        reserve, block = mock.Mock(return_value=b"0.5"), mock.Mock()
+        from_url.return_value.register_script.side_effect = [reserve, block]
+        buckets = RedisBuckets("redis://localhost/0")
+
+        self.assertEqual(buckets.reserve("chat", 2, 3), 0.5)
+        reserve.assert_called_once_with(keys=["chat"],
+                                        args=[1000.0, 0.5, 3])
+        buckets.block("bot", 5)
+        block.assert_called_once_with(keys=["bot"], args=[1000.0, 1005.0])
+
+
+@override_settings(TELEGRAM_BOT_RATE=30, TELEGRAM_CHAT_RATE=1,
+                   TELEGRAM_CHAT_BURST=3)
+class TelegramRateLimiterTestCase(SimpleTestCase):
+    def setUp(self):
+        self.limiter = TelegramRateLimiter()
+        self.limiter.redis = mock.Mock()
+        self.limiter.redis.reserve.return_value = 0.5
+
+    def test_redis_buckets(self):
+        self.assertEqual(self.limiter.reserve("token", 1), 0.5)
+        bot_key = self.limiter._bot_key("token")
+        self.limiter.redis.reserve.assert_has_calls([
+            mock.call(bot_key, 30, 1),
+            mock.call(f"{bot_key}:1", 1, 3),
+        ])
+
+    @mock.patch("telegram_api.rate_limit.time")
+    def test_memory_fallback(self, time):
+        time.time.return_value = 1000.0
+        monotonic = time.monotonic
+        self.limiter.redis.reserve.side_effect = redis.ConnectionError()
+        monotonic.return_value = 100.0
+        self.assertEqual(self.limiter.reserve("token", None), 0)
+        self.assertEqual(self.limiter.redis.reserve.call_count, 1)
+
+        monotonic.return_value = 129.0
+        self.limiter.reserve("token", None)
+        self.assertEqual(self.limiter.redis.reserve.call_count, 1)
+
+        monotonic.return_value = 131.0
+        self.limiter.redis.reserve.side_effect = None
+        self.assertEqual(self.limiter.reserve("token", None), 0.5)
+        self.assertEqual(self.limiter.redis.reserve.call_count, 2)
+
+    @mock.patch("telegram_api.rate_limit.time")
+    def test_wait(self, time):
+        time.monotonic.return_value = 100.0
+        self.limiter.wait("token", 1)
+        time.sleep.assert_called_once_with(0.5)
+
+    def test_throttling(self):
+        self.assertFalse(self.limiter.throttled)
+        with self.limiter.throttling():
+            self.assertTrue(self.limiter.throttled)
+        self.assertFalse(self.limiter.throttled)
+
+
+@override_settings(TELEGRAM_MAX_RETRIES=3)
+class CheckingSendMessageTestCase(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch("telegram_api.api.rate_limiter")
+        self.rate_limiter = patcher.start()
+        self.addCleanup(patcher.stop)
+        result = mock.Mock(status_code=429)
+        result.json.return_value = {"description": "Too Many Requests",
+                                    "parameters": {"retry_after": 5}}
+        self.error = ApiException("Too Many Requests", "sendMessage", result)
+
+    def get_send(self, *side_effect):
+        function = mock.Mock(side_effect=side_effect, __name__="send")
+        return function, checking_send_message(function)
+
+    def test_mailing_retries_after_429(self):
+        self.rate_limiter.throttled = True
+        function, send = self.get_send(self.error, "message")
+        self.assertEqual(send(token="token", chat_id=1), "message")
+        self.assertEqual(function.call_count, 2)
+        self.assertEqual(self.rate_limiter.wait.call_count, 2)
+        self.rate_limiter.block.assert_called_once_with("token", 5)
+
+    def test_mailing_gives_up_after_retries(self):
+        self.rate_limiter.throttled = True
+        function, send = self.get_send(*[self.error] * 4)
+        self.assertIsNone(send(token="token", chat_id=1))
+        self.assertEqual(function.call_count, 4)
+
+    def test_webhook_reply_does_not_wait(self):
+        self.rate_limiter.throttled = False
+        function, send = self.get_send(self.error)
+        self.assertIsNone(send(token="token", chat_id=1))
+        function.assert_called_once()
+        self.rate_limiter.wait.assert_not_called()
+        self.rate_limiter.reserve.assert_called_once_with("token", 1)
+        self.rate_limiter.block.assert_called_once_with("token", 5)
+
+
+class ClientSessionTestCase(SimpleTestCase):
+    def setUp(self):
+        for name in ("_session", "_session_pid"):
+            patcher = mock.patch.object(client, name, None)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(apihelper._get_req_session, reset=True)
+        self.addCleanup(setattr, apihelper, "session", apihelper.session)
+
+    def test_session_is_reused(self):
+        session = client.get_session()
+        self.assertIs(client.get_session(), session)
+        self.assertIs(client.get_bot("token"), client.get_bot("token"))
+        # pyTelegramBotAPI uses the session in every thread
+        self.assertIs(apihelper._get_req_session(), session)
+        sessions = []
+        thread = threading.Thread(
+            target=lambda: sessions.append(apihelper._get_req_session())
+        )
+        thread.start()
+        thread.join()
+        self.assertEqual(sessions, [session])
+
+    @mock.patch("telegram_api.client.os.getpid")
+    def test_session_is_created_after_fork(self, getpid):
+        getpid.return_value = 1
+        session = client.get_session()
+        bot = client.get_bot("token")
+
+        getpid.return_value = 2
+        new_session = client.get_session()
+        self.assertIsNot(new_session, session)
+        self.assertIsNot(client.get_bot("token"), bot)
+        self.assertIs(apihelper._get_req_session(), new_session)
+        self.assertIs(client.get_session(), new_session)
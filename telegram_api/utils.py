@@ -1,24 +1,18 @@
-from os.path import basename
-from urllib.parse import urlsplit
-from urllib.request import urlretrieve, urlcleanup
-
-from django.db.models import QuerySet
-from telebot import TeleBot
-from django.core.files import File
+from typing import Union
 
 from keyboards.models import Action
 from telebot.types import (
-    KeyboardButton, ReplyKeyboardMarkup,
     InlineKeyboardButton, InlineKeyboardMarkup
 )
-from bots_management.models import Channel
+from bots_management.services import ChannelContext
 from keyboards.services import (
-    get_button_and_joined_action, get_action_by_name
+    get_action_id_by_text, get_action_by_pk
 )
 from subscribers.models import Message
 from subscribers.services import (
-    get_subscriber_telegram
+    get_subscriber_telegram, set_pending_media, persist_message
 )
+from subscribers.tasks import download_media_later
 from telegram_api.api import (
     send_media, send_message,
     send_location, send_sticker
@@ -30,23 +24,14 @@ default_message = "Обреріть, будь ласка, що Вас цікав
                   "повідомлення з '/help')"
 
 
-def create_markup(action: Action) -> ReplyKeyboardMarkup:
+def create_markup(action: Action) -> str:
     """
     Creates markup for the telegram keyboard.
 
     Returns:
-        ReplyKeyboardMarkup that represents markup.
+        json of ReplyKeyboardMarkup that represents markup.
     """
-    markup = ReplyKeyboardMarkup()
-    btn_array = action.keyboard_to_represent.get_telegram_buttons()
-    for row in btn_array:
-        inline_btns = [
-            KeyboardButton(
-                text=btn.text,
-            ) for btn in row
-        ]
-        markup.row(*inline_btns)
-    return markup
+    return action.keyboard_to_represent.get_telegram_markup()
 
 
 def create_inline_markup(action: Action) -> InlineKeyboardButton:
@@ -67,7 +52,15 @@ def create_inline_markup(action: Action) -> InlineKeyboardButton:
     return markup
 
 
-def save_message(channel: Channel, in_data: dict,
+def get_source_key(media: dict) -> str:
+    """
+    file_unique_id is same for the same file in all bots
+    """
+    unique_id = media.get('file_unique_id')
+    return f"telegram:{unique_id}" if unique_id else ""
+
+
+def save_message(channel: ChannelContext, in_data: dict,
                  is_help_message: bool = False) -> None:
     """
     Save massage info from telegram subscribers in db
@@ -91,23 +84,19 @@ def save_message(channel: Channel, in_data: dict,
 
         if 'photo' in message.keys():
             # get only original size, it always last
-            file_id = message['photo'][-1].get('file_id')
-            message_instance.url = tg_get_path_file(
-                channel.telegram_token, file_id
-            )
-            download_to_file_field(url=message_instance.url,
-                                   field=message_instance.image)
+            photo = message['photo'][-1]
+            set_pending_media(message_instance, 'image',
+                              file_id=photo.get('file_id'),
+                              source_key=get_source_key(photo))
             # save caption of the image
             message_instance.text = {message.get('caption')}
 
         for type_file in ['document', 'audio', 'video', 'voice', 'sticker']:
             if type_file in message.keys():
-                file_id = message[type_file].get('file_id')
-                message_instance.url = tg_get_path_file(
-                    channel.telegram_token, file_id
-                )
-                download_to_file_field(url=message_instance.url,
-                                       field=message_instance.file)
+                media = message[type_file]
+                set_pending_media(message_instance, 'file',
+                                  file_id=media.get('file_id'),
+                                  source_key=get_source_key(media))
                 # save caption of the file
                 message_instance.text = {message.get('caption')}
 
@@ -118,38 +107,35 @@ def save_message(channel: Channel, in_data: dict,
     if is_help_message:
         message_instance.is_help_message = True
 
-    message_instance.save()
-
-
-def tg_get_path_file(token: str, file_id: str) -> str:
-    """
-    return url-path for download file from telegram
-    """
-    tg_bot = TeleBot(token)
-    file_info = tg_bot.get_file(file_id)
-    return f"https://api.telegram.org/file/bot{token}/{file_info.file_path}"
+    persist_message(message_instance)
+    # media is downloaded in background
+    download_media_later(message_instance)
 
 
-def download_to_file_field(url, field) -> None:
+def get_media_path(action: Action) -> Union[str, None]:
     """
-    download file on server
+    Returns path of the file of the action, that is uploaded to telegram
     """
-    try:
-        name, _ = urlretrieve(url)
-        field.save(basename(urlsplit(url).path), File(open(name, 'rb')))
-    finally:
-        urlcleanup()
+    media = {
+        "picture": action.picture,
+        "video": action.video,
+        "file": action.file,
+    }.get(action.action_type)
+    return media.path if media else None
 
 
-def send_message_with_media(data: dict, action: Action) -> Message:
+def send_message_with_media(data: dict, action: Action,
+                            file_id: str = None) -> Message:
     """
         Sending message by type media
+        file_id: id of the file of the action in telegram, if it's known
     """
     action_type: str = action.action_type
     if action_type == "picture" and action.picture:
         response = send_media(
             **data,
             file_path=action.picture.path,
+            file_id=file_id,
             media_type='photo',
         )
     elif action_type == "url" and action.url:
@@ -161,12 +147,14 @@ def send_message_with_media(data: dict, action: Action) -> Message:
         response = send_media(
             **data,
             file_path=action.video.path,
+            file_id=file_id,
             media_type='video',
         )
     elif action_type == "file" and action.file:
         response = send_media(
             **data,
             file_path=action.file.path,
+            file_id=file_id,
             media_type='document'
         )
     elif all([action_type == "location",
@@ -185,28 +173,22 @@ def send_message_with_media(data: dict, action: Action) -> Message:
     return response
 
 
-def get_action(in_data: dict, channel: Channel) -> Action:
+def get_action(in_data: dict, channel: ChannelContext) -> Action:
     """
     Find action in response to a message
     """
     user_text: str = in_data["message"].get("text")
     if user_text:
-        tag: QuerySet = get_button_and_joined_action(user_text,
-                                                     channel_slug=channel.slug)
-        actions = get_action_by_name(user_text, channel_slug=channel.slug)
-
-        if tag.exists():
-            action: Action = tag.first().action
-        elif actions.exists():
-            action = actions.first()
-        else:
+        action_id = get_action_id_by_text(user_text, channel_id=channel.id)
+        action = get_action_by_pk(action_id) if action_id else None
+        if not action:
             action: Action = set_default_message(channel)
     else:
         action: Action = set_default_message(channel)
     return action
 
 
-def set_default_message(channel: Channel) -> Action:
+def set_default_message(channel: ChannelContext) -> Action:
     """
     set default message for welcome message
     """
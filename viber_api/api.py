@@ -1,6 +1,7 @@
 import logging
-import json
-import requests
+from typing import Union
+
+from .client import viber_client
 
 logger = logging.getLogger(__name__)
 
@@ -9,44 +10,26 @@ def get_bot_info(token: str) -> dict:
     """
         Get information about token viber bot
     """
-    response = requests.get(
-        "https://chatapi.viber.com/pa/get_account_info",
-        headers={
-            "X-Viber-Auth-Token": token,
-            "Content-Type": "application/json"
-        },
-    )
-    return response.json()
+    return viber_client.request("get_account_info", token)
 
 
-def send_message(data: dict, token: str, broadcast: bool = False) -> None:
+def send_message(data: Union[dict, str], token: str,
+                 broadcast: bool = False) -> dict:
     """
-    Send message to Viber's subscribers
+    Send message to Viber's subscribers,
+    data can be already serialized to json
     """
-    url = "https://chatapi.viber.com/pa/send_message"
-    if broadcast:
-        url = "https://chatapi.viber.com/pa/broadcast_message"
-    # logger.error(data)
-    r = requests.post(
-        url,
-        json.dumps(data),
-        headers={
-            "X-Viber-Auth-Token": token,
-            "Content-Type": "application/json",
-        },
-    )
-    if r.json().get('status'):
-        logger.warning(r.text)
+    method = "broadcast_message" if broadcast else "send_message"
+    response = viber_client.request(method, token, data)
+    if response.get('status'):
+        logger.warning(response)
+    return response
 
 
 def set_webhook_ajax(slug: str, host: str, token: str) -> dict:
     """
     Set viber webhook for certain channel with ajax.
     """
-    headers = {
-        "X-Viber-Auth-Token": token,
-        "Content-Type": "application/json"
-    }
     webhook_url = f"https://{host}/viber_prod/{slug}/"
     data = dict(url=webhook_url, event_types=[
         "subscribed",
@@ -57,28 +40,22 @@ def set_webhook_ajax(slug: str, host: str, token: str) -> dict:
         "message",
         "seen",
     ])
-    url = "https://chatapi.viber.com/pa/set_webhook"
-    response = requests.post(url, json.dumps(data), headers=headers)
+    response = viber_client.request("set_webhook", token, data)
     logger.warning(
         f"""Set viber-webhook with ajax {webhook_url}.
-        token {token}. Answer: {response.text}"""
+        token {token}. Answer: {response}"""
     )
-    return response.json()
+    return response
 
 
 def remove_webhook_ajax(token: str) -> dict:
     """
         Unset viber webhook for certain channel with ajax.
     """
-    headers = {
-        "X-Viber-Auth-Token": token,
-        "Content-Type": "application/json"
-    }
-    url = "https://chatapi.viber.com/pa/set_webhook"
     data = dict(url="")
-    response = requests.post(url, json.dumps(data), headers=headers)
+    response = viber_client.request("set_webhook", token, data)
     logger.warning(
         f"""Unset viber-webhook token {token}.
-        Answer: {response.text}"""
+        Answer: {response}"""
     )
-    return response.json()
+    return response
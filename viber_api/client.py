@@ -0,0 +1,127 @@
+"""
+HTTP client of viber REST API.
+
+One client with a pool of keep-alive connections is used by the process.
+Requests are repeated with backoff after connect timeout (the request
+wasn't sent), GET requests also after 5xx answers.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from typing import Union
+
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+VIBER_API_URL = "https://chatapi.viber.com/pa/"
+
+
+class ViberClient:
+    """
+    Client of viber API with persistent session and latency counters.
+    """
+
+    def __init__(self, base_url: str = VIBER_API_URL):
+        self.base_url = base_url
+        self._session = None
+        self._session_pid = None
+        self._lock = threading.Lock()
+        self._stats: dict = {}
+
+    @property
+    def session(self) -> requests.Session:
+        # connections can't be shared with forked processes
+        if self._session_pid != os.getpid():
+            with self._lock:
+                if self._session_pid != os.getpid():
+                    session = requests.Session()
+                    adapter = HTTPAdapter(
+                        pool_connections=1,
+                        pool_maxsize=settings.VIBER_POOL_MAXSIZE,
+                    )
+                    session.mount("https://", adapter)
+                    self._session = session
+                    self._session_pid = os.getpid()
+        return self._session
+
+    def request(self, method: str, token: str,
+                data: Union[dict, str, bytes, None] = None) -> dict:
+        """
+        Sends request to `method` of viber API, returns json of the answer.
+        data: dict or already serialized json, if it's None,
+        GET request is sent.
+        POST requests are repeated only after connect timeout:
+        after other errors viber could get the message.
+        """
+        if isinstance(data, dict):
+            data = json.dumps(data)
+        headers = {
+            "X-Viber-Auth-Token": token,
+            "Content-Type": "application/json",
+        }
+        http_method = "GET" if data is None else "POST"
+        for attempt in range(settings.VIBER_MAX_RETRIES + 1):
+            started = time.monotonic()
+            try:
+                response = self.session.request(
+                    http_method, self.base_url + method,
+                    data=data, headers=headers,
+                    timeout=(settings.VIBER_CONNECT_TIMEOUT,
+                             settings.VIBER_READ_TIMEOUT),
+                )
+            except requests.ConnectionError as e:
+                error = e
+            else:
+                error = None if response.status_code < 500 else response
+            self._count(method, time.monotonic() - started,
+                        error=error is not None, retry=attempt > 0)
+            if error is None:
+                return response.json()
+            can_retry = isinstance(error, requests.ConnectTimeout) or (
+                not isinstance(error, Exception) and http_method == "GET"
+            )
+            if not can_retry or attempt == settings.VIBER_MAX_RETRIES:
+                break
+            logger.warning(f"Viber {method} failed, retry. Error: {error}")
+            time.sleep(settings.VIBER_RETRY_BACKOFF * 2 ** attempt)
+        if isinstance(error, Exception):
+            raise error
+        error.raise_for_status()
+
+    def _count(self, method: str, seconds: float,
+               error: bool, retry: bool) -> None:
+        with self._lock:
+            stats = self._stats.setdefault(method, {
+                "calls": 0, "errors": 0, "retries": 0,
+                "total_ms": 0.0, "max_ms": 0.0,
+            })
+            ms = seconds * 1000
+            stats["calls"] += 1
+            stats["errors"] += error
+            stats["retries"] += retry
+            stats["total_ms"] += ms
+            stats["max_ms"] = max(stats["max_ms"], ms)
+
+    def get_stats(self) -> dict:
+        """
+        Returns counters of requests by methods of API, e.g.
+        {"send_message": {"calls": 2, "errors": 0, "retries": 0,
+        "total_ms": 250.0, "max_ms": 150.0, "avg_ms": 125.0}}
+        """
+        with self._lock:
+            return {
+                method: dict(stats, avg_ms=stats["total_ms"] / stats["calls"])
+                for method, stats in self._stats.items()
+            }
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self._stats.clear()
+
+
+viber_client = ViberClient()
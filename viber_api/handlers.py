@@ -3,9 +3,8 @@ from typing import Union
 
 from django.conf import settings
 
-from bots_management.models import Channel
 from bots_management.services import (
-    get_channel_by_slug,
+    ChannelContext, get_channel_context
 )
 from keyboards.models import Action, Keyboard
 from keyboards.services import (
@@ -14,7 +13,7 @@ from keyboards.services import (
 )
 from subscribers.models import Subscriber
 from subscribers.services import (
-    get_subscriber_viber
+    get_subscriber_viber, invalidate_subscribers
 )
 from .api import send_message
 from .utils import (
@@ -32,7 +31,8 @@ def event_handler(incoming_data: dict, channel_slug: str) -> None:
     event: str = incoming_data.get("event")
     if not event:
         return
-    channel = get_channel_by_slug(slug=channel_slug)
+    # channel with bots is resolved once per slug and cached
+    channel = get_channel_context(slug=channel_slug)
 
     if event == "message":
         message = incoming_data.get("message")
@@ -66,6 +66,25 @@ def event_handler(incoming_data: dict, channel_slug: str) -> None:
         pass
 
 
+def get_action_messages(action: Action) -> list:
+    """
+    Returns messages of the action without receivers,
+    media is sent before text
+    """
+    keyboard: dict = action.keyboard_to_represent.get_keyboard_params()
+    messages: list = []
+    if action.action_type not in ("text", "none"):
+        data = {'min_api_version': 1, 'keyboard': keyboard}
+        messages.append(get_data_for_message(action, data))
+    if action.text:
+        messages.append(create_text_message(
+            uid=None,
+            text=action.text,
+            keyboard=keyboard
+        ))
+    return messages
+
+
 def action_handler(uid: Union[str, list],
                    token: str, action: Action = None,
                    broadcast: bool = False) -> None:
@@ -73,38 +92,23 @@ def action_handler(uid: Union[str, list],
     Prepare data for message and send answer message
     separate sending media and text (if it in one action)
     """
-    data = dict()
-    if isinstance(uid, str):
-        data['receiver'] = uid
-    else:
-        data['broadcast_list'] = uid
-
     if action:
-        keyboard: Keyboard = action.keyboard_to_represent
-        data['min_api_version'] = 1
-        data['keyboard'] = keyboard.get_keyboard_params()
-        action_type: str = action.action_type
-        if action_type != "text":
-            data = get_data_for_message(action, data)
-            if action_type != "none":
-                send_message(data, token, broadcast)
-        if action.text:
-            text_message: dict = create_text_message(
-                uid=uid,
-                text=action.text,
-                keyboard=keyboard.get_keyboard_params()
-            )
-            send_message(text_message, token, broadcast)
+        messages: list = get_action_messages(action)
     else:
-        text_message: dict = create_text_message(
-            uid=uid,
+        messages: list = [create_text_message(
+            uid=None,
             text="No welcome action",
             keyboard=None
-        )
-        send_message(text_message, token, broadcast)
+        )]
+    for message in messages:
+        if isinstance(uid, str):
+            message['receiver'] = uid
+        else:
+            message['broadcast_list'] = uid
+        send_message(message, token, broadcast)
 
 
-def help_message_handler(in_data: dict, channel: Channel) -> None:
+def help_message_handler(in_data: dict, channel: ChannelContext) -> None:
     """
     Sends message to user, that his help message was sent and
     moderator will contact him
@@ -128,7 +132,7 @@ def help_message_handler(in_data: dict, channel: Channel) -> None:
     send_message(text_message, channel.viber_token)
 
 
-def sys_action_handler(in_data: dict, channel: Channel) -> None:
+def sys_action_handler(in_data: dict, channel: ChannelContext) -> None:
     """
     handler for command starts with '/'
     """
@@ -148,7 +152,7 @@ def sys_action_handler(in_data: dict, channel: Channel) -> None:
         send_message(text_message, channel.viber_token)
 
 
-def subscribed_handler(in_data: dict, channel: Channel) -> None:
+def subscribed_handler(in_data: dict, channel: ChannelContext) -> None:
     """
     Handler for saving new/returned subscribers
     """
@@ -171,7 +175,7 @@ def subscribed_handler(in_data: dict, channel: Channel) -> None:
         send_message(text_message, channel.viber_token)
 
 
-def unsubscribed_handler(in_data: dict, channel: Channel) -> None:
+def unsubscribed_handler(in_data: dict, channel: ChannelContext) -> None:
     """
     When event unsubscribed, set is_active for user in False
     """
@@ -180,6 +184,9 @@ def unsubscribed_handler(in_data: dict, channel: Channel) -> None:
         messengers_bot=channel.viber_bot,
     )
     subscriber.update(is_active=False)
+    if channel.viber_bot:
+        invalidate_subscribers(channel.viber_bot.pk,
+                               [in_data.get('user_id')])
     logger.warning(
         f"""User {subscriber} unsubscribed (is_active=False)"""
     )
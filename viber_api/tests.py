@@ -0,0 +1,120 @@
+import os
+import time
+from unittest import mock
+
+import requests
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from bots_management.models import Bot, Channel
+from subscribers.models import Subscriber
+from viber_api.client import ViberClient
+from viber_api.utils import save_message
+
+
+@override_settings(VIBER_MAX_RETRIES=2, VIBER_RETRY_BACKOFF=0.5)
+class ViberClientTestCase(SimpleTestCase):
+    def setUp(self):
+        self.client = ViberClient()
+        self.client._session = mock.Mock()
+        self.client._session_pid = os.getpid()
+        # time module of other threads isn't patched
+        patcher = mock.patch("viber_api.client.time",
+                             monotonic=mock.Mock(wraps=time.monotonic))
+        self.time = patcher.start()
+        self.sleep = self.time.sleep
+        self.addCleanup(patcher.stop)
+
+    @staticmethod
+    def get_response(status_code: int, data: dict = None) -> mock.Mock:
+        response = mock.Mock(status_code=status_code)
+        response.json.return_value = data or {}
+        if status_code >= 500:
+            response.raise_for_status.side_effect = requests.HTTPError()
+        return response
+
+    def test_get_is_repeated_after_5xx(self):
+        self.client._session.request.side_effect = [
+            self.get_response(502), self.get_response(503),
+            self.get_response(200, {"status": 0}),
+        ]
+        self.assertEqual(self.client.request("get_account_info", "token"),
+                         {"status": 0})
+        self.assertEqual(self.sleep.call_args_list,
+                         [mock.call(0.5), mock.call(1.0)])
+        stats = self.client.get_stats()["get_account_info"]
+        self.assertEqual((stats["calls"], stats["errors"], stats["retries"]),
+                         (3, 2, 2))
+
+    def test_post_is_not_repeated_after_5xx(self):
+        self.client._session.request.return_value = self.get_response(500)
+        with self.assertRaises(requests.HTTPError):
+            self.client.request("send_message", "token", {"text": "hi"})
+        self.client._session.request.assert_called_once()
+        self.sleep.assert_not_called()
+
+    def test_post_is_repeated_after_connect_timeout(self):
+        self.client._session.request.side_effect = [
+            requests.ConnectTimeout(), self.get_response(200, {"status": 0}),
+        ]
+        self.assertEqual(
+            self.client.request("send_message", "token", '{"text": "hi"}'),
+            {"status": 0}
+        )
+        self.assertEqual(self.client._session.request.call_count, 2)
+        self.sleep.assert_called_once_with(0.5)
+
+    def test_other_errors_are_not_repeated(self):
+        self.client._session.request.side_effect = requests.ConnectionError()
+        with self.assertRaises(requests.ConnectionError):
+            self.client.request("broadcast_message", "token", {"text": "hi"})
+        self.client._session.request.assert_called_once()
+        stats = self.client.get_stats()["broadcast_message"]
+        self.assertEqual(stats["errors"], 1)
+
+    def test_retries_are_limited(self):
+        self.client._session.request.side_effect = requests.ConnectTimeout()
+        with self.assertRaises(requests.ConnectTimeout):
+            self.client.request("send_message", "token", {"text": "hi"})
+        self.assertEqual(self.client._session.request.call_count, 3)
+
+    def test_stats(self):
+        self.time.monotonic.side_effect = [0.0, 0.1, 1.0, 1.3]
+        self.client._session.request.return_value = self.get_response(200)
+        self.client.request("send_message", "token", {"text": "hi"})
+        self.client.request("send_message", "token", {"text": "hi"})
+        stats = self.client.get_stats()["send_message"]
+        self.assertEqual(stats["calls"], 2)
+        self.assertAlmostEqual(stats["avg_ms"], 200.0)
+        self.assertAlmostEqual(stats["max_ms"], 300.0)
+        self.client.reset_stats()
+        self.assertEqual(self.client.get_stats(), {})
+
+
+@mock.patch("viber_api.utils.download_media_later")
+@mock.patch("viber_api.utils.persist_message")
+class SaveMessageTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        c = Channel.objects.create(name="first", slug="first_slug")
+        bot = Bot.objects.create(messenger="viber", channel=c, token="1v")
+        cls.subscriber = Subscriber.objects.create(user_id="1",
+                                                   messengers_bot=bot)
+
+    def save_sticker(self, message: dict):
+        channel = mock.Mock(is_media_allowed=True, is_geo_allowed=False)
+        message = dict(message, type="sticker",
+                       media="https://viber.com/sticker.png")
+        with mock.patch("viber_api.utils.get_subscriber_viber",
+                        return_value=(self.subscriber, False)):
+            save_message(channel, {"message_token": 1, "sender": {},
+                                   "message": message})
+
+    def test_sticker_source_key(self, persist_message, _):
+        self.save_sticker({"sticker_id": 40133})
+        self.assertEqual(persist_message.call_args[0][0].media_source_key,
+                         "viber:sticker:40133")
+
+    def test_sticker_without_id(self, persist_message, _):
+        self.save_sticker({})
+        self.assertEqual(persist_message.call_args[0][0].media_source_key,
+                         "")
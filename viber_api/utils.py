@@ -1,20 +1,18 @@
-from os.path import basename
 from typing import Union
-from urllib.parse import urlsplit
-from urllib.request import urlretrieve, urlcleanup
 
-from django.db.models import QuerySet
-from django.core.files import File
 from django.conf import settings
 
-from bots_management.models import Channel
+from bots_management.services import ChannelContext
 from keyboards.models import Keyboard, Action
 from keyboards.services import (
-    get_button_and_joined_action,
-    get_action_by_name
+    get_action_id_by_text,
+    get_action_by_pk
 )
 from subscribers.models import Message
-from subscribers.services import get_subscriber_viber
+from subscribers.services import (
+    get_subscriber_viber, set_pending_media, persist_message
+)
+from subscribers.tasks import download_media_later
 
 # This message will send to the subscriber
 # if the bot receives unknown text or action
@@ -23,10 +21,10 @@ default_message = "Обреріть, будь ласка, що Вас цікав
                   "повідомлення з '/help')"
 
 
-def create_text_message(uid: Union[str, list],
+def create_text_message(uid: Union[str, list, None],
                         text: str, keyboard: Keyboard) -> dict:
     """
-    uid: id or list(id) of receiver(s)
+    uid: id or list(id) of receiver(s), None to add them later
     text: text is gonna be sent
     keyboard: keyboard that user will see
     also can send message without keyboards
@@ -38,7 +36,7 @@ def create_text_message(uid: Union[str, list],
     }
     if isinstance(uid, str):
         text_message['receiver'] = uid
-    else:
+    elif uid is not None:
         text_message['broadcast_list'] = uid
     try:
         keyboard = keyboard.get_keyboard_params()
@@ -49,7 +47,7 @@ def create_text_message(uid: Union[str, list],
     return text_message
 
 
-def save_message(channel: Channel,
+def save_message(channel: ChannelContext,
                  in_data: dict,
                  is_help_message: bool = False) -> None:
     """
@@ -79,13 +77,17 @@ def save_message(channel: Channel,
     except KeyError:
         pass
 
-    if channel.is_media_allowed:
-        if message["type"] in ["picture", "sticker"]:
-            download_to_file_field(url=message_instance.url,
-                                   field=message_instance.image)
+    if channel.is_media_allowed and message_instance.url:
+        if message["type"] == "sticker":
+            # stickers are same for all users, they are saved once
+            sticker_id = message.get("sticker_id")
+            source_key = f"viber:sticker:{sticker_id}" if sticker_id else ""
+            set_pending_media(message_instance, "image",
+                              source_key=source_key)
+        elif message["type"] == "picture":
+            set_pending_media(message_instance, "image")
         elif message["type"] in ["video", "file"]:
-            download_to_file_field(url=message_instance.url,
-                                   field=message_instance.file)
+            set_pending_media(message_instance, "file")
 
     if all([message["type"] == "location",
             channel.is_geo_allowed]):
@@ -94,43 +96,28 @@ def save_message(channel: Channel,
     if is_help_message:
         message_instance.is_help_message = True
 
-    message_instance.save()
-
-
-def download_to_file_field(url: str, field) -> None:
-    """
-    Download file from url
-    """
-    try:
-        name, _ = urlretrieve(url)
-        field.save(basename(urlsplit(url).path), File(open(name, 'rb')))
-    finally:
-        urlcleanup()
+    persist_message(message_instance)
+    # media is downloaded in background
+    download_media_later(message_instance)
 
 
-def get_action(in_data: dict, channel: Channel) -> Action:
+def get_action(in_data: dict, channel: ChannelContext) -> Action:
     """
     Find action in response to a message
     """
     if in_data["message"]["type"] == "text":
         user_text: str = in_data["message"]["text"]
 
-        tag: QuerySet = get_button_and_joined_action(user_text,
-                                                     channel_slug=channel.slug)
-        actions = get_action_by_name(user_text, channel_slug=channel.slug)
-
-        if tag.exists():
-            action: Action = tag.first().action
-        elif actions.exists():
-            action = actions.first()
-        else:
+        action_id = get_action_id_by_text(user_text, channel_id=channel.id)
+        action = get_action_by_pk(action_id) if action_id else None
+        if not action:
             action: Action = set_default_message(channel)
     else:
         action: Action = set_default_message(channel)
     return action
 
 
-def set_default_message(channel: Channel) -> Action:
+def set_default_message(channel: ChannelContext) -> Action:
     """
     set default message for welcome message
     """
@@ -155,7 +142,11 @@ def get_data_for_message(action: Action, data: dict) -> dict:
         data["media"] = action.url
     elif action_type == "video" and action.video:
         data["media"] = url + action.video.url
-        data["size"] = action.video.size
+        # metadata is read when action is saved
+        meta = action.video_meta or {}
+        data["size"] = meta.get("size") or action.video.size
+        if meta.get("duration"):
+            data["duration"] = int(meta["duration"])
     elif action_type == "file" and action.file:
         data["media"] = url + action.file.url
         data["file_name"] = str(action.file)